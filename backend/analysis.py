@@ -0,0 +1,160 @@
+# Built-in deterministic analysis: descriptive stats, correlation, regression,
+# hypothesis tests and DOE suggestions. Pure functions over a DataFrame.
+
+import pandas as pd
+
+# Stats & ML optional libs
+try:
+    import scipy.stats as stats
+except Exception:
+    stats = None
+
+try:
+    import statsmodels.api as sm
+    STATSMODELS_AVAILABLE = True
+except Exception:
+    STATSMODELS_AVAILABLE = False
+
+try:
+    from sklearn.linear_model import LinearRegression
+    SKLEARN_AVAILABLE = True
+except Exception:
+    SKLEARN_AVAILABLE = False
+
+
+def perform_descriptive_stats(df):
+    out = {}
+    try:
+        out['describe'] = df.describe(include='all').to_dict()
+        numeric = df.select_dtypes(include='number')
+        out['ncols'] = numeric.shape[1]
+    except Exception as e:
+        out['error'] = str(e)
+    return out
+
+def pearson_corr_with_pvalues(df):
+    """Return DataFrame of correlations and p-values for numeric columns"""
+    num = df.select_dtypes(include='number')
+    cols = num.columns.tolist()
+    n = len(cols)
+    corr = pd.DataFrame(index=cols, columns=cols, dtype=float)
+    pvals = pd.DataFrame(index=cols, columns=cols, dtype=float)
+    for i in range(n):
+        for j in range(n):
+            # align indices by index intersection
+            xy = pd.concat([num.iloc[:, i], num.iloc[:, j]], axis=1).dropna()
+            if xy.shape[0] < 3 or (xy.iloc[:,0].std()==0 and xy.iloc[:,1].std()==0):
+                corr.iloc[i,j] = float('nan')
+                pvals.iloc[i,j] = float('nan')
+                continue
+            try:
+                r, p = stats.pearsonr(xy.iloc[:,0], xy.iloc[:,1]) if stats else (None,None)
+                corr.iloc[i,j] = r
+                pvals.iloc[i,j] = p
+            except Exception:
+                corr.iloc[i,j] = float('nan')
+                pvals.iloc[i,j] = float('nan')
+    return corr, pvals
+
+def auto_select_dependent(df):
+    """Pick dependent var heuristically: highest variance or last numeric column"""
+    num = df.select_dtypes(include='number')
+    if num.shape[1] == 0:
+        return None
+    try:
+        variances = num.var().sort_values(ascending=False)
+        return variances.index[0]
+    except Exception:
+        return num.columns[-1]
+
+def run_regression(df, dep=None):
+    """Run linear regression and return summary dict"""
+    num = df.select_dtypes(include='number').dropna()
+    if dep is None:
+        dep = auto_select_dependent(df)
+    if dep not in num.columns:
+        return {"error":"No numeric dependent variable found."}
+    X = num.drop(columns=[dep])
+    y = num[dep]
+    if X.shape[1] == 0:
+        return {"error":"No independent numeric columns found for regression."}
+    try:
+        if STATSMODELS_AVAILABLE:
+            # statsmodels requires adding constant
+            X2 = sm.add_constant(X)
+            model_sm = sm.OLS(y, X2).fit()
+            return {"summary": model_sm.summary().as_text(), "params": model_sm.params.to_dict(), "rsquared": float(model_sm.rsquared)}
+        elif SKLEARN_AVAILABLE:
+            lr = LinearRegression()
+            lr.fit(X.fillna(0), y.fillna(0))
+            params = dict(zip(X.columns, lr.coef_.tolist()))
+            return {"params": params, "intercept": float(lr.intercept_), "rsquared": None}
+        else:
+            return {"error":"No regression libs available (install statsmodels or scikit-learn)."}
+    except Exception as e:
+        return {"error": str(e)}
+
+def _is_text_like(dtype):
+    """object, Arrow/pandas string or categorical columns (ingest may convert object -> category/string)"""
+    return dtype == object or isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(dtype)
+
+def run_hypothesis_tests(df):
+    """Run candidate tests: t-test between groups if a 'group' column exists; Levene for variance differences; ANOVA if >2 groups"""
+    out = {}
+    num = df.select_dtypes(include='number')
+    # Try to detect categorical grouping column
+    cats = [c for c in df.columns if _is_text_like(df[c].dtype) and df[c].nunique() < 10]
+    if not cats:
+        # try integer-coded groups
+        cats = [c for c in df.columns if pd.api.types.is_integer_dtype(df[c].dtype) and df[c].nunique() < 10]
+    if cats:
+        gcol = cats[0]
+        groups = df.groupby(gcol, observed=True)
+        if len(groups) >= 2:
+            # choose first numeric column for example
+            if num.shape[1] > 0:
+                col = num.columns[0]
+                samples = [grp[col].dropna().values for _, grp in groups]
+                try:
+                    if len(samples) == 2:
+                        tstat, p = stats.ttest_ind(samples[0], samples[1], equal_var=False)
+                        out['t_test'] = {"column":col, "tstat": float(tstat), "pvalue": float(p), "groups": list(groups.groups.keys())}
+                    elif len(samples) > 2:
+                        f, p = stats.f_oneway(*samples)
+                        out['anova'] = {"column":col, "fstat": float(f), "pvalue": float(p)}
+                    # Levene
+                    w, p_levene = stats.levene(*samples)
+                    out['levene'] = {"w": float(w), "pvalue": float(p_levene)}
+                except Exception as e:
+                    out['error'] = str(e)
+    else:
+        out['note'] = "No categorical grouping column detected to run t-test/ANOVA."
+    return out
+
+def suggest_next_experiments(df, target_col=None, top_k=3):
+    """Heuristic suggestions: select top correlated inputs and suggest +/- perturbations."""
+    suggestions = []
+    num = df.select_dtypes(include='number')
+    if num.shape[1] < 2:
+        return {"error": "Not enough numeric columns to make suggestions."}
+    if target_col is None:
+        target_col = auto_select_dependent(df)
+    if target_col not in num.columns:
+        return {"error": "Target column not found."}
+    # correlation
+    try:
+        corrs = num.corr()[target_col].abs().sort_values(ascending=False)
+        corrs = corrs.drop(index=[target_col])
+        tops = corrs.head(top_k).index.tolist()
+        for col in tops:
+            mean = num[col].mean()
+            std = num[col].std()
+            # suggest testing mean +/- 0.5*std
+            suggestions.append({
+                "variable": col,
+                "current_mean": float(mean),
+                "suggest_test_values": [float(max(mean - 0.5*std, mean*0.5)), float(mean + 0.5*std)]
+            })
+        return {"target": target_col, "suggestions": suggestions}
+    except Exception as e:
+        return {"error": str(e)}
@@ -0,0 +1,113 @@
+# Auto-deck: a whole report from one model call.
+#
+# The model is asked once for a JSON outline ({"slides": [{title, bullets, code}]}); the
+# chart snippets are then executed in parallel (execution is per-thread isolated and
+# memoized), and the caller adds every slide in one pass.
+
+import os, json, re
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import span, in_current_context
+from execution import run_snippet_cached, mutates_df
+from sql_engine import snippet_fingerprint
+
+AUTODECK_MAX_WORKERS = int(os.getenv("AUTODECK_MAX_WORKERS", "4"))
+MAX_SLIDES = 30
+MAX_BULLETS = 6
+
+OUTLINE_INSTRUCTIONS = """
+You are an expert process engineer preparing a slide report on the dataset described below.
+Return ONLY JSON (no prose, no markdown fences) of the form:
+{{"slides": [{{"title": "...", "bullets": ["...", "..."], "code": "..."}}]}}
+Rules:
+- Exactly {n_slides} slides, in presentation order; the first is an overview, the last conclusions/next steps.
+- 2-{max_bullets} short, data-backed bullets per slide.
+- "code" is Python that draws ONE chart for the slide from the existing DataFrame `df`
+  (pd, np, plt, sns, px are imported; for plotly assign the figure to `fig`), or "" for no chart.
+- Never create synthetic data, never read files, never modify df.
+{focus}
+"""
+
+
+def outline_prompt(dataset_text, n_slides=8, focus=""):
+    focus = f"- Focus on: {focus.strip()}" if focus and focus.strip() else ""
+    return (OUTLINE_INSTRUCTIONS.format(n_slides=n_slides, max_bullets=MAX_BULLETS, focus=focus)
+            + "\nDataset:\n" + dataset_text)
+
+def _extract_json(text):
+    text = text.strip()
+    fenced = re.search(r"```(?:json)?\s*([\s\S]*?)\s*```", text)
+    if fenced:
+        text = fenced.group(1)
+    try:
+        return json.loads(text)
+    except ValueError:
+        # tolerate prose around the object
+        start, end = text.find("{"), text.rfind("}")
+        if start < 0 or end <= start:
+            raise
+        return json.loads(text[start:end + 1])
+
+def parse_outline(text):
+    """Validate the model's outline. Returns {"slides": [{title, bullets, code}]} or {"error": ...}."""
+    try:
+        data = _extract_json(text)
+    except ValueError as e:
+        return {"error": f"Model did not return valid JSON: {e}"}
+    items = data.get("slides") if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return {"error": "Outline has no slides."}
+    slides_out = []
+    for item in items[:MAX_SLIDES]:
+        if not isinstance(item, dict):
+            continue
+        bullets = item.get("bullets") or []
+        if isinstance(bullets, str):
+            bullets = [b.strip(" -•") for b in bullets.splitlines() if b.strip()]
+        elif not isinstance(bullets, (list, tuple)):
+            bullets = [bullets]     # a number or an object: one bullet rather than a TypeError
+        code = item.get("code") or ""
+        slides_out.append({
+            "title": str(item.get("title") or "Untitled").strip(),
+            "bullets": [str(b).strip() for b in bullets if str(b).strip()][:MAX_BULLETS],
+            "code": code.strip() if isinstance(code, str) else "",
+        })
+    if not slides_out:
+        return {"error": "Outline has no usable slides."}
+    return {"slides": slides_out}
+
+def _render_one(code, df, df_fingerprint, cache, msg_idx, extra_ns, sql_fingerprint):
+    # a snippet that writes to df must not race the others on the shared frame
+    frame = df.copy() if mutates_df(code) else df
+    fingerprint = snippet_fingerprint(code, df_fingerprint, sql_fingerprint)
+    return run_snippet_cached(code, frame, fingerprint, cache, msg_idx=msg_idx, extra_ns=extra_ns)
+
+def render_charts(outline, df, df_fingerprint=None, cache=None, max_workers=AUTODECK_MAX_WORKERS, extra_ns=None,
+                  sql_fingerprint=None):
+    """
+    Execute every slide's chart code concurrently. Returns one ExecResult (or None) per slide.
+    With sql() in extra_ns, sql_fingerprint (SQLEngine.fingerprint()) is part of the cache key
+    of snippets that call it.
+    """
+    jobs = [(i, s["code"]) for i, s in enumerate(outline) if s.get("code")]
+    results = [None] * len(outline)
+    if not jobs:
+        return results
+    with span("autodeck.render", charts=len(jobs), workers=min(max_workers, len(jobs))) as sp:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as pool:
+            futures = {i: pool.submit(in_current_context(_render_one), code, df, df_fingerprint, cache, f"deck{i}",
+                                      extra_ns, sql_fingerprint)
+                       for i, code in jobs}
+            for i, fut in futures.items():
+                results[i] = fut.result()
+        sp.set(plots=sum(1 for r in results if r is not None and r.plot_path),
+               failed=sum(1 for r in results if r is not None and r.error))
+    return results
+
+def slide_specs(outline, results):
+    """(title, text, image_path) per slide, ready for add_slide_with_text_and_optional_image."""
+    specs = []
+    for s, res in zip(outline, results):
+        text = "\n".join(f"• {b}" for b in s["bullets"])
+        specs.append((s["title"], text, res.plot_path if res is not None else None))
+    return specs
@@ -0,0 +1,296 @@
+# Benchmark suite for the analysis, ingestion, preview and export hot paths.
+#
+# Runs each helper over synthetic datasets of increasing rows x columns and decks of
+# increasing slide counts, records wall time and peak traced memory, and compares the
+# results against a stored baseline so scaling regressions show up before users hit them.
+#
+#   python backend/bench.py                      # default grid, compare with baseline if present
+#   python backend/bench.py --full               # adds 1M-row / wide datasets and larger decks
+#   python backend/bench.py --save-baseline      # record current numbers as the new baseline
+#   python backend/bench.py --only corr --fail-on-regression
+
+import argparse, gc, io, json, os, statistics, sys, tempfile, time, tracemalloc, uuid
+
+import numpy as np
+import pandas as pd
+from pptx import Presentation
+
+from ingest import read_table_auto, read_excel_sheets, optimize_dtypes
+from analysis import (perform_descriptive_stats, pearson_corr_with_pvalues, run_regression,
+                      run_hypothesis_tests, suggest_next_experiments)
+from report import generate_pdf_report
+from charts import reduce_line_frame, bin_scatter
+from spc import run_spc
+from history import HistoryStore
+from progressive import FIRST_SAMPLE_ROWS, sample_order, estimate_describe, estimate_corr
+from slides import add_slide_with_text_and_optional_image, generate_live_preview_images
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+ROWS = [1_000, 10_000, 100_000]
+COLS = [5, 20]
+SLIDES = [5, 15]
+FULL_ROWS = ROWS + [1_000_000]
+FULL_COLS = COLS + [50]
+FULL_SLIDES = SLIDES + [40]
+SPC_TARGET = (1_000_000, 50)   # rows x float32 columns run_spc is tuned for; --full only (~200 MB)
+
+
+# ---------------------- synthetic data ----------------------
+def make_dataset(n_rows, n_cols, seed=0):
+    """Numeric process-style columns plus a 3-level group column (drives t-test/ANOVA paths)."""
+    rng = np.random.default_rng(seed)
+    base = rng.normal(size=n_rows)
+    data = {}
+    for i in range(n_cols):
+        # correlated with a shared latent factor so correlation/regression have signal
+        data[f"x{i}"] = base * rng.uniform(0.2, 2.0) + rng.normal(scale=1.0 + i % 3, size=n_rows)
+    data["batch"] = rng.integers(0, 50, size=n_rows)
+    data["line"] = rng.choice(["A", "B", "C"], size=n_rows)
+    return pd.DataFrame(data)
+
+def make_workbook(n_rows, n_cols, n_sheets=3):
+    """xlsx bytes with n_sheets copies of a synthetic dataset, or None without an xlsx writer."""
+    buf = io.BytesIO()
+    try:
+        with pd.ExcelWriter(buf) as writer:
+            for s in range(n_sheets):
+                make_dataset(n_rows, n_cols, seed=s).to_excel(writer, sheet_name=f"S{s+1}", index=False)
+    except Exception:
+        return None
+    return buf.getvalue()
+
+def make_plot(path):
+    from PIL import Image, ImageDraw
+    img = Image.new("RGB", (900, 600), color=(255, 255, 255))
+    d = ImageDraw.Draw(img)
+    for i in range(0, 900, 30):
+        d.line((i, 600 - (i * 7) % 500, i + 30, 600 - ((i + 30) * 7) % 500), fill=(30, 90, 200), width=3)
+    img.save(path, "PNG")
+    return path
+
+def make_deck(n_slides, plot_path):
+    prs = Presentation()
+    for i in range(n_slides):
+        add_slide_with_text_and_optional_image(prs, f"Slide {i+1}", "Key finding.\n" * 5, image_path=plot_path)
+    return prs
+
+
+# ---------------------- measurement ----------------------
+def measure(fn, repeat=3):
+    """One traced run for peak memory (MB), then repeat untraced runs for median seconds."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return {"seconds": statistics.median(times), "peak_mb": round(peak / 1e6, 3)}
+
+def progressive_first_stage(df):
+    """Time to the first progressive estimate (describe + corr on the first sample)."""
+    sample = df.take(np.sort(sample_order(df)[:FIRST_SAMPLE_ROWS])) if len(df) > FIRST_SAMPLE_ROWS else df
+    return estimate_describe(sample, len(df)), estimate_corr(sample, len(df))
+
+class Fixtures:
+    """Shared case inputs, built on first use so --only pays only for the cases it runs."""
+
+    def __init__(self, tmpdir):
+        self.tmpdir = tmpdir
+        self._cache = {}
+
+    def get(self, key, build):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    def dataset(self, n_rows, n_cols):
+        return self.get(("dataset", n_rows, n_cols), lambda: make_dataset(n_rows, n_cols))
+
+    def plot(self):
+        return self.get("plot", lambda: make_plot(os.path.join(self.tmpdir, "bench_plot.png")))
+
+def _excel_cases(fx, n_rows, n_cols):
+    def workbook():
+        return fx.get(("xlsx", n_rows), lambda: make_workbook(n_rows, n_cols, n_sheets=3))
+
+    def warm_dir():
+        def build():
+            d = os.path.join(fx.tmpdir, f"xlsx_warm_{n_rows}")
+            read_excel_sheets(workbook(), cache_dir=d)
+            return d
+        return fx.get(("xlsx_warm", n_rows), build)
+
+    def cold():
+        b = workbook()
+        if b is None:
+            raise RuntimeError("no xlsx writer installed")
+        return lambda: read_excel_sheets(b, cache_dir=os.path.join(fx.tmpdir, uuid.uuid4().hex))
+
+    def cached():
+        b = workbook()
+        if b is None:
+            raise RuntimeError("no xlsx writer installed")
+        d = warm_dir()
+        return lambda: read_excel_sheets(b, cache_dir=d)
+
+    yield f"ingest.excel_3_sheets[cold {n_rows}]", cold
+    yield f"ingest.excel_3_sheets[cached {n_rows}]", cached
+
+def build_cases(rows, cols, slide_counts, fx, full=False):
+    """
+    Yield (name, setup) pairs; setup() builds the case's inputs and returns the callable to
+    time. Setup runs only for cases that pass the --only filter, outside the timed region.
+    full adds the SPC_TARGET cases.
+    """
+    for n_rows in rows:
+        for n_cols in cols:
+            tag = f"{n_rows}x{n_cols}"
+            ds = lambda r=n_rows, c=n_cols: fx.dataset(r, c)
+            csv = lambda r=n_rows, c=n_cols: fx.get(("csv", r, c), lambda: fx.dataset(r, c).to_csv(index=False).encode("utf-8"))
+            opt = lambda r=n_rows, c=n_cols: fx.get(("optimized", r, c), lambda: optimize_dtypes(fx.dataset(r, c))[0])
+            yield f"ingest.read_table_auto[csv {tag}]", lambda b=csv: (lambda b=b(): read_table_auto(io.BytesIO(b), "data.csv"))
+            yield f"analysis.describe[{tag}]", lambda d=ds: (lambda d=d(): perform_descriptive_stats(d))
+            yield f"analysis.corr[{tag}]", lambda d=ds: (lambda d=d(): pearson_corr_with_pvalues(d))
+            yield f"analysis.regression[{tag}]", lambda d=ds: (lambda d=d(): run_regression(d))
+            yield f"analysis.hypothesis[{tag}]", lambda d=ds: (lambda d=d(): run_hypothesis_tests(d))
+            yield f"analysis.spc[{tag}]", lambda d=ds: (lambda d=d(): run_spc(d))
+            yield f"analysis.spc[xbar5 {tag}]", lambda d=ds: (lambda d=d(): run_spc(d, subgroup_size=5))
+            yield f"ingest.optimize_dtypes[{tag}]", lambda d=ds: (lambda d=d(): optimize_dtypes(d))
+            yield f"analysis.hypothesis[optimized {tag}]", lambda d=opt: (lambda d=d(): run_hypothesis_tests(d))
+            yield f"analysis.doe[{tag}]", lambda d=ds: (lambda d=d(): suggest_next_experiments(d))
+            yield f"progressive.first_stage[{tag}]", lambda d=ds: (lambda d=d(): progressive_first_stage(d))
+        if n_rows <= 100_000:
+            yield from _excel_cases(fx, n_rows, cols[0])
+
+        def history(r=n_rows):
+            def build():
+                store = HistoryStore(root=os.path.join(fx.tmpdir, "history"))
+                return store, store.add(fx.dataset(r, cols[-1]), f"bench_{r}.csv")
+            return fx.get(("history", r), build)
+        yield f"history.load[all cols {n_rows}]", lambda h=history: (lambda sh=h(): sh[0].load(sh[1]))
+        yield f"history.load[2 cols {n_rows}]", lambda h=history: (lambda sh=h(): sh[0].load(sh[1], columns=["x0", "x1"]))
+        chart = lambda r=n_rows: fx.dataset(r, 2)
+        yield f"charts.lttb[{n_rows}]", lambda d=chart: (lambda d=d(): reduce_line_frame(d, "x0", ["x1"], max_points=2000))
+        yield f"charts.minmax[{n_rows}]", lambda d=chart: (lambda d=d(): reduce_line_frame(d, "x0", ["x1"], max_points=2000, method="minmax"))
+        yield f"charts.bin_scatter[{n_rows}]", lambda d=chart: (lambda d=d(): bin_scatter(d, "x0", "x1"))
+
+        # PDF export text scales with rows of summary text, not with columns
+        def pdf_case(r=n_rows):
+            summary = str(perform_descriptive_stats(fx.dataset(r, cols[0])).get("describe", {}))
+            out, plot = os.path.join(fx.tmpdir, f"bench_{r}.pdf"), fx.plot()
+            return lambda: generate_pdf_report(["Report", summary], [plot], out_path=out)
+        yield f"report.generate_pdf_report[{n_rows}]", pdf_case
+    for n_slides in slide_counts:
+        yield f"slides.build_deck[{n_slides}]", lambda n=n_slides: (lambda p=fx.plot(): make_deck(n, p))
+
+        def preview_case(n=n_slides):
+            plot = fx.plot()
+            deck = make_deck(n, plot)
+            return lambda: generate_live_preview_images(deck, plot_paths=[plot])
+        yield f"slides.live_preview[{n_slides}]", preview_case
+
+    # the float32 frame optimize_dtypes produces for wide process data
+    def spc_target(subgroup):
+        def setup():
+            r, c = SPC_TARGET
+            d = fx.get(("float32", r, c), lambda: make_dataset(r, c).astype({f"x{i}": "float32" for i in range(c)}))
+            return lambda: run_spc(d, subgroup_size=subgroup)
+        return setup
+    if full:
+        tag = "x".join(map(str, SPC_TARGET))
+        yield f"analysis.spc[float32 {tag}]", spc_target(1)
+        yield f"analysis.spc[xbar5 float32 {tag}]", spc_target(5)
+
+
+# ---------------------- baseline ----------------------
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("results", {})
+
+def save_baseline(path, results):
+    payload = {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "python": sys.version.split()[0],
+               "pandas": pd.__version__, "numpy": np.__version__, "results": results}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+
+def compare(results, baseline, threshold):
+    """Return list of (name, metric, base, now, ratio) where now > base * threshold."""
+    regressions = []
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric, floor in (("seconds", 0.005), ("peak_mb", 1.0)):
+            b, c = base.get(metric), cur.get(metric)
+            # ignore noise on tiny measurements
+            if b is None or c is None or max(b, c) < floor:
+                continue
+            ratio = c / b if b else float("inf")
+            if ratio > threshold:
+                regressions.append((name, metric, b, c, ratio))
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark analysis, ingestion, preview and export hot paths")
+    ap.add_argument("--full", action="store_true", help="include 1M-row / 50-col datasets (and the float32 SPC target) and 40-slide decks")
+    ap.add_argument("--only", default=None, help="run only cases whose name contains this substring")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--threshold", type=float, default=1.25, help="regression ratio vs baseline (default 1.25)")
+    ap.add_argument("--fail-on-regression", action="store_true")
+    ap.add_argument("--out", default=None, help="write results JSON here")
+    args = ap.parse_args(argv)
+
+    rows = FULL_ROWS if args.full else ROWS
+    cols = FULL_COLS if args.full else COLS
+    slide_counts = FULL_SLIDES if args.full else SLIDES
+    baseline = load_baseline(args.baseline)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, setup in build_cases(rows, cols, slide_counts, Fixtures(tmpdir), full=args.full):
+            if args.only and args.only not in name:
+                continue
+            try:
+                res = measure(setup(), repeat=args.repeat)
+            except Exception as e:
+                print(f"{name:<48} FAILED: {e}")
+                continue
+            results[name] = res
+            base = baseline.get(name)
+            delta = f"  ({res['seconds'] / base['seconds']:.2f}x baseline)" if base and base.get("seconds") else ""
+            print(f"{name:<48} {res['seconds']*1000:>10.1f} ms {res['peak_mb']:>10.1f} MB{delta}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        merged = dict(baseline)
+        merged.update(results)
+        save_baseline(args.baseline, merged)
+        print(f"Saved baseline ({len(merged)} cases) to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for name, metric, b, c, ratio in regressions:
+        print(f"REGRESSION {name} {metric}: {b:.4g} -> {c:.4g} ({ratio:.2f}x)")
+    if not baseline:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+    return 1 if (regressions and args.fail_on_regression) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# Chart data reducers: keep interactive chart payloads bounded regardless of data size.
+#
+# Line plots are downsampled with LTTB (Largest-Triangle-Three-Buckets, keeps visual
+# shape) or min/max buckets (keeps every spike); scatter plots are aggregated into a
+# 2D histogram. Reducers return row indices / small frames so callers keep original
+# column values (and dtypes) for the selected points.
+
+import numpy as np
+import pandas as pd
+
+from tracing import span
+
+DEFAULT_MAX_POINTS = 5000      # reduce only above this many points per chart
+POINTS_PER_PIXEL = 2           # enough to look identical to the full series at a given width
+SCATTER_BINS = 200
+SCATTER_PX_PER_BIN = 4         # a grid cell every few pixels looks the same as the raw points
+
+
+def points_for_width(width_px, max_points=DEFAULT_MAX_POINTS):
+    """Point budget for a chart `width_px` wide, never more than max_points."""
+    return int(max(100, min(max_points, width_px * POINTS_PER_PIXEL)))
+
+def bins_for_width(width_px, max_points=DEFAULT_MAX_POINTS):
+    """Scatter grid size for a chart `width_px` wide, with at most max_points cells."""
+    return int(max(10, min(width_px / SCATTER_PX_PER_BIN, np.sqrt(max_points))))
+
+def lttb_indices(x, y, n_out):
+    """Indices of the n_out points chosen by LTTB. x must be sorted ascending, no NaNs."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # n_out - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        nstart = end
+        nend = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nstart:nend].mean()
+        avg_y = y[nstart:nend].mean()
+        xs, ys = x[start:end], y[start:end]
+        # twice the triangle area (a, candidate, next-bucket average); constant factor irrelevant
+        area = np.abs((x[a] - avg_x) * (ys - y[a]) - (x[a] - xs) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+def minmax_indices(y, n_out):
+    """Indices of the min and max of each of n_out/2 equal buckets (fully vectorized)."""
+    n = len(y)
+    n_buckets = max(1, n_out // 2)
+    if 2 * n_buckets >= n:
+        return np.arange(n)
+    y = np.asarray(y, dtype=np.float64)
+    size = -(-n // n_buckets)
+    padded = np.full(size * n_buckets, np.nan)
+    padded[:n] = y
+    blocks = padded.reshape(n_buckets, size)
+    base = np.arange(n_buckets) * size
+    lo = base + np.argmin(np.where(np.isnan(blocks), np.inf, blocks), axis=1)
+    hi = base + np.argmax(np.where(np.isnan(blocks), -np.inf, blocks), axis=1)
+    idx = np.unique(np.concatenate([lo, hi, [0, n - 1]]))
+    return idx[idx < n]
+
+def reduce_line_frame(df, x, ys, max_points=DEFAULT_MAX_POINTS, method="lttb"):
+    """
+    Rows of df[[x] + ys] to draw as a line chart with at most ~max_points points.
+    Data is ordered by x; each series gets an equal share of the budget and the union
+    of selected rows is returned, so the wide frame plugs straight into px.line.
+    """
+    ys = [c for c in dict.fromkeys(ys) if c != x]
+    sub = df[[x] + ys]
+    if len(sub) <= max_points:
+        return sub
+    with span("chart.reduce_line", rows=len(sub), series=len(ys), method=method) as sp:
+        if not sub[x].is_monotonic_increasing:
+            sub = sub.sort_values(x, kind="stable")
+        if pd.api.types.is_datetime64_any_dtype(sub[x].dtype):
+            xv = sub[x].to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(np.float64)
+            xv[sub[x].isna().to_numpy()] = np.nan
+        else:
+            xv = sub[x].to_numpy(dtype=np.float64, na_value=np.nan)
+        if not ys:
+            # x plotted against itself: an even stride is as good as anything
+            return sub.iloc[np.linspace(0, len(sub) - 1, max_points).astype(np.int64)]
+        per_series = max(3, max_points // max(1, len(ys)))
+        keep = []
+        for col in ys:
+            yv = sub[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            ok = np.flatnonzero(~(np.isnan(xv) | np.isnan(yv)))
+            if method == "minmax":
+                sel = minmax_indices(yv[ok], per_series)
+            else:
+                sel = lttb_indices(xv[ok], yv[ok], per_series)
+            keep.append(ok[sel])
+        rows = np.unique(np.concatenate(keep)) if keep else np.arange(0)
+        out = sub.iloc[rows]
+        sp.set(points=len(out))
+        return out
+
+def bin_scatter(df, x, y, bins=SCATTER_BINS):
+    """
+    Aggregate a scatter into a bins x bins grid. Returns a frame with columns
+    x, y (bin centres) and "count" for the non-empty cells only.
+    """
+    with span("chart.bin_scatter", rows=len(df), bins=bins) as sp:
+        xv = df[x].to_numpy(dtype=np.float64, na_value=np.nan)
+        yv = df[y].to_numpy(dtype=np.float64, na_value=np.nan)
+        ok = np.isfinite(xv) & np.isfinite(yv)
+        counts, xedges, yedges = np.histogram2d(xv[ok], yv[ok], bins=bins)
+        ix, iy = np.nonzero(counts)
+        xc = (xedges[:-1] + xedges[1:]) / 2
+        yc = (yedges[:-1] + yedges[1:]) / 2
+        out = pd.DataFrame({x: xc[ix], y: yc[iy], "count": counts[ix, iy].astype(np.int64)})
+        sp.set(points=len(out))
+        return out
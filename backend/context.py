@@ -0,0 +1,201 @@
+# Bounded conversation context for the chat handlers.
+#
+# Prompts are assembled from (in priority order) instructions, a compact dataset
+# description, pinned facts (code results, key findings), a rolling summary of older
+# turns and the last N turns verbatim. Turns that fall out of the verbatim window are
+# folded into the summary once, incrementally, so the prompt stays within a token budget
+# however long the session runs.
+#
+# Sections are sized with a character-count estimate. When the caller passes the
+# provider's token counter, the finished prompt is counted exactly, the estimate is
+# recalibrated from that count, and an over-budget prompt is rebuilt once. Without a
+# counter, estimates are inflated by ESTIMATE_MARGIN.
+#
+#   CHAT_CONTEXT_TOKENS=8000   total prompt budget (provider tokens)
+#   CHAT_VERBATIM_TURNS=6      most recent messages kept word for word
+
+import os, re
+
+CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "8000"))
+VERBATIM_TURNS = int(os.getenv("CHAT_VERBATIM_TURNS", "6"))
+CHARS_PER_TOKEN = 4            # rough average for English prose; the unit of every estimate below
+ESTIMATE_MARGIN = 1.25         # code, numbers and CSV run denser than prose: real tokens per estimated one
+
+# shares of the budget (instructions and the newest turn are always kept)
+DATASET_SHARE = 0.25
+PINS_SHARE = 0.15
+SUMMARY_SHARE = 0.15
+TURN_SUMMARY_TOKENS = 40       # per folded turn in the extractive summary
+
+_CODE_RE = re.compile(r"```[\s\S]*?```")
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if text else 0
+
+def truncate_to_tokens(text, max_tokens, marker=" …[truncated]"):
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max(0, max_tokens * CHARS_PER_TOKEN - len(marker))] + marker
+
+def summarize_turn(msg, max_tokens=TURN_SUMMARY_TOKENS):
+    """One-line extractive summary of a message: code replaced by a marker, first sentences kept."""
+    text = _CODE_RE.sub(" [code] ", msg["content"])
+    text = " ".join(text.split())
+    return truncate_to_tokens(f"{msg['role'].capitalize()}: {text}", max_tokens, marker="…")
+
+def extractive_summarize(previous, new_messages, max_tokens):
+    """Default summarizer: append one line per folded turn, dropping the oldest lines to fit."""
+    lines = [l for l in previous.splitlines() if l and not l.startswith("(earlier")] if previous else []
+    lines += [summarize_turn(m) for m in new_messages]
+    dropped = False
+    while lines and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+        dropped = True
+    if dropped:
+        lines.insert(0, "(earlier discussion omitted)")
+    return "\n".join(lines)
+
+def dataset_context(df, max_tokens):
+    """Schema, numeric summary and as many leading rows as fit in max_tokens."""
+    if df is None:
+        return "No dataset available."
+    parts = [f"Shape: {df.shape[0]} rows x {df.shape[1]} columns",
+             "Columns: " + ", ".join(f"{c} ({t})" for c, t in zip(df.columns, df.dtypes))]
+    try:
+        desc = df.describe().round(4).to_csv()
+        if estimate_tokens("\n".join(parts) + desc) < max_tokens // 2:
+            parts.append("Summary statistics:\n" + desc)
+    except Exception:
+        pass
+    head = "\n".join(parts)
+    budget = max_tokens - estimate_tokens(head) - 8
+    if budget > 0 and len(df):
+        # estimate row width from a small sample, then take as many rows as fit
+        sample = df.head(20).to_csv(index=False)
+        per_row = max(1, estimate_tokens(sample) / (min(20, len(df)) + 1))
+        n = int(min(len(df), max(0, budget / per_row - 1)))
+        if n:
+            rows = truncate_to_tokens(df.head(n).to_csv(index=False), budget)
+            head += f"\nFirst {n} rows (CSV):\n{rows}"
+    return head
+
+
+class ConversationContext:
+    """
+    Per-session prompt builder. `summarize(previous, new_messages, max_tokens) -> str`
+    can be swapped for an LLM-backed summarizer; the default is extractive (no extra call).
+    """
+
+    def __init__(self, budget_tokens=CONTEXT_TOKENS, verbatim_turns=VERBATIM_TURNS, summarize=extractive_summarize):
+        self.budget_tokens = budget_tokens
+        self.verbatim_turns = verbatim_turns
+        self.summarize = summarize
+        self.scale = ESTIMATE_MARGIN   # provider tokens per estimated token; measured once a counter is given
+        self.summary = ""
+        self.folded = 0           # ss.messages[:folded] are represented by self.summary
+        self.pins = {}            # key -> text, insertion ordered (oldest first)
+        self.last_stats = {}
+
+    # ---------- pins ----------
+    def pin(self, key, text, max_tokens=300):
+        """Keep a fact in every prompt (code output, analysis result). Re-pinning a key replaces it."""
+        self.pins.pop(key, None)
+        if text and text.strip():
+            self.pins[key] = truncate_to_tokens(text.strip(), max_tokens)
+
+    def unpin(self, key):
+        self.pins.pop(key, None)
+
+    def _pins_text(self, max_tokens):
+        # newest pins win when over budget
+        out, used = [], 0
+        for key, text in reversed(list(self.pins.items())):
+            line = f"- {key}: {text}"
+            cost = estimate_tokens(line) + 1
+            if used + cost > max_tokens:
+                continue
+            out.append(line)
+            used += cost
+        return "\n".join(reversed(out))
+
+    # ---------- summary ----------
+    def _fold(self, messages, upto, max_tokens):
+        if upto > self.folded:
+            self.summary = self.summarize(self.summary, messages[self.folded:upto], max_tokens)
+            self.folded = upto
+
+    # ---------- prompt ----------
+    def build(self, messages, instructions="", dataset=None, footer="", count_tokens=None):
+        """
+        Prompt for the next model call. `dataset` is a DataFrame (described compactly) or
+        preformatted text. count_tokens(text) -> int or None is the provider's counter (see
+        the module comment). Stats for the last build are kept in self.last_stats.
+        """
+        prompt = self._assemble(messages, instructions, dataset, footer)
+        counted = count_tokens(prompt) if count_tokens is not None else None
+        if counted is not None:
+            self.scale = max(0.1, counted / max(1, estimate_tokens(prompt)))
+            if counted > self.budget_tokens:
+                self.scale *= 1.05     # a little headroom so the rebuild lands under the budget
+                prompt = self._assemble(messages, instructions, dataset, footer)
+                counted = count_tokens(prompt)
+        self.last_stats["prompt_tokens"] = counted if counted is not None else self._tokens(prompt)
+        self.last_stats["prompt_tokens_counted"] = counted is not None
+        return prompt
+
+    def _tokens(self, text):
+        return round(estimate_tokens(text) * self.scale)
+
+    def _assemble(self, messages, instructions, dataset, footer):
+        budget = int(self.budget_tokens / self.scale)      # in estimated tokens from here on
+        fixed = estimate_tokens(instructions) + estimate_tokens(footer)
+        ds_text = ""
+        if dataset is not None:
+            ds_budget = int(budget * DATASET_SHARE)
+            ds_text = dataset if isinstance(dataset, str) else dataset_context(dataset, ds_budget)
+            ds_text = truncate_to_tokens(ds_text, ds_budget)
+        pins_text = self._pins_text(int(budget * PINS_SHARE))
+
+        if len(messages) <= self.folded and self.folded:
+            # conversation was truncated: rebuild from scratch
+            self.summary, self.folded = "", 0
+        # verbatim window: last N turns, shrunk further while it doesn't fit; turns already
+        # folded into the summary are never repeated (archived ones have no content left)
+        remaining = budget - fixed - estimate_tokens(ds_text) - estimate_tokens(pins_text)
+        summary_budget = int(budget * SUMMARY_SHARE)
+        start = max(self.folded, len(messages) - self.verbatim_turns)
+        turn_cost = [estimate_tokens(m["content"]) + 4 for m in messages]
+        while start < len(messages) - 1 and sum(turn_cost[start:]) > remaining - summary_budget:
+            start += 1
+        self._fold(messages, start, summary_budget)
+
+        turns = []
+        for m in messages[start:]:
+            content = m["content"]
+            if m is messages[-1]:
+                # the newest turn is always sent, cut down if it alone blows the budget
+                content = truncate_to_tokens(content, max(200, remaining - summary_budget))
+            turns.append(f"{m['role'].capitalize()}: {content}")
+
+        sections = [instructions.strip()] if instructions.strip() else []
+        if ds_text:
+            sections.append("Dataset:\n" + ds_text)
+        if pins_text:
+            sections.append("Pinned results:\n" + pins_text)
+        if self.summary and self.folded:
+            sections.append("Summary of earlier conversation:\n" + self.summary)
+        if turns:
+            sections.append("Conversation (most recent):\n" + "\n".join(turns))
+        if footer.strip():
+            sections.append(footer.strip())
+        prompt = "\n\n".join(sections)
+
+        self.last_stats = {
+            "dataset_tokens": self._tokens(ds_text),
+            "pins_tokens": self._tokens(pins_text),
+            "summary_tokens": self._tokens(self.summary) if self.folded else 0,
+            "verbatim_turns": len(turns),
+            "folded_turns": self.folded,
+        }
+        return prompt
@@ -0,0 +1,423 @@
+# Execution of AI-generated snippets, with result memoization.
+#
+# execute_snippet runs code in an isolated namespace and captures stdout, the error
+# traceback and the produced figure (matplotlib or a plotly `fig`). ExecutionCache
+# memoizes those results by (normalized code, DataFrame fingerprint, library versions)
+# so re-running an unchanged snippet on unchanged data returns instantly.
+#
+# Executions are isolated per thread (figure registry and stdout), so sessions running
+# snippets at the same time never see or close each other's figures. Snippets that change
+# global styles (rcParams, seaborn themes) run alone and have their changes undone after.
+
+import os, io, ast, sys, time, shutil, hashlib, tempfile, threading, traceback, contextlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # headless, thread-usable canvas; never a GUI backend on the server
+import matplotlib.pyplot as plt
+from matplotlib import _pylab_helpers
+import seaborn as sns
+import plotly
+import plotly.express as px
+
+from tracing import span
+
+PLOT_DIR = os.path.join(tempfile.gettempdir(), "ai_saved_plots")
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "ai_snippet_cache")
+CACHE_MAX_ENTRIES = int(os.getenv("SNIPPET_CACHE_ENTRIES", "256"))
+
+LIB_VERSIONS = "|".join(f"{m.__name__}={m.__version__}" for m in (pd, np, matplotlib, sns, plotly))
+
+# df methods / keywords that modify the frame in place
+_MUTATING_METHODS = {"insert", "update", "pop", "__setitem__", "__delitem__"}
+
+
+class ExecResult:
+    __slots__ = ("stdout", "error", "plot_path", "cached", "mutates_df")
+
+    def __init__(self, stdout, error, plot_path, cached=False, mutates_df=False):
+        self.stdout = stdout
+        self.error = error
+        self.plot_path = plot_path
+        self.cached = cached
+        self.mutates_df = mutates_df
+
+
+# ---------- per-execution isolation ----------
+# pyplot keeps open figures in one process-wide registry (Gcf.figs) and contextlib's
+# redirect_stdout swaps the process-wide sys.stdout, so two sessions executing at once
+# could capture (or close) each other's figures and output. Both are made per-thread
+# here; each execution then runs against a fresh registry and its own stdout buffer.
+# Streamlit runs every session's script on its own thread, so snippets from different
+# sessions can execute concurrently.
+#
+# Gcf.figs is private, but Gcf has only ever touched it through mapping calls on the class
+# attribute (get/pop/values/items/move_to_end/clear, `in`, len); the stand-in forwards any
+# attribute to a real OrderedDict, so new Gcf methods keep working. If a matplotlib release
+# stops storing an OrderedDict there, the patch is not applied and executions fall back to
+# running one at a time (_serial_lock): slower, never wrong. sys.stdout is only wrapped, and
+# threads that aren't capturing write straight through to the original stream.
+#
+# rcParams (and with it every seaborn theme) can't be made per-thread: matplotlib reads
+# the one global dict everywhere. Snippets that change styles (changes_style) therefore
+# take the style lock exclusively and run inside rc_context(), which restores the previous
+# values on exit; all other snippets share the lock and run side by side.
+
+class _ThreadLocalFigs:
+    """Stand-in for Gcf.figs: an OrderedDict per thread, swappable per execution."""
+
+    def __init__(self, initial=None):
+        self._local = threading.local()
+        self._initial = initial
+
+    def _d(self):
+        d = getattr(self._local, "figs", None)
+        if d is None:
+            d = self._local.figs = OrderedDict()
+            if self._initial:
+                # figures opened before the patch belong to the importing thread
+                d.update(self._initial)
+                self._initial = None
+        return d
+
+    def swap(self, new):
+        old = self._d()
+        self._local.figs = new
+        return old
+
+    def __getattr__(self, name):   # get, pop, values, items, keys, clear, move_to_end, ...
+        return getattr(self._d(), name)
+    def __getitem__(self, k): return self._d()[k]
+    def __setitem__(self, k, v): self._d()[k] = v
+    def __delitem__(self, k): del self._d()[k]
+    def __contains__(self, k): return k in self._d()
+    def __iter__(self): return iter(self._d())
+    def __len__(self): return len(self._d())
+    def __bool__(self): return bool(self._d())
+
+
+class _ThreadStdout:
+    """sys.stdout replacement that writes to the current thread's capture buffer, if any."""
+
+    def __init__(self, default):
+        self._default = default
+        self._local = threading.local()
+
+    def _target(self):
+        return getattr(self._local, "buf", None) or self._default
+
+    def write(self, s):
+        return self._target().write(s)
+
+    def flush(self):
+        return self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+
+_install_lock = threading.Lock()
+_figs = None
+_stdout = None
+# only used if pyplot's registry can't be patched (unexpected matplotlib internals)
+_serial_lock = threading.Lock()
+
+
+class _StyleLock:
+    """Shared/exclusive lock: any number of plain executions, or one that changes styles."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting = 0                # writers queued; new readers wait behind them
+
+    @contextlib.contextmanager
+    def shared(self):
+        with self._cond:
+            while self._writer or self._waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        with self._cond:
+            self._waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+_style_lock = _StyleLock()
+
+def _install():
+    global _figs, _stdout
+    with _install_lock:
+        if _figs is None:
+            current = getattr(_pylab_helpers.Gcf, "figs", None)
+            if isinstance(current, _ThreadLocalFigs):
+                _figs = current
+            elif isinstance(current, OrderedDict):
+                _figs = _ThreadLocalFigs(initial=current)
+                _pylab_helpers.Gcf.figs = _figs
+            else:
+                _figs = False
+        # re-wrap if something swapped sys.stdout since (test runners, embedding hosts)
+        if not isinstance(sys.stdout, _ThreadStdout):
+            sys.stdout = _ThreadStdout(sys.stdout)
+        _stdout = sys.stdout
+    return _stdout
+
+@contextlib.contextmanager
+def isolated_execution(styled=False):
+    """
+    Fresh figure registry + private stdout for the calling thread. Yields the stdout buffer.
+    styled=True runs alone and restores rcParams afterwards (see changes_style).
+    """
+    out = _install()
+    buf = io.StringIO()
+    serial = _serial_lock if _figs is False else contextlib.nullcontext()
+    style = _style_lock.exclusive() if styled else _style_lock.shared()
+    rc = matplotlib.rc_context() if styled else contextlib.nullcontext()
+    with style, serial, rc:
+        prev_figs = _figs.swap(OrderedDict()) if _figs else None
+        prev_buf = getattr(out._local, "buf", None)
+        out._local.buf = buf
+        try:
+            yield buf
+        finally:
+            out._local.buf = prev_buf
+            if _figs:
+                # close only this execution's figures, then restore the thread's previous registry
+                plt.close("all")
+                _figs.swap(prev_figs)
+
+def _save_matplotlib(msg_idx=None):
+    """Save this execution's active figure (object-oriented: Figure.savefig on its Agg canvas)."""
+    manager = _pylab_helpers.Gcf.get_active()
+    if manager is None:
+        return None
+    os.makedirs(PLOT_DIR, exist_ok=True)
+    path = os.path.join(PLOT_DIR, f"mpl_plot_msg{msg_idx or 'X'}_{threading.get_ident()}_{int(time.time()*1000)}.png")
+    manager.canvas.figure.savefig(path, dpi=150, bbox_inches='tight')
+    return path
+
+def _try_save_plotly(user_ns, msg_idx=None):
+    try:
+        fig = user_ns.get("fig", None)
+        if fig is None:
+            return None
+        os.makedirs(PLOT_DIR, exist_ok=True)
+        path = os.path.join(PLOT_DIR, f"plotly_msg{msg_idx or 'X'}_{threading.get_ident()}_{int(time.time()*1000)}.png")
+        if hasattr(fig, "write_image"):
+            try:
+                fig.write_image(path, scale=2)
+                return path
+            except Exception:
+                pass
+        import plotly.io as pio
+        try:
+            pio.write_image(fig, path, scale=2)
+            return path
+        except Exception:
+            return None
+    except Exception:
+        return None
+
+def execute_snippet(code, df, msg_idx=None, extra_ns=None):
+    """
+    Execute code in isolated namespace. Capture stdout and matplotlib/plotly figures.
+    extra_ns adds names (e.g. sql) to the namespace.
+    Safe to call from several threads at once. Returns ExecResult(stdout, error, plot_path).
+    """
+    user_ns = {"df": df, "pd": pd, "plt": plt, "sns": sns, "px": px, "np": np, **(extra_ns or {})}
+    err = None
+    plot_path = None
+    with isolated_execution(styled=changes_style(code)) as out_buf:
+        with span("exec.snippet", code_chars=len(code)) as sp:
+            try:
+                exec(code, user_ns)
+            except Exception:
+                err = traceback.format_exc()
+                sp.set(failed=True)
+        try:
+            with span("exec.plot_export") as sp:
+                if plt.get_fignums():
+                    plot_path = _save_matplotlib(msg_idx)
+                else:
+                    plot_path = _try_save_plotly(user_ns, msg_idx)
+                sp.set(image_bytes=os.path.getsize(plot_path) if plot_path else 0)
+        except Exception as e:
+            err = (err + f"\nAdditionally failed saving plot: {e}") if err else f"Failed saving plot: {e}"
+    return ExecResult(out_buf.getvalue(), err, plot_path)
+
+
+# ---------- memoization ----------
+def normalize_code(code):
+    """Formatting/comment-insensitive form of code (AST dump); raw stripped text if it doesn't parse."""
+    try:
+        return ast.dump(ast.parse(code))
+    except SyntaxError:
+        return "\n".join(line.rstrip() for line in code.strip().splitlines())
+
+def _rooted_at_df(node):
+    while isinstance(node, (ast.Subscript, ast.Attribute)):
+        node = node.value
+    return isinstance(node, ast.Name) and node.id == "df"
+
+def mutates_df(code):
+    """
+    Best-effort static check for snippets that modify `df` in place (assignment/del through
+    df, inplace=True, df.insert/update/pop). Such runs are not memoized: the second run
+    would see different data.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return False
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Assign, ast.AugAssign, ast.AnnAssign, ast.Delete)):
+            targets = node.targets if isinstance(node, (ast.Assign, ast.Delete)) else [node.target]
+            if any(isinstance(t, (ast.Subscript, ast.Attribute)) and _rooted_at_df(t) for t in targets):
+                return True
+        elif isinstance(node, ast.Call):
+            if any(kw.arg == "inplace" and isinstance(kw.value, ast.Constant) and kw.value.value is True
+                   for kw in node.keywords):
+                return True
+            f = node.func
+            if isinstance(f, ast.Attribute) and f.attr in _MUTATING_METHODS and _rooted_at_df(f.value):
+                return True
+    return False
+
+# names that read or write matplotlib's global style state
+_STYLE_NAMES = {"rcParams", "rc", "rcdefaults", "rc_file", "rc_file_defaults", "rc_context", "style", "xkcd"}
+
+def changes_style(code):
+    """
+    Best-effort static check for snippets that touch global plot styles: rcParams / plt.rc /
+    plt.style, or seaborn's set_* / reset_* / axes_style / plotting_context. Unparseable code
+    counts as not styled (it fails before drawing anything).
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id in _STYLE_NAMES:
+            return True
+        if isinstance(node, ast.Attribute):
+            if node.attr in _STYLE_NAMES:
+                return True
+            if (isinstance(node.value, ast.Name) and node.value.id in ("sns", "seaborn")
+                    and (node.attr.startswith(("set", "reset")) or node.attr in ("axes_style", "plotting_context"))):
+                return True
+    return False
+
+def cache_key(code, df_fingerprint):
+    h = hashlib.blake2b(digest_size=16)
+    for part in (normalize_code(code), str(df_fingerprint), LIB_VERSIONS):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class ExecutionCache:
+    """Thread-safe LRU of ExecResult; figure files are copied into CACHE_DIR and owned by the cache."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, cache_dir=CACHE_DIR):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()   # key -> (fingerprint, ExecResult)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or (item[1].plot_path and not os.path.exists(item[1].plot_path)):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            r = item[1]
+            return ExecResult(r.stdout, r.error, r.plot_path, cached=True)
+
+    def put(self, key, fingerprint, result):
+        plot_path = None
+        if result.plot_path and os.path.exists(result.plot_path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            plot_path = os.path.join(self.cache_dir, key + os.path.splitext(result.plot_path)[1])
+            shutil.copyfile(result.plot_path, plot_path)
+        with self._lock:
+            self._entries[key] = (fingerprint, ExecResult(result.stdout, result.error, plot_path))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                _, (_, old) = self._entries.popitem(last=False)
+                self._remove_artifact(old)
+
+    def invalidate(self, fingerprint=None):
+        """Drop every entry, or only those computed on the dataset with this fingerprint."""
+        with self._lock:
+            keys = [k for k, (fp, _) in self._entries.items() if fingerprint is None or fp == fingerprint]
+            for k in keys:
+                self._remove_artifact(self._entries.pop(k)[1])
+        return len(keys)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _remove_artifact(result):
+        if result.plot_path:
+            try:
+                os.remove(result.plot_path)
+            except OSError:
+                pass
+
+
+def run_snippet_cached(code, df, df_fingerprint, cache, msg_idx=None, force=False, extra_ns=None):
+    """
+    execute_snippet with memoization. Snippets that mutate df are always executed (and
+    flagged via result.mutates_df so callers can refresh the fingerprint).
+    force=True re-executes and refreshes the cached entry. If extra_ns gives the snippet
+    access to other data, df_fingerprint must cover that data too.
+    """
+    mutating = mutates_df(code)
+    if mutating or df_fingerprint is None or cache is None:
+        result = execute_snippet(code, df, msg_idx=msg_idx, extra_ns=extra_ns)
+        result.mutates_df = mutating
+        return result
+    key = cache_key(code, df_fingerprint)
+    with span("exec.cache_lookup") as sp:
+        hit = None if force else cache.get(key)
+        sp.set(cache_hit=hit is not None)
+    if hit is not None and hit.plot_path:
+        # hand out a private copy so cache eviction never pulls a plot from under a session
+        try:
+            os.makedirs(PLOT_DIR, exist_ok=True)
+            path = os.path.join(PLOT_DIR, f"cached_msg{msg_idx or 'X'}_{int(time.time()*1000)}{os.path.splitext(hit.plot_path)[1]}")
+            shutil.copyfile(hit.plot_path, path)
+            hit.plot_path = path
+        except OSError:
+            hit = None  # evicted meanwhile: just execute
+    if hit is not None:
+        return hit
+    result = execute_snippet(code, df, msg_idx=msg_idx, extra_ns=extra_ns)
+    cache.put(key, df_fingerprint, result)
+    return result
@@ -0,0 +1,149 @@
+# Export artifact cache: built PPTX/PDF files kept in memory, keyed by what they were
+# built from, so repeat downloads of an unchanged deck or report are served instantly.
+#
+# Keys are (kind, owner, version) tuples, e.g. ("pptx", browser session, deck_version).
+# Storing a new version for a (kind, owner) slot drops the older ones. Builds can be
+# submitted to a small worker pool as soon as the inputs change; a later request for the
+# same key waits for the in-flight build instead of starting another. A build whose
+# inputs change before it reads them raises StaleBuild and stores nothing; such builds
+# take a `version` keyword, and build(version=None) builds whatever is current.
+#
+#   EXPORT_CACHE_MB=256   memory budget for cached artifacts (LRU beyond that)
+
+import os, io, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import span
+
+EXPORT_CACHE_MB = int(os.getenv("EXPORT_CACHE_MB", "256"))
+EXPORT_WORKERS = 2
+
+
+class StaleBuild(Exception):
+    """The inputs moved past the submitted version before the build read them."""
+
+
+class VersionLock:
+    """A lock that also carries the version of the object it guards (changed while held)."""
+
+    def __init__(self, version=0):
+        self._lock = threading.Lock()
+        self.version = version
+
+    def __enter__(self):
+        self._lock.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+def pptx_bytes(prs, lock=None, version=None):
+    """
+    Serialize a Presentation into memory (under `lock`, which guards mutations of prs).
+    With `version`, raise StaleBuild unless the deck is still at that version.
+    """
+    buf = io.BytesIO()
+    if lock is None:
+        prs.save(buf)
+    else:
+        with lock:
+            if version is not None and getattr(lock, "version", version) != version:
+                raise StaleBuild(f"deck is at version {lock.version}, not {version}")
+            prs.save(buf)
+    return buf.getvalue()
+
+
+class ArtifactCache:
+    """Thread-safe, byte-bounded LRU of built artifacts with background builds."""
+
+    def __init__(self, max_bytes=EXPORT_CACHE_MB * 1024 * 1024, workers=EXPORT_WORKERS):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()     # key -> bytes
+        self._bytes = 0
+        self._pending = {}              # key -> Future
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+            return data
+
+    def ready(self, key):
+        with self._lock:
+            return key in self._items
+
+    def _put(self, key, data):
+        with self._lock:
+            for k in [k for k in self._items if k[:-1] == key[:-1] and k != key]:
+                self._bytes -= len(self._items.pop(k))
+            if key in self._items:
+                self._bytes -= len(self._items.pop(key))
+            self._items[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                _, old = self._items.popitem(last=False)
+                self._bytes -= len(old)
+
+    def _build(self, key, build, on_done=None):
+        try:
+            with span("export.build", kind=key[0]) as sp:
+                try:
+                    data = build()
+                except StaleBuild:
+                    sp.set(stale=True)
+                    return None
+                sp.set(bytes=len(data))
+            self._put(key, data)
+            with self._lock:
+                self.builds += 1
+            if on_done is not None:
+                on_done(data)
+            return data
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def submit(self, key, build, on_done=None):
+        """Start building key in the background unless it is cached or already being built."""
+        with self._lock:
+            if key in self._items or key in self._pending:
+                return self._pending.get(key)
+            fut = self._pool.submit(self._build, key, build, on_done)
+            self._pending[key] = fut
+            return fut
+
+    def get_or_build(self, key, build, timeout=None):
+        """
+        Cached bytes, the result of the in-flight build, or a fresh synchronous build. If the
+        inputs have moved past key's version, the current ones are built (build(version=None))
+        and returned uncached: they belong to a newer key.
+        """
+        data = self.get(key)
+        if data is not None:
+            return data
+        with self._lock:
+            fut = self._pending.get(key)
+        if fut is not None:
+            data = fut.result(timeout=timeout)
+            if data is not None:
+                return data
+        data = self._build(key, build)
+        if data is None:
+            with span("export.build", kind=key[0], stale_retry=True) as sp:
+                data = build(version=None)
+                sp.set(bytes=len(data))
+        return data
+
+    def nbytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._items)
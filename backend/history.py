@@ -0,0 +1,174 @@
+# Dataset history store: uploaded datasets kept as Arrow IPC files with a small JSON index.
+#
+# Layout under root (default ./datasets):
+#   objects/<content hash>.arrow   one uncompressed Arrow IPC file per distinct dataset
+#   index.json                     [{id, name, hash, rows, cols, schema, uploaded_at, bytes, format}, ...]
+#
+# Storage is deduplicated by content hash: re-uploading the same data only adds an index
+# entry. Reopening memory-maps the file and reads just the requested columns. Object
+# columns Arrow can't type (mixed ints and strings) are stored as text. Without pyarrow
+# the store falls back to CSV objects (full parse on load).
+
+import os, json, time, uuid, threading
+
+import pandas as pd
+
+from tracing import span
+from ingest import dataframe_fingerprint
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    PYARROW_AVAILABLE = True
+except Exception:
+    PYARROW_AVAILABLE = False
+
+HISTORY_DIR = os.getenv("HISTORY_DIR", os.path.join(os.getcwd(), "datasets"))
+
+_lock = threading.Lock()
+
+
+def _stringify_mixed(df):
+    """Object columns Arrow can't type (e.g. ints and strings mixed in one CSV/Excel column) as text; nulls stay null."""
+    fixed = {}
+    for c in df.columns:
+        s = df[c]
+        if s.dtype != object:
+            continue
+        try:
+            pa.array(s, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            fixed[c] = s.astype(str).where(s.notna(), None)
+    return df.assign(**fixed) if fixed else df
+
+def table_to_frame(table, writable=False):
+    """
+    Arrow table -> DataFrame with the dtypes ingest produced: strings stay Arrow-backed
+    (string[pyarrow]) instead of becoming Python objects. split_blocks avoids consolidating
+    columns into 2D blocks, so numeric columns without nulls can stay zero-copy views; over a
+    memory-mapped table those views are read-only. writable=True copies numeric data into
+    regular blocks instead, for frames that snippets may modify in place.
+    """
+    string = pd.StringDtype("pyarrow")
+    mapping = {pa.string(): string, pa.large_string(): string}
+    return table.to_pandas(split_blocks=not writable, types_mapper=mapping.get)
+
+
+class HistoryStore:
+    def __init__(self, root=HISTORY_DIR):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_path = os.path.join(root, "index.json")
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    # ---------- index ----------
+    def _read_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return []
+
+    def _write_index(self, entries):
+        tmp = self.index_path + f".{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f, indent=1)
+        os.replace(tmp, self.index_path)
+
+    def entries(self):
+        """Index entries, newest first."""
+        return sorted(self._read_index(), key=lambda e: e.get("uploaded_at", 0), reverse=True)
+
+    def get(self, entry_id):
+        return next((e for e in self._read_index() if e["id"] == entry_id), None)
+
+    # ---------- objects ----------
+    def _object_path(self, content_hash, fmt):
+        return os.path.join(self.objects_dir, f"{content_hash}.{fmt}")
+
+    def object_path(self, entry):
+        """File holding an index entry's data."""
+        return self._object_path(entry["hash"], entry.get("format", "arrow"))
+
+    def add(self, df, name, content_hash=None):
+        """Record an upload. Writes the data only if this content isn't stored yet. Returns the index entry."""
+        content_hash = content_hash or dataframe_fingerprint(df)
+        fmt = "arrow" if PYARROW_AVAILABLE else "csv"
+        path = self._object_path(content_hash, fmt)
+        with span("history.add", rows=int(df.shape[0]), cols=int(df.shape[1])) as sp:
+            deduped = os.path.exists(path)
+            if not deduped:
+                tmp = path + f".{uuid.uuid4().hex[:8]}.tmp"
+                # Arrow IPC needs string column names and a default index
+                out = df.reset_index(drop=True)
+                out.columns = [str(c) for c in out.columns]
+                if fmt == "arrow":
+                    # uncompressed so reads can memory-map without decoding
+                    try:
+                        out.to_feather(tmp, compression="uncompressed")
+                    except (pa.ArrowInvalid, pa.ArrowTypeError):
+                        out = _stringify_mixed(out)
+                        out.to_feather(tmp, compression="uncompressed")
+                else:
+                    out.to_csv(tmp, index=False)
+                os.replace(tmp, path)
+            sp.set(deduped=deduped, bytes=os.path.getsize(path))
+            entry = {
+                "id": uuid.uuid4().hex[:12],
+                "name": name,
+                "hash": content_hash,
+                "rows": int(df.shape[0]),
+                "cols": int(df.shape[1]),
+                "schema": {str(c): str(t) for c, t in zip(df.columns, df.dtypes)},
+                "uploaded_at": time.time(),
+                "bytes": os.path.getsize(path),
+                "format": fmt,
+            }
+            with _lock:
+                entries = self._read_index()
+                # same name + same content already recorded: refresh its timestamp instead of duplicating
+                same = next((e for e in entries if e["hash"] == content_hash and e["name"] == name), None)
+                if same:
+                    same["uploaded_at"] = entry["uploaded_at"]
+                    entry = same
+                else:
+                    entries.append(entry)
+                self._write_index(entries)
+            return entry
+
+    def load(self, entry_or_hash, columns=None, writable=False):
+        """
+        Open a stored dataset. Arrow objects are memory-mapped and only `columns` are read;
+        their numeric columns are read-only views unless writable=True (one copy).
+        """
+        entry = entry_or_hash if isinstance(entry_or_hash, dict) else None
+        content_hash = entry["hash"] if entry else entry_or_hash
+        fmt = entry.get("format", "arrow") if entry else ("arrow" if PYARROW_AVAILABLE else "csv")
+        path = self._object_path(content_hash, fmt)
+        with span("history.load", format=fmt, columns=len(columns) if columns else "all") as sp:
+            if fmt == "arrow":
+                table = feather.read_table(path, columns=list(columns) if columns else None, memory_map=True)
+                df = table_to_frame(table, writable=writable)
+            else:
+                df = pd.read_csv(path, usecols=list(columns) if columns else None)
+            sp.set(rows=int(df.shape[0]), cols=int(df.shape[1]))
+            return df
+
+    def delete(self, entry_id):
+        """Remove an index entry; the object file goes when no other entry references it."""
+        with _lock:
+            entries = self._read_index()
+            entry = next((e for e in entries if e["id"] == entry_id), None)
+            if entry is None:
+                return
+            entries = [e for e in entries if e["id"] != entry_id]
+            self._write_index(entries)
+            if not any(e["hash"] == entry["hash"] for e in entries):
+                try:
+                    os.remove(self._object_path(entry["hash"], entry.get("format", "arrow")))
+                except OSError:
+                    pass
+
+    def total_bytes(self):
+        return sum(os.path.getsize(os.path.join(self.objects_dir, f)) for f in os.listdir(self.objects_dir)
+                   if not f.endswith(".tmp"))
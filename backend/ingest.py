@@ -0,0 +1,313 @@
+# Table ingestion helpers (csv / xls / xlsx). Pure functions: no Streamlit imports,
+# so they can be used from the app, benchmarks and scripts alike.
+
+import os, io, json, shutil, hashlib, tempfile
+from datetime import datetime
+from importlib.util import find_spec
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from tracing import span, in_current_context
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather    # also enables pandas "string[pyarrow]"
+    PYARROW_AVAILABLE = True
+except Exception:
+    PYARROW_AVAILABLE = False
+
+# pandas engine="calamine" (pandas >= 2.2) imports the package itself; only probe for it
+CALAMINE_AVAILABLE = find_spec("python_calamine") is not None
+
+EXCEL_CACHE_DIR = os.getenv("EXCEL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ai_excel_cache"))
+EXCEL_CACHE_MB = int(os.getenv("EXCEL_CACHE_MB", "1024"))    # least recently opened workbooks go first
+EXCEL_MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+# Low-cardinality text columns become categoricals when unique/rows is at or below this ratio
+CATEGORY_MAX_RATIO = 0.5
+CATEGORY_MAX_UNIQUE = 10_000
+INT32 = np.iinfo(np.int32)
+
+
+def read_csv_with_fallback(file):
+    encodings = ['utf-8', 'latin1', 'ISO-8859-1', 'cp1252']
+    for e in encodings:
+        try:
+            file.seek(0)
+            return pd.read_csv(file, encoding=e)
+        except Exception:
+            continue
+    raise Exception("Could not decode CSV with common encodings.")
+
+
+def read_table_auto(file, name, sheet_name=None):
+    """Support csv and xlsx. sheet_name: Excel sheet name/index (default: first sheet)."""
+    with span("ingest.read_table", file=name) as sp:
+        if name.lower().endswith((".xls", ".xlsx")):
+            sheet = 0 if sheet_name is None else sheet_name
+            df = read_excel_sheets(file, [sheet])[sheet]
+        else:
+            df = read_csv_with_fallback(file)
+        sp.set(rows=int(df.shape[0]), cols=int(df.shape[1]))
+        return df
+
+# ---------- Excel: fast engine + per-sheet columnar cache ----------
+
+def _file_bytes(file):
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
+    file.seek(0)
+    return file.read()
+
+def _excel_engine():
+    return "calamine" if CALAMINE_AVAILABLE else None
+
+def list_excel_sheets(file):
+    """Sheet names of a workbook (file-like or bytes)."""
+    data = file if isinstance(file, bytes) else _file_bytes(file)
+    engine = _excel_engine()
+    try:
+        with pd.ExcelFile(io.BytesIO(data), engine=engine) as xf:
+            return list(xf.sheet_names)
+    except ValueError:
+        # pandas too old for engine="calamine"
+        with pd.ExcelFile(io.BytesIO(data)) as xf:
+            return list(xf.sheet_names)
+
+def _sheet_cache_path(workbook_hash, sheet, cache_dir):
+    # indices and names are keyed separately so a cache hit never needs to open the workbook
+    key = f"#{sheet}" if isinstance(sheet, int) else f"name:{sheet}"
+    safe = hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+    return os.path.join(cache_dir, workbook_hash, f"{safe}.arrow")
+
+# Arrow only stores string column names; headers read from Excel are often numbers or dates
+# (2023, 2024, ...). The cached file keeps str() names plus the original labels under this
+# schema-metadata key, so a cache hit returns exactly what a fresh parse would.
+_LABELS_KEY = b"ingest.column_labels"
+
+def _encode_labels(columns):
+    """JSON of [type, value] per column label, or None if every label is already a string."""
+    if all(isinstance(c, str) for c in columns):
+        return None
+    out = []
+    for c in columns:
+        if isinstance(c, (bool, np.bool_)):
+            out.append(["bool", bool(c)])
+        elif isinstance(c, (int, np.integer)):
+            out.append(["int", int(c)])
+        elif isinstance(c, (float, np.floating)):
+            out.append(["float", float(c)])
+        elif isinstance(c, pd.Timestamp):
+            out.append(["timestamp", c.isoformat()])
+        elif isinstance(c, datetime):
+            out.append(["datetime", c.isoformat()])
+        else:
+            out.append(["str", str(c)])
+    return json.dumps(out).encode("utf-8")
+
+def _decode_labels(raw):
+    conv = {"bool": bool, "int": int, "float": float, "timestamp": pd.Timestamp,
+            "datetime": datetime.fromisoformat, "str": str}
+    return [conv[kind](value) for kind, value in json.loads(raw)]
+
+def _write_sheet_cache(df, path):
+    table = pa.Table.from_pandas(df.set_axis([str(c) for c in df.columns], axis=1), preserve_index=False)
+    labels = _encode_labels(df.columns)
+    if labels is not None:
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), _LABELS_KEY: labels})
+    tmp = path + f".{os.getpid()}.tmp"
+    feather.write_feather(table, tmp)
+    os.replace(tmp, path)
+
+def _read_sheet_cache(path):
+    table = feather.read_table(path, memory_map=True)
+    df = table.to_pandas()
+    labels = (table.schema.metadata or {}).get(_LABELS_KEY)
+    if labels is not None:
+        df.columns = _decode_labels(labels)
+    return df
+
+def _parse_sheet(data, sheet):
+    engine = _excel_engine()
+    try:
+        return pd.read_excel(io.BytesIO(data), sheet_name=sheet, engine=engine)
+    except ValueError:
+        if engine is None:
+            raise
+        return pd.read_excel(io.BytesIO(data), sheet_name=sheet)
+
+def _load_or_parse_sheet(data, workbook_hash, sheet, cache_dir):
+    """(DataFrame, cache hit) for one sheet."""
+    path = _sheet_cache_path(workbook_hash, sheet, cache_dir) if PYARROW_AVAILABLE else None
+    if path and os.path.exists(path):
+        with span("ingest.excel_cache_read", sheet=str(sheet)) as sp:
+            try:
+                df = _read_sheet_cache(path)
+                sp.set(cache_hit=True, rows=int(df.shape[0]), cols=int(df.shape[1]))
+                return df, True
+            except Exception as e:
+                # unreadable cache entry: re-parse and overwrite
+                sp.set(cache_hit=False, error=type(e).__name__)
+    with span("ingest.excel_parse", sheet=str(sheet), engine=_excel_engine() or "default", cache_hit=False) as sp:
+        df = _parse_sheet(data, sheet).reset_index(drop=True)
+        sp.set(rows=int(df.shape[0]), cols=int(df.shape[1]))
+    if path:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write_sheet_cache(df, path)
+        except Exception:
+            pass  # e.g. mixed-type object column Arrow can't represent; just skip caching
+    return df, False
+
+def _dir_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+def prune_excel_cache(cache_dir=None, max_bytes=EXCEL_CACHE_MB * 1024 * 1024, keep=()):
+    """Delete least recently used workbook caches until the directory fits max_bytes. Returns bytes freed."""
+    cache_dir = cache_dir or EXCEL_CACHE_DIR
+    try:
+        names = [n for n in os.listdir(cache_dir) if os.path.isdir(os.path.join(cache_dir, n))]
+    except FileNotFoundError:
+        return 0
+    workbooks = [(os.path.getmtime(os.path.join(cache_dir, n)), n, _dir_bytes(os.path.join(cache_dir, n))) for n in names]
+    total = sum(b for _, _, b in workbooks)
+    freed = 0
+    for _, name, size in sorted(workbooks):
+        if total <= max_bytes:
+            break
+        if name in keep:
+            continue
+        shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+        total -= size
+        freed += size
+    return freed
+
+def read_excel_sheets(file, sheets=None, cache_dir=None):
+    """
+    Parse workbook sheets into DataFrames, in parallel. sheets: list of names/indices
+    (default: all sheets). Each sheet is converted once into an Arrow IPC (Feather)
+    file keyed by the workbook's content hash, so re-opening the same workbook only
+    memory-maps the cached columns. Returns {sheet: DataFrame} in the requested order.
+    """
+    data = file if isinstance(file, bytes) else _file_bytes(file)
+    cache_dir = cache_dir or EXCEL_CACHE_DIR
+    workbook_hash = hashlib.blake2b(data, digest_size=16).hexdigest()
+    if sheets is None:
+        sheets = list_excel_sheets(data)
+    sheets = list(sheets)
+    with span("ingest.excel", sheets=len(sheets), workbook_bytes=len(data)) as sp:
+        if len(sheets) == 1:
+            results = [_load_or_parse_sheet(data, workbook_hash, sheets[0], cache_dir)]
+        else:
+            with ThreadPoolExecutor(max_workers=min(EXCEL_MAX_WORKERS, len(sheets))) as pool:
+                futures = [pool.submit(in_current_context(_load_or_parse_sheet), data, workbook_hash, s, cache_dir)
+                           for s in sheets]
+                results = [f.result() for f in futures]
+        hits = sum(1 for _, hit in results if hit)
+        sp.set(cache_hits=hits)
+        if PYARROW_AVAILABLE:
+            wb_dir = os.path.join(cache_dir, workbook_hash)
+            if hits == len(results):
+                try:
+                    os.utime(wb_dir)      # mark as recently used for pruning
+                except OSError:
+                    pass
+            else:
+                prune_excel_cache(cache_dir, keep=(workbook_hash,))
+    return dict(zip(sheets, (df for df, _ in results)))
+
+def stack_sheets(frames, column="sheet"):
+    """
+    Stack {sheet: DataFrame} into one frame with each row's sheet name in `column`. If a
+    sheet already has a column of that name it is kept, and the new one gets a suffix
+    (sheet_1, sheet_2, ...).
+    """
+    taken = {str(c) for f in frames.values() for c in f.columns}
+    name, i = column, 1
+    while name in taken:
+        name, i = f"{column}_{i}", i + 1
+    return pd.concat([f.assign(**{name: str(s)}) for s, f in frames.items()], ignore_index=True)
+
+def dataframe_fingerprint(df):
+    """Content hash of a frame (schema + values); stable key for per-dataset caches."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((tuple(map(str, df.columns)), tuple(map(str, df.dtypes)), df.shape)).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+# ---------- ingest-time memory optimization ----------
+
+def _downcast_float(s, float_precision):
+    if float_precision == "float32":
+        return s.astype(np.float32)
+    # "exact": only downcast when every value round-trips through float32 unchanged
+    s32 = s.astype(np.float32)
+    if np.array_equal(s32.to_numpy(dtype=np.float64), s.to_numpy(dtype=np.float64), equal_nan=True):
+        return s32
+    return s
+
+def _optimize_column(s, float_precision):
+    if isinstance(s.dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(s.dtype):
+        return s
+    if pd.api.types.is_integer_dtype(s.dtype):
+        # int32 at the narrowest, and signed: snippet arithmetic wraps silently in narrow or
+        # unsigned types (int8 120 * 2 == -16, uint8 3 - 5 == 254)
+        if (s.dtype.kind == "i" and s.dtype.itemsize <= 4) or not len(s):
+            return s
+        lo, hi = s.min(), s.max()
+        if pd.isna(lo) or lo < INT32.min or hi > INT32.max:
+            return s
+        return s.astype("Int32" if isinstance(s.dtype, pd.api.extensions.ExtensionDtype) else np.int32)
+    if pd.api.types.is_float_dtype(s.dtype):
+        return _downcast_float(s, float_precision)
+    if s.dtype == object or pd.api.types.is_string_dtype(s.dtype):
+        # only treat as text if the values really are strings (mixed objects stay as-is)
+        non_null = s.dropna()
+        if not len(non_null) or pd.api.types.infer_dtype(non_null, skipna=True) != "string":
+            return s
+        n_unique = non_null.nunique()
+        if n_unique <= CATEGORY_MAX_UNIQUE and n_unique / len(s) <= CATEGORY_MAX_RATIO:
+            return s.astype("category")
+        if PYARROW_AVAILABLE:
+            return s.astype("string[pyarrow]")
+    return s
+
+def optimize_dtypes(df, float_precision="exact"):
+    """
+    Shrink a freshly ingested frame: downcast ints to int32 where they fit (never narrower)
+    and floats where lossless, turn low-cardinality strings into categoricals and other
+    strings into Arrow-backed strings. Returns (optimized_df, report) where report is a
+    list of per-column dicts {column, dtype_before, dtype_after, bytes_before, bytes_after}.
+    float_precision: "exact" (never lose precision) or "float32" (always downcast floats).
+    """
+    with span("ingest.optimize_dtypes", rows=int(df.shape[0]), cols=int(df.shape[1])) as sp:
+        before = df.memory_usage(deep=True, index=False)
+        cols = []
+        for i in range(df.shape[1]):
+            s = df.iloc[:, i]
+            try:
+                cols.append(_optimize_column(s, float_precision))
+            except Exception:
+                cols.append(s)
+        opt = pd.concat(cols, axis=1) if cols else df.copy()
+        opt.columns = df.columns
+        after = opt.memory_usage(deep=True, index=False)
+        report = [{
+            "column": str(df.columns[i]),
+            "dtype_before": str(df.dtypes.iloc[i]),
+            "dtype_after": str(opt.dtypes.iloc[i]),
+            "bytes_before": int(before.iloc[i]),
+            "bytes_after": int(after.iloc[i]),
+        } for i in range(df.shape[1])]
+        sp.set(bytes_before=int(before.sum()), bytes_after=int(after.sum()))
+        return opt, report
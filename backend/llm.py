@@ -0,0 +1,217 @@
+# LLM provider layer: one shared client per process with rate limiting, bounded
+# concurrency, retries with jittered exponential backoff and request timeouts.
+#
+#   LLM_PROVIDER=gemini|fake      default: gemini (needs GOOGLE_API_KEY)
+#   LLM_MODEL=gemini-1.5-flash-latest
+#   LLM_RATE_PER_MIN=60           token bucket refill rate (requests/minute), LLM_BURST=10
+#   LLM_MAX_CONCURRENCY=4         in-flight requests across all sessions
+#   LLM_MAX_RETRIES=4             retries on quota/transient errors
+#   LLM_TIMEOUT_S=60              per-request timeout
+#   FAKE_LLM_LATENCY_MS=0         simulated latency of the fake provider
+#
+# The fake provider is deterministic (answers depend only on the prompt) and needs no
+# network, for load tests and CI.
+
+import os, re, json, time, random, hashlib, threading
+
+from tracing import span
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini").lower()
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-1.5-flash-latest")
+LLM_RATE_PER_MIN = float(os.getenv("LLM_RATE_PER_MIN", "60"))
+LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "60"))
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "0"))
+
+BACKOFF_BASE_S = 1.0
+BACKOFF_MAX_S = 30.0
+COUNT_TOKENS_TIMEOUT_S = 10.0   # prompt-size checks fall back to estimates rather than wait long
+
+# status codes / exception names worth retrying (quota, overload, transient network)
+_RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+_RETRYABLE_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+                    "InternalServerError", "GatewayTimeout", "Timeout", "TimeoutError", "ConnectionError"}
+
+
+class LLMError(Exception):
+    pass
+
+class LLMUnavailable(LLMError):
+    """No usable provider (e.g. missing API key); never retried."""
+
+
+class LLMResponse:
+    __slots__ = ("text", "provider", "attempts")
+
+    def __init__(self, text, provider=None, attempts=1):
+        self.text = text
+        self.provider = provider
+        self.attempts = attempts
+
+
+def is_retryable(exc):
+    if isinstance(exc, LLMUnavailable):
+        return False
+    code = getattr(exc, "code", None)
+    code = code() if callable(code) else code
+    if isinstance(code, int) and code in _RETRYABLE_CODES:
+        return True
+    return any(cls.__name__ in _RETRYABLE_NAMES for cls in type(exc).__mro__)
+
+
+# ---------- providers ----------
+class GeminiProvider:
+    name = "gemini"
+
+    def __init__(self, api_key, model_name=LLM_MODEL):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self._model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt, json_mode=False, timeout=LLM_TIMEOUT_S):
+        kwargs = {"request_options": {"timeout": timeout}}
+        if json_mode:
+            kwargs["generation_config"] = {"response_mime_type": "application/json"}
+        try:
+            return self._model.generate_content(prompt, **kwargs).text
+        except (TypeError, ValueError):
+            if not json_mode:
+                raise
+            # older SDKs/models without JSON mode: the prompt itself asks for JSON
+            return self._model.generate_content(prompt, request_options={"timeout": timeout}).text
+
+    def count_tokens(self, text, timeout=COUNT_TOKENS_TIMEOUT_S):
+        return self._model.count_tokens(text, request_options={"timeout": timeout}).total_tokens
+
+
+class UnavailableProvider:
+    name = "unavailable"
+
+    def __init__(self, reason):
+        self.reason = reason
+
+    def generate(self, prompt, json_mode=False, timeout=LLM_TIMEOUT_S):
+        raise LLMUnavailable(self.reason)
+
+
+class FakeProvider:
+    """Deterministic offline stand-in: the same prompt always gets the same answer."""
+    name = "fake"
+
+    def __init__(self, latency_ms=FAKE_LLM_LATENCY_MS):
+        self.latency_ms = latency_ms
+
+    def generate(self, prompt, json_mode=False, timeout=LLM_TIMEOUT_S):
+        if self.latency_ms:
+            time.sleep(min(timeout, self.latency_ms / 1000.0))
+        digest = hashlib.blake2b(prompt.encode("utf-8"), digest_size=4).hexdigest()
+        if json_mode or '{"slides"' in prompt:
+            m = re.search(r"Exactly (\d+) slides", prompt)
+            n = int(m.group(1)) if m else 3
+            slides = [{"title": f"Finding {i + 1}",
+                       "bullets": [f"Observation {i + 1}.1 ({digest})", f"Observation {i + 1}.2"],
+                       "code": "" if i == 0 else
+                       f"num = df.select_dtypes('number')\nnum.iloc[:, {(i - 1)} % max(1, num.shape[1])].plot(kind='hist')"}
+                      for i in range(n)]
+            return json.dumps({"slides": slides})
+        return (f"Fake analysis {digest}. The dataset was summarised.\n\n"
+                "```python\nprint(df.describe())\n```")
+
+
+def make_provider(name=LLM_PROVIDER, api_key=None):
+    if name == "fake":
+        return FakeProvider()
+    if name == "gemini":
+        api_key = api_key or os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            return UnavailableProvider("Missing GOOGLE_API_KEY in .env. Add GOOGLE_API_KEY=... and restart "
+                                       "(or set LLM_PROVIDER=fake for offline use).")
+        return GeminiProvider(api_key)
+    return UnavailableProvider(f"Unknown LLM_PROVIDER {name!r}.")
+
+
+# ---------- client ----------
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens/second, at most `capacity` stored."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._t = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Take one token, waiting up to `timeout` seconds. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._t) * self.rate)
+                self._t = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate if self.rate > 0 else 1.0
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class LLMClient:
+    """Shared by all sessions of a process so limits apply to the process as a whole."""
+
+    def __init__(self, provider, rate_per_min=LLM_RATE_PER_MIN, burst=LLM_BURST,
+                 max_concurrency=LLM_MAX_CONCURRENCY, max_retries=LLM_MAX_RETRIES, timeout_s=LLM_TIMEOUT_S):
+        self.provider = provider
+        self.bucket = TokenBucket(rate_per_min / 60.0, burst)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.max_retries = max_retries
+        self.timeout_s = timeout_s
+
+    @property
+    def available(self):
+        return not isinstance(self.provider, UnavailableProvider)
+
+    def count_tokens(self, text):
+        """Exact size of text in the provider's tokens, or None if it can't count (callers estimate)."""
+        counter = getattr(self.provider, "count_tokens", None)
+        if counter is None:
+            return None
+        with span("llm.count_tokens", provider=self.provider.name, chars=len(text)) as sp:
+            try:
+                n = int(counter(text, timeout=min(self.timeout_s, COUNT_TOKENS_TIMEOUT_S)))
+            except Exception as e:
+                sp.set(error=type(e).__name__)
+                return None
+            sp.set(tokens=n)
+            return n
+
+    def generate(self, prompt, json_mode=False):
+        """Text completion with rate limiting and retries. Raises LLMError when it gives up."""
+        with span("llm.call", provider=self.provider.name, json_mode=json_mode) as sp:
+            attempt = 0
+            while True:
+                if not self.bucket.acquire(timeout=self.timeout_s):
+                    raise LLMError("LLM rate limit: no request slot within the timeout.")
+                t_wait = time.perf_counter()
+                if not self._slots.acquire(timeout=self.timeout_s):
+                    raise LLMError("LLM busy: too many concurrent requests.")
+                try:
+                    sp.set(queue_ms=round((time.perf_counter() - t_wait) * 1000.0, 1))
+                    text = self.provider.generate(prompt, json_mode=json_mode, timeout=self.timeout_s)
+                    sp.set(attempts=attempt + 1)
+                    return LLMResponse(text, provider=self.provider.name, attempts=attempt + 1)
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        sp.set(attempts=attempt + 1)
+                        if isinstance(e, LLMError):
+                            raise
+                        raise LLMError(str(e)) from e
+                finally:
+                    self._slots.release()
+                # full jitter: spreads retries of many sessions hitting the same quota
+                time.sleep(random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt)))
+                attempt += 1
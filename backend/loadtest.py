@@ -0,0 +1,275 @@
+# Multi-session load test: drives N simulated users through the real Streamlit script.
+#
+# Each session is an AppTest instance (same script, session state and reruns as a browser
+# session) that uploads a dataset, runs the built-in stats, chats, runs the returned
+# snippet, inserts a slide and refreshes the preview. The LLM is the deterministic fake
+# provider and LibreOffice is replaced by a sleep of the given latency in front of the
+# local PIL renderer, so the numbers measure this server, not Gemini or soffice.
+# Reports throughput, p50/p95/p99 rerun latency per step and per-session memory.
+#
+#   python backend/loadtest.py                                  # 8 sessions, 4 at a time
+#   python backend/loadtest.py --sessions 50 --concurrency 20 --llm-latency-ms 800 --soffice-ms 1500
+#   python backend/loadtest.py --rounds 3 --out load.json --max-p95-ms 4000
+#
+# AppTest has no file-upload widget, so "upload" runs the real ingest path (parse, dtype
+# optimization, fingerprint) and hands the frame to the session before its first rerun.
+#
+# Every AppTest run installs itself as the process-wide Streamlit Runtime, so two in one
+# process break each other. Sessions therefore run in --concurrency worker processes (one
+# session at a time each); sessions in the same worker share its cache_resource singletons.
+
+import argparse, io, json, os, shutil, sys, tempfile, time
+import multiprocessing as mp
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "testing.py")
+STEPS = ["upload", "builtin_stats", "chat", "run_snippet", "insert_slide", "refresh_preview"]
+
+
+# ---------------------- environment ----------------------
+def configure_env(args, workdir):
+    """Must run before the app modules are imported: they read their settings at import time."""
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    # measure the server, not the (process-wide) Gemini quota
+    os.environ.setdefault("LLM_RATE_PER_MIN", str(args.llm_rate_per_min))
+    os.environ.setdefault("LLM_BURST", str(max(1, args.sessions)))
+    os.environ.setdefault("LLM_MAX_CONCURRENCY", str(max(1, args.concurrency)))
+    for var, sub in (("SESSIONS_DIR", "sessions"), ("HISTORY_DIR", "datasets"), ("TRACE_DIR", "traces"),
+                     ("SESSION_SPILL_DIR", "spill")):
+        os.environ.setdefault(var, os.path.join(workdir, sub))
+    if not args.persist:
+        os.environ["SESSION_PERSIST"] = "0"
+
+def stub_soffice(latency_ms):
+    """Replace the soffice conversion with a fixed delay in front of the local PIL renderer."""
+    import slides
+    real = slides.generate_live_preview_images
+    slides.SOFFICE_OK = False
+
+    def generate_live_preview_images(prs, plot_paths=()):
+        time.sleep(latency_ms / 1000.0)
+        return real(prs, plot_paths=plot_paths)
+
+    slides.generate_live_preview_images = generate_live_preview_images
+
+def rss_mb():
+    """Current resident set size; peak RSS when psutil is not installed."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1e6
+    except Exception:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3   # KB on Linux
+
+
+# ---------------------- per-session footprint ----------------------
+def session_nbytes(at):
+    try:
+        state = at.session_state.to_dict()
+    except Exception:
+        return None
+    from session_memory import nbytes
+    return sum(nbytes(v) for v in state.values())
+
+
+# ---------------------- one simulated user ----------------------
+class Session:
+    def __init__(self, idx, csv_bytes, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.idx = idx
+        self.csv_bytes = csv_bytes
+        self.at = AppTest.from_file(SCRIPT, default_timeout=timeout)
+        self.samples = []          # (step, seconds, error or None)
+        self.nbytes = None
+
+    def _step(self, name, fn):
+        t0 = time.perf_counter()
+        err = None
+        try:
+            fn()
+            if self.at.exception:
+                err = str(self.at.exception[0].message)[:200]
+        except Exception as e:
+            err = f"{type(e).__name__}: {e}"[:200]
+        self.samples.append((name, time.perf_counter() - t0, err))
+
+    def _button(self, label):
+        for b in self.at.button:
+            if b.label == label:
+                return b
+        raise LookupError(f"button {label!r} not rendered")
+
+    def upload(self):
+        from ingest import read_table_auto, optimize_dtypes, dataframe_fingerprint
+        df, report = optimize_dtypes(read_table_auto(io.BytesIO(self.csv_bytes), "loadtest.csv"))
+        state = self.at.session_state
+        state["df"], state["df_memory_report"] = df, report
+        state["df_fingerprint"] = dataframe_fingerprint(df)
+        state["df_name"] = "loadtest.csv"
+        state["df_upload_key"] = ("loadtest.csv", len(self.csv_bytes), f"loadtest-{self.idx}", None)
+        self.at.run()
+
+    def builtin_stats(self):
+        toggles = [t for t in self.at.toggle if t.key == "progressive_on"]
+        if toggles:
+            toggles[0].set_value(False)
+        self._button("Run built-in stats & correlation").click().run()
+
+    def chat(self, round_no):
+        self.at.chat_input[0].set_value(f"Summarise the main drivers (round {round_no}).").run()
+
+    def run_snippet(self):
+        runs = [b for b in self.at.button if (b.key or "").startswith("run_")]
+        if not runs:
+            raise LookupError("no snippet button rendered")
+        runs[-1].click().run()
+
+    def insert_slide(self, round_no):
+        self.at.text_input(key="slide_title_input").input(f"Load test slide {round_no}")
+        self.at.text_area(key="slide_text_area").input("• Finding one\n• Finding two\n• Next steps")
+        self.at.button(key="insert_slide").click().run()
+
+    def refresh_preview(self):
+        self.at.button(key="manual_refresh").click().run()
+
+    def run(self, rounds):
+        self._step("upload", self.upload)
+        self._step("builtin_stats", self.builtin_stats)
+        for r in range(1, rounds + 1):
+            self._step("chat", lambda: self.chat(r))
+            self._step("run_snippet", self.run_snippet)
+            self._step("insert_slide", lambda: self.insert_slide(r))
+            self._step("refresh_preview", self.refresh_preview)
+        self.nbytes = session_nbytes(self.at)
+        return self
+
+
+# ---------------------- worker processes ----------------------
+_worker = {}
+
+def _init_worker(args, csv_bytes, ready):
+    """Warm up once per process (imports, script compile, singletons), then wait for the others."""
+    stub_soffice(args.soffice_ms)
+    _worker.update(args=args, csv_bytes=csv_bytes)
+    Session(-1, csv_bytes, args.timeout).run(rounds=1)
+    _worker["rss_warm"] = rss_mb()
+    ready.wait()
+
+def _run_session(i, t_start):
+    args = _worker["args"]
+    if args.ramp_s:
+        delay = t_start + args.ramp_s * i / max(1, args.sessions) - time.time()
+        if delay > 0:
+            time.sleep(delay)
+    sess = Session(i, _worker["csv_bytes"], args.timeout).run(args.rounds)
+    return {"samples": sess.samples, "nbytes": sess.nbytes, "pid": os.getpid(),
+            "rss_warm": _worker["rss_warm"], "rss": rss_mb()}
+
+
+# ---------------------- report ----------------------
+def percentiles(values, qs=(50, 95, 99)):
+    import numpy as np
+    if not values:
+        return {f"p{q}": None for q in qs}
+    arr = np.asarray(values, dtype=np.float64) * 1000.0
+    return {f"p{q}": round(float(np.percentile(arr, q)), 1) for q in qs}
+
+def summarize(sessions, wall_s):
+    samples = [s for sess in sessions for s in sess["samples"]]
+    steps = {}
+    for name in STEPS + sorted({n for n, _, _ in samples} - set(STEPS)):
+        times = [t for n, t, _ in samples if n == name]
+        if not times:
+            continue
+        steps[name] = {"count": len(times), **percentiles(times),
+                       "max": round(max(times) * 1000.0, 1),
+                       "errors": sum(1 for n, _, e in samples if n == name and e)}
+    sizes = sorted(s["nbytes"] for s in sessions if s["nbytes"] is not None)
+    workers = {}                   # pid -> (RSS after warm-up, highest RSS after a session)
+    for sess in sessions:
+        warm, peak = workers.get(sess["pid"], (sess["rss_warm"], 0.0))
+        workers[sess["pid"]] = (warm, max(peak, sess["rss"]))
+    rss_before = sum(w for w, _ in workers.values())
+    rss_after = sum(r for _, r in workers.values())
+    return {
+        "sessions": len(sessions),
+        "reruns": len(samples),
+        "wall_s": round(wall_s, 2),
+        "throughput_reruns_per_s": round(len(samples) / wall_s, 2) if wall_s else None,
+        "overall": {**percentiles([t for _, t, _ in samples]), "errors": sum(1 for *_, e in samples if e)},
+        "steps": steps,
+        "session_state_mb": {"median": round(sizes[len(sizes) // 2] / 1e6, 2) if sizes else None,
+                             "max": round(sizes[-1] / 1e6, 2) if sizes else None},
+        "workers": len(workers),
+        "rss_mb": {"before": round(rss_before, 1), "after": round(rss_after, 1),
+                   "per_session": round((rss_after - rss_before) / max(1, len(sessions)), 2)},
+        "first_errors": sorted({e for *_, e in samples if e})[:5],
+    }
+
+def print_report(res):
+    print(f"{res['sessions']} sessions, {res['reruns']} reruns in {res['wall_s']} s "
+          f"-> {res['throughput_reruns_per_s']} reruns/s")
+    print(f"{'step':<18}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>8}")
+    rows = list(res["steps"].items()) + [("(all)", {"count": res["reruns"], "max": None, **res["overall"]})]
+    for name, s in rows:
+        fmt = lambda v: f"{v:>10.1f}" if v is not None else f"{'-':>10}"
+        print(f"{name:<18}{s['count']:>6}{fmt(s['p50'])}{fmt(s['p95'])}{fmt(s['p99'])}{fmt(s['max'])}{s['errors']:>8}")
+    mem = res["session_state_mb"]
+    print(f"session state: median {mem['median']} MB, max {mem['max']} MB per session")
+    print(f"RSS over {res['workers']} worker(s): {res['rss_mb']['before']} -> {res['rss_mb']['after']} MB "
+          f"(~{res['rss_mb']['per_session']} MB per session)")
+    for e in res["first_errors"]:
+        print(f"ERROR {e}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Drive N simulated sessions through the Streamlit app")
+    ap.add_argument("--sessions", type=int, default=8)
+    ap.add_argument("--concurrency", type=int, default=4, help="sessions running at the same time (worker processes)")
+    ap.add_argument("--rounds", type=int, default=1, help="chat/snippet/slide/preview cycles per session")
+    ap.add_argument("--rows", type=int, default=5_000)
+    ap.add_argument("--cols", type=int, default=8)
+    ap.add_argument("--llm-latency-ms", type=float, default=500.0, help="simulated model latency")
+    ap.add_argument("--llm-rate-per-min", type=float, default=100_000.0, help="LLM token bucket rate")
+    ap.add_argument("--soffice-ms", type=float, default=1000.0, help="simulated PPTX->PDF conversion time")
+    ap.add_argument("--ramp-s", type=float, default=0.0, help="spread session starts over this many seconds")
+    ap.add_argument("--timeout", type=float, default=120.0, help="per-rerun timeout (s)")
+    ap.add_argument("--persist", action="store_true", help="keep session persistence on (writes event logs)")
+    ap.add_argument("--out", default=None, help="write results JSON here")
+    ap.add_argument("--max-p95-ms", type=float, default=None, help="exit 1 if the overall p95 exceeds this")
+    args = ap.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="loadtest_")
+    configure_env(args, workdir)
+    try:
+        from bench import make_dataset
+        csv_bytes = make_dataset(args.rows, args.cols).to_csv(index=False).encode("utf-8")
+        n_workers = max(1, min(args.concurrency, args.sessions))
+        # by module name: AppTest replaces __main__ in the workers with the app script
+        from loadtest import _init_worker, _run_session
+        # spawn: workers import the app fresh instead of inheriting this process's state
+        ctx = mp.get_context("spawn")
+        ready = ctx.Barrier(n_workers + 1)
+        with ctx.Pool(n_workers, initializer=_init_worker, initargs=(args, csv_bytes, ready)) as pool:
+            # warm-up sessions run outside the measurement; a worker that fails to start breaks the barrier
+            ready.wait(timeout=3 * args.timeout)
+            t_start = time.time()
+            sessions = pool.starmap(_run_session, [(i, t_start) for i in range(args.sessions)], chunksize=1)
+            wall = time.time() - t_start
+        res = summarize(sessions, wall)
+        res["config"] = {k: v for k, v in vars(args).items() if k != "out"}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(res)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=2, sort_keys=True)
+    if args.max_p95_ms is not None and (res["overall"]["p95"] or 0) > args.max_p95_ms:
+        print(f"FAIL overall p95 {res['overall']['p95']} ms > {args.max_p95_ms} ms")
+        return 1
+    return 1 if res["overall"]["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+# Progressive approximate analytics for large frames.
+#
+# An analysis is first run on a small random sample and shown with confidence intervals,
+# then re-run on growing nested samples (first rows of one random permutation, so every
+# stage extends the previous one) until the last stage covers the full frame. Intervals
+# use the finite population correction, so they shrink to zero width exactly when the
+# sample is the whole dataset and the final numbers are the exact ones. The exact stage
+# also carries the inferential output of the non-progressive path (correlation p-values,
+# regression standard errors, p-values and model summary), which treat the data as a sample.
+#
+#   PROGRESSIVE_MIN_ROWS=200000   frames smaller than this are analysed exactly right away
+#   PROGRESSIVE_FIRST_ROWS=20000  size of the first sample
+
+import os, time, threading
+
+import numpy as np
+import pandas as pd
+
+from analysis import stats, run_hypothesis_tests, run_regression, auto_select_dependent, _is_text_like
+
+PROGRESSIVE_MIN_ROWS = int(os.getenv("PROGRESSIVE_MIN_ROWS", "200000"))
+FIRST_SAMPLE_ROWS = int(os.getenv("PROGRESSIVE_FIRST_ROWS", "20000"))
+GROWTH = 4
+Z = 1.96                       # 95% intervals
+
+
+def sample_sizes(n_total, first=FIRST_SAMPLE_ROWS, growth=GROWTH):
+    """Geometric stage sizes ending with n_total."""
+    sizes, n = [], first
+    while n < n_total:
+        sizes.append(n)
+        n *= growth
+    return sizes + [n_total]
+
+def sample_order(df, seed=0, stratify=None):
+    """
+    Row positions in sampling order: every prefix is a uniform random sample, or with
+    `stratify` a proportionally stratified one (each group spread evenly over the order).
+    """
+    n = len(df)
+    rng = np.random.default_rng(seed)
+    if stratify is None:
+        return rng.permutation(n)
+    codes = pd.factorize(df[stratify], use_na_sentinel=False)[0]
+    u = rng.random(n)
+    by_group = np.lexsort((u, codes))                   # shuffled within each group
+    sizes = np.bincount(codes)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rank = np.empty(n)
+    rank[by_group] = np.arange(n) - np.repeat(starts, sizes)
+    # position of each row within its group, as a fraction of that group
+    frac = (rank + u) / sizes[codes]
+    return np.argsort(frac, kind="stable")
+
+def _fpc(n, n_total):
+    return np.sqrt(max(0.0, (n_total - n) / max(1, n_total - 1)))
+
+
+# ---------- estimators: fn(sample, n_total) -> result ----------
+def estimate_describe(sample, n_total):
+    """Per numeric column: mean with CI, std, quartiles (sample estimates)."""
+    num = sample.select_dtypes(include="number")
+    cnt = num.count()
+    mean = num.mean()
+    std = num.std()
+    half = Z * std / np.sqrt(cnt.clip(lower=1)) * _fpc(len(sample), n_total)
+    q = num.quantile([0.25, 0.5, 0.75])
+    return pd.DataFrame({
+        "mean": mean, "mean_ci_low": mean - half, "mean_ci_high": mean + half, "std": std,
+        "25%": q.loc[0.25], "50%": q.loc[0.5], "75%": q.loc[0.75], "min": num.min(), "max": num.max(),
+        "non_null (est.)": (cnt * (n_total / max(1, len(sample)))).round().astype("int64"),
+    })
+
+def estimate_corr(sample, n_total):
+    """Pearson r matrix with Fisher-z 95% intervals (pairwise complete observations)."""
+    num = sample.select_dtypes(include="number")
+    r = num.corr()
+    present = num.notna().to_numpy(dtype=np.float64)
+    pairs = pd.DataFrame(present.T @ present, index=r.index, columns=r.columns)
+    zr = np.arctanh(r.clip(-0.999999, 0.999999))
+    se = 1.0 / np.sqrt((pairs - 3).clip(lower=1)) * _fpc(len(sample), n_total)
+    out = {"corr": r, "ci_low": np.tanh(zr - Z * se), "ci_high": np.tanh(zr + Z * se)}
+    if len(sample) >= n_total and stats:
+        # two-sided test of r = 0, as scipy.stats.pearsonr computes it
+        dof = (pairs - 2).where(pairs > 2)
+        t = r * np.sqrt(dof / (1.0 - r.clip(-1, 1) ** 2).clip(lower=1e-300))
+        out["pvalues"] = pd.DataFrame(2 * stats.t.sf(np.abs(t.to_numpy(dtype=np.float64)), dof.to_numpy(dtype=np.float64)),
+                                      index=r.index, columns=r.columns)
+    return out
+
+def estimate_regression(sample, n_total, dep=None):
+    """OLS of dep on the other numeric columns: coefficients with standard errors and CIs."""
+    num = sample.select_dtypes(include="number").dropna()
+    dep = dep or auto_select_dependent(num)
+    if dep is None or dep not in num.columns:
+        return {"error": "No numeric dependent variable found."}
+    X = num.drop(columns=[dep])
+    if X.shape[1] == 0:
+        return {"error": "No independent numeric columns found for regression."}
+    names = ["const"] + list(X.columns)
+    A = np.column_stack([np.ones(len(X)), X.to_numpy(dtype=np.float64)])
+    y = num[dep].to_numpy(dtype=np.float64)
+    if len(y) <= A.shape[1]:
+        return {"error": "Not enough complete rows for regression."}
+    coef, *_ = np.linalg.lstsq(A, y, rcond=None)
+    resid = y - A @ coef
+    dof = len(y) - A.shape[1]
+    sigma2 = float(resid @ resid) / dof
+    cov = sigma2 * np.linalg.pinv(A.T @ A)
+    se_model = np.sqrt(np.clip(np.diag(cov), 0, None))
+    se = se_model * _fpc(len(sample), n_total)
+    ss_tot = float(((y - y.mean()) ** 2).sum())
+    table = pd.DataFrame({"coef": coef, "std_err": se, "ci_low": coef - Z * se, "ci_high": coef + Z * se}, index=names)
+    out = {"dependent": dep, "rsquared": 1.0 - float(resid @ resid) / ss_tot if ss_tot else None, "params": table}
+    if len(sample) >= n_total:
+        # exact stage: model-based inference, same as the non-progressive run_regression
+        table["std_err"] = se_model
+        table["ci_low"], table["ci_high"] = coef - Z * se_model, coef + Z * se_model
+        if stats:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                table["p_value"] = 2 * stats.t.sf(np.abs(coef / se_model), dof)
+        summary = run_regression(sample, dep=dep).get("summary")
+        if summary:
+            out["summary"] = summary
+    return out
+
+def grouping_column(df):
+    """The grouping column run_hypothesis_tests would pick (used to stratify its samples)."""
+    cats = [c for c in df.columns if _is_text_like(df[c].dtype) and df[c].nunique() < 10]
+    if not cats:
+        cats = [c for c in df.columns if pd.api.types.is_integer_dtype(df[c].dtype) and df[c].nunique() < 10]
+    return cats[0] if cats else None
+
+def estimate_hypothesis(sample, n_total, group_col=None):
+    """run_hypothesis_tests on the sample, plus group means with CIs for the tested column."""
+    out = run_hypothesis_tests(sample)
+    test = out.get("t_test") or out.get("anova")
+    if test and group_col is not None and group_col in sample.columns:
+        g = sample.groupby(group_col, observed=True)[test["column"]].agg(["count", "mean", "std"])
+        half = Z * g["std"] / np.sqrt(g["count"].clip(lower=1)) * _fpc(len(sample), n_total)
+        out["group_means"] = {str(k): {"mean": float(m), "ci_low": float(m - h), "ci_high": float(m + h)}
+                              for k, m, h in zip(g.index, g["mean"], half)}
+    return out
+
+
+class ProgressiveJob:
+    """Runs fn over growing samples of df in a daemon thread; `latest` holds the newest stage."""
+
+    def __init__(self, fn, df, stratify=None, seed=0, first=FIRST_SAMPLE_ROWS):
+        self.fn = fn
+        self.n_total = len(df)
+        self.sizes = sample_sizes(self.n_total, first=first)
+        self.latest = None        # {"n", "n_total", "exact", "result", "seconds"}
+        self.error = None
+        self.done = False
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(df, stratify, seed), daemon=True)
+        self._thread.start()
+
+    def _run(self, df, stratify, seed):
+        try:
+            order = sample_order(df, seed=seed, stratify=stratify) if len(self.sizes) > 1 else None
+            for n in self.sizes:
+                if self._cancel.is_set():
+                    return
+                t0 = time.perf_counter()
+                sample = df if n >= self.n_total else df.take(np.sort(order[:n]))
+                result = self.fn(sample, self.n_total)
+                self.latest = {"n": n, "n_total": self.n_total, "exact": n >= self.n_total,
+                               "result": result, "seconds": time.perf_counter() - t0}
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.done = True
+
+    def cancel(self):
+        self._cancel.set()
+
+    def wait_first(self, timeout=None):
+        """Block until the first stage (or an error) is available; keep timeout short on the UI thread."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.latest is None and not self.done:
+            if deadline is not None and time.monotonic() > deadline:
+                break
+            time.sleep(0.02)
+        return self.latest
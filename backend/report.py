@@ -0,0 +1,92 @@
+# PDF report export (reportlab or pillow fallback).
+
+import io, os, tempfile
+
+from PIL import Image, ImageDraw, ImageFont
+
+from tracing import span
+
+try:
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    REPORTLAB_AVAILABLE = True
+except Exception:
+    REPORTLAB_AVAILABLE = False
+
+
+def generate_pdf_report(text_blocks, image_paths, out_path=None, title="AI Report"):
+    with span("export.pdf_report", text_chars=sum(len(b) for b in text_blocks), images=len(image_paths)) as sp:
+        out_path = _generate_pdf_report(text_blocks, image_paths, out_path=out_path, title=title)
+        sp.set(pdf_bytes=os.path.getsize(out_path))
+        return out_path
+
+def generate_pdf_bytes(text_blocks, image_paths, title="AI Report"):
+    """Same report as generate_pdf_report, built in memory (no temp file)."""
+    with span("export.pdf_report", text_chars=sum(len(b) for b in text_blocks), images=len(image_paths)) as sp:
+        buf = io.BytesIO()
+        _generate_pdf_report(text_blocks, image_paths, out_path=buf, title=title)
+        data = buf.getvalue()
+        sp.set(pdf_bytes=len(data))
+        return data
+
+def _generate_pdf_report(text_blocks, image_paths, out_path=None, title="AI Report"):
+    if out_path is None:
+        out_path = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf").name
+    if REPORTLAB_AVAILABLE:
+        c = canvas.Canvas(out_path, pagesize=letter)
+        width, height = letter
+        # Title
+        c.setFont("Helvetica-Bold", 16)
+        c.drawString(36, height - 50, title)
+        y = height - 80
+        c.setFont("Helvetica", 10)
+        for block in text_blocks:
+            for line in block.splitlines():
+                if y < 80:
+                    c.showPage()
+                    y = height - 50
+                c.drawString(36, y, line[:120])
+                y -= 12
+            y -= 8
+        # images appended on new pages
+        for imgp in image_paths:
+            try:
+                c.showPage()
+                c.drawImage(imgp, 36, 72, width=width-72, preserveAspectRatio=True, anchor='c')
+            except Exception:
+                pass
+        c.save()
+        return out_path
+    else:
+        # Pillow fallback: make multipage PDF by converting images and text to images
+        pages = []
+        W, H = 1100, 1400
+        fnt = ImageFont.load_default()
+        # first page: text
+        img = Image.new("RGB", (W, H), color=(255,255,255))
+        d = ImageDraw.Draw(img)
+        y = 40
+        d.text((36, y), title, font=fnt, fill=(0,0,0))
+        y += 30
+        for block in text_blocks:
+            for line in block.splitlines():
+                d.text((36, y), line[:120], font=fnt, fill=(0,0,0))
+                y += 14
+                if y > H - 100:
+                    pages.append(img)
+                    img = Image.new("RGB", (W, H), color=(255,255,255))
+                    d = ImageDraw.Draw(img)
+                    y = 40
+        pages.append(img)
+        # image pages
+        for pth in image_paths:
+            try:
+                im = Image.open(pth).convert("RGB")
+                im.thumbnail((W-72, H-200))
+                bg = Image.new("RGB", (W, H), color=(255,255,255))
+                bg.paste(im, (36,100))
+                pages.append(bg)
+            except Exception:
+                pass
+        pages[0].save(out_path, format="PDF", save_all=True, append_images=pages[1:])
+        return out_path
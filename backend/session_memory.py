@@ -0,0 +1,417 @@
+# Per-session memory accounting with spill-to-disk and idle eviction.
+#
+# Every rerun reports its session's state to one process-wide accountant, which sizes
+# each key (memoized per object/version, so a rerun does not re-measure an unchanged
+# frame or deck). Large objects of cold sessions are moved to disk and replaced by a
+# Spilled placeholder that the owning session reloads at the start of its next rerun:
+#   DataFrame     -> Arrow IPC (pickle for frames Arrow can't round-trip)
+#   Presentation  -> .pptx
+#   old messages  -> messages.jsonl; the list keeps placeholders so indices stay stable
+#
+#   SESSION_MEMORY_MB=256        per-session budget: above it, old messages are archived
+#   SESSIONS_MEMORY_MB=2048      all sessions: above it, the least recently active idle sessions are spilled
+#   SESSION_SPILL_IDLE_S=60      a session is cold (spillable) after this long without a rerun
+#   SESSION_IDLE_TIMEOUT_S=1800  idle sessions are evicted (everything spillable goes to disk)
+#   SESSION_KEEP_MESSAGES=20     newest messages never archived
+#   SESSION_SPILL_DIR            default <tmp>/session_spill
+
+import os, sys, json, time, shutil, tempfile, threading, weakref
+
+from tracing import span
+
+try:
+    import pyarrow.feather as feather
+    PYARROW_AVAILABLE = True
+except Exception:
+    PYARROW_AVAILABLE = False
+
+SESSION_MEMORY_MB = float(os.getenv("SESSION_MEMORY_MB", "256"))
+SESSIONS_MEMORY_MB = float(os.getenv("SESSIONS_MEMORY_MB", "2048"))
+SESSION_SPILL_IDLE_S = float(os.getenv("SESSION_SPILL_IDLE_S", "60"))
+SESSION_IDLE_TIMEOUT_S = float(os.getenv("SESSION_IDLE_TIMEOUT_S", "1800"))
+SESSION_KEEP_MESSAGES = int(os.getenv("SESSION_KEEP_MESSAGES", "20"))
+SESSION_SPILL_DIR = os.getenv("SESSION_SPILL_DIR", os.path.join(tempfile.gettempdir(), "session_spill"))
+SWEEP_INTERVAL_S = 30
+STALE_RUN_S = 600              # a rerun "running" longer than this crashed without reporting its end
+
+
+# ---------- sizing ----------
+def deck_nbytes(prs):
+    """Bytes of a Presentation's parts (XML serialized, media as stored)."""
+    return sum(len(part.blob) for part in prs.part.package.iter_parts())
+
+def nbytes(value, _depth=0):
+    """Approximate bytes held by one session-state value."""
+    if type(value).__name__ == "DataFrame":
+        return int(value.memory_usage(deep=True).sum())
+    if type(value).__name__ == "Presentation":
+        return deck_nbytes(value)
+    if isinstance(value, Spilled):
+        return 0
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if _depth < 3 and isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(nbytes(v, _depth + 1) for v in value)
+    if _depth < 3 and isinstance(value, dict):
+        return sys.getsizeof(value) + sum(nbytes(k, _depth + 1) + nbytes(v, _depth + 1) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+# ---------- spilled values ----------
+class Spilled:
+    """Placeholder left in session state for a value moved to disk."""
+    __slots__ = ("kind", "path", "nbytes")
+
+    def __init__(self, kind, path, nbytes):
+        self.kind = kind
+        self.path = path
+        self.nbytes = nbytes
+
+    def load(self):
+        with span("memory.reload", kind=self.kind, bytes=self.nbytes):
+            if self.kind == "frame" and self.path.endswith(".arrow"):
+                # same dtypes as before the spill; writable, since the session may edit it in place
+                from history import table_to_frame
+                return table_to_frame(feather.read_table(self.path, memory_map=True), writable=True)
+            if self.kind == "frame":
+                import pandas as pd
+                return pd.read_pickle(self.path)
+            if self.kind == "deck":
+                from pptx import Presentation
+                return Presentation(self.path)
+        raise ValueError(f"unknown spilled kind {self.kind!r}")
+
+    def __repr__(self):
+        return f"Spilled({self.kind}, {self.nbytes / 1e6:.1f} MB)"
+
+
+def _arrow_safe(df):
+    import pandas as pd
+    return (PYARROW_AVAILABLE and isinstance(df.index, pd.RangeIndex) and df.index.start == 0
+            and df.index.step == 1 and all(isinstance(c, str) for c in df.columns))
+
+def spill_frame(df, path_base):
+    """Write df next to path_base (.arrow, or .pkl when Arrow can't round-trip it); returns the path."""
+    path = path_base + (".arrow" if _arrow_safe(df) else ".pkl")
+    if not os.path.exists(path):
+        tmp = path + ".tmp"
+        if path.endswith(".arrow"):
+            # uncompressed so the reload can memory-map without decoding
+            df.to_feather(tmp, compression="uncompressed")
+        else:
+            df.to_pickle(tmp)
+        os.replace(tmp, path)
+    return path
+
+def spill_deck(prs, path_base, lock=None):
+    path = path_base + ".pptx"
+    if not os.path.exists(path):
+        tmp = path + ".tmp"
+        if lock is None:
+            prs.save(tmp)
+        else:
+            with lock:
+                prs.save(tmp)
+        os.replace(tmp, path)
+    return path
+
+
+# ---------- archived messages ----------
+def is_archived(msg):
+    return "archived" in msg
+
+def load_message(msg):
+    """Content of a (possibly archived) message, read from disk without keeping it."""
+    if not is_archived(msg):
+        return msg["content"]
+    path, offset, length = msg["archived"]
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return json.loads(f.read(length).decode("utf-8"))["content"]
+
+def archive_messages(messages, upto, path):
+    """Move the content of messages[:upto] to the jsonl at path. Returns bytes archived."""
+    todo = [i for i in range(min(upto, len(messages))) if not is_archived(messages[i]) and messages[i]["content"]]
+    if not todo:
+        return 0
+    moved = 0
+    with open(path, "ab") as f:
+        for i in todo:
+            m = messages[i]
+            line = json.dumps({"role": m["role"], "content": m["content"]}).encode("utf-8")
+            offset = f.tell()
+            f.write(line + b"\n")
+            moved += len(m["content"])
+            # replace the dict (not mutate it): earlier references, e.g. a pending persistence sync, keep the text
+            messages[i] = {"role": m["role"], "content": "", "archived": (path, offset, len(line))}
+    return moved
+
+
+# ---------- accountant ----------
+class _Record:
+    def __init__(self, key, state_ref):
+        self.key = key
+        self.state_ref = state_ref      # () -> session state, or None when not shareable across threads
+        self.last_active = time.monotonic()
+        self.running = False
+        self.sizes = {}                 # key -> bytes at the end of the last rerun
+        self.memo = {}                  # key -> (id(value), token, bytes)
+        self.spilled_bytes = 0          # on disk right now
+        self.evicted = False
+        self.lock = threading.Lock()
+
+    @property
+    def total(self):
+        return sum(self.sizes.values())
+
+    def idle_s(self, now):
+        return now - self.last_active
+
+
+class MemoryAccountant:
+    """
+    Process-wide view of session memory. `spill` maps state keys to a kind ("frame" or
+    "deck"), `drop` names derived keys that hold references to spilled objects and are
+    rebuilt on demand, `locks` names the state key of a lock guarding a value (e.g. the
+    deck lock), and `archivable(state)` is how many leading messages may be archived.
+    """
+
+    def __init__(self, spill=None, drop=(), locks=None, archivable=None, on_evict=None,
+                 session_budget_mb=SESSION_MEMORY_MB, total_budget_mb=SESSIONS_MEMORY_MB,
+                 spill_idle_s=SESSION_SPILL_IDLE_S, idle_timeout_s=SESSION_IDLE_TIMEOUT_S,
+                 keep_messages=SESSION_KEEP_MESSAGES, root=SESSION_SPILL_DIR, sweep_interval_s=SWEEP_INTERVAL_S):
+        self.spill = dict(spill or {})
+        self.drop = tuple(drop)
+        self.locks = dict(locks or {})
+        self.archivable = archivable
+        self.on_evict = on_evict
+        self.session_budget = session_budget_mb * 1024 * 1024
+        self.total_budget = total_budget_mb * 1024 * 1024
+        self.spill_idle_s = spill_idle_s
+        self.idle_timeout_s = idle_timeout_s
+        self.keep_messages = keep_messages
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._records = {}
+        self._lock = threading.Lock()
+        self.spills = 0
+        self.evictions = 0
+        if sweep_interval_s:
+            threading.Thread(target=self._sweep_loop, args=(sweep_interval_s,), daemon=True,
+                             name="session-memory-sweep").start()
+
+    def _dir(self, key):
+        path = os.path.join(self.root, "".join(ch for ch in str(key) if ch.isalnum())[:64] or "anon")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    # ---------- rerun hooks ----------
+    def begin(self, key, state, shared=True, running=True):
+        """
+        Start of a rerun: reload anything spilled. `state` is the session's state mapping;
+        with shared=False it is only touched from this thread (no cross-session spilling).
+        running=False (e.g. a fragment rerun, which never reaches end()) only marks activity.
+        Returns the keys that were reloaded.
+        """
+        with self._lock:
+            rec = self._records.get(key)
+            if rec is None:
+                rec = self._records[key] = _Record(key, self._ref(key, state) if shared else None)
+        restored = []
+        with rec.lock:
+            rec.running = rec.running or running
+            rec.last_active = time.monotonic()
+            for k in self.spill:
+                v = state[k] if k in state else None
+                if isinstance(v, Spilled):
+                    state[k] = v.load()
+                    rec.spilled_bytes -= v.nbytes
+                    restored.append(k)
+            rec.spilled_bytes = max(0, rec.spilled_bytes)
+            rec.evicted = False
+        return restored
+
+    def end(self, key, state, tokens=None):
+        """
+        End of a rerun: size every key (values whose token and identity are unchanged are not
+        re-measured), archive old messages if the session is over its own budget, then
+        enforce the process budget.
+        """
+        rec = self._records.get(key)
+        if rec is None:
+            return None
+        tokens = tokens or {}
+        with rec.lock:
+            rec.running = False
+            rec.last_active = time.monotonic()
+            sizes = {}
+            for k in _keys(state):
+                v = state[k]
+                memo = rec.memo.get(k)
+                if memo is not None and memo[0] == id(v) and k in tokens and memo[1] == tokens[k]:
+                    sizes[k] = memo[2]
+                    continue
+                lock_key = self.locks.get(k)
+                try:
+                    if lock_key and lock_key in state:
+                        with state[lock_key]:
+                            sizes[k] = nbytes(v)
+                    else:
+                        sizes[k] = nbytes(v)
+                except Exception:
+                    sizes[k] = sys.getsizeof(v)
+                rec.memo[k] = (id(v), tokens.get(k), sizes[k])
+            rec.sizes = sizes
+            if rec.total > self.session_budget:
+                self._archive_locked(rec, state)
+        self.enforce()
+        return rec
+
+    # ---------- spilling ----------
+    def _archive_locked(self, rec, state, all_foldable=False):
+        messages = state["messages"] if "messages" in state else None
+        if not messages:
+            return 0
+        upto = len(messages) - (0 if all_foldable else self.keep_messages)
+        if self.archivable is not None:
+            upto = min(upto, self.archivable(state))
+        moved = archive_messages(messages, upto, os.path.join(self._dir(rec.key), "messages.jsonl"))
+        if moved:
+            rec.sizes["messages"] = nbytes(messages)
+            rec.memo.pop("messages", None)
+            rec.spilled_bytes += moved
+        return moved
+
+    def _spill_locked(self, rec, state):
+        """Move this session's spillable values to disk; returns bytes freed."""
+        freed = 0
+        base = self._dir(rec.key)
+        for k, kind in self.spill.items():
+            v = state[k] if k in state else None
+            if v is None or isinstance(v, Spilled):
+                continue
+            size = rec.sizes.get(k) or nbytes(v)
+            token = (rec.memo.get(k) or (None, None))[1]
+            path_base = os.path.join(base, f"{k}-{token if token is not None else id(v)}")
+            if kind == "frame":
+                path = spill_frame(v, path_base)
+            elif kind == "deck":
+                lock_key = self.locks.get(k)
+                path = spill_deck(v, path_base, lock=state[lock_key] if lock_key and lock_key in state else None)
+            else:
+                continue
+            for name in os.listdir(base):
+                # older spills of the same key are stale
+                if name.startswith(f"{k}-") and os.path.join(base, name) != path:
+                    os.remove(os.path.join(base, name))
+            state[k] = Spilled(kind, path, size)
+            rec.sizes[k] = 0
+            rec.spilled_bytes += size
+            freed += size
+        if freed:
+            for k in self.drop:
+                if k in state:
+                    freed += rec.sizes.pop(k, 0)
+                    del state[k]
+            self.spills += 1
+        return freed
+
+    def _spillable(self, rec, now):
+        if rec.state_ref is None or rec.state_ref() is None:
+            return False
+        return not rec.running or rec.idle_s(now) > STALE_RUN_S
+
+    def spill_session(self, rec, evict=False):
+        """Spill one idle session (and with evict=True archive all foldable messages too)."""
+        state = rec.state_ref() if rec.state_ref is not None else None
+        if state is None:
+            return 0
+        with rec.lock, span("memory.spill", evict=evict, bytes=rec.total) as sp:
+            if not self._spillable(rec, time.monotonic()):
+                return 0
+            freed = self._spill_locked(rec, state)
+            if evict:
+                freed += self._archive_locked(rec, state, all_foldable=True)
+                rec.evicted = True
+                self.evictions += 1
+                if self.on_evict is not None:
+                    # under rec.lock, so the session can't start a rerun halfway through
+                    try:
+                        self.on_evict(rec.key, state)
+                    except Exception:
+                        pass
+            sp.set(freed=freed)
+        return freed
+
+    def enforce(self):
+        """Evict sessions idle past the timeout, then spill cold sessions (LRU) while over the total budget."""
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, r in self._records.items()
+                        if (r.state_ref is not None and r.state_ref() is None)
+                        or (r.state_ref is None and r.idle_s(now) > self.idle_timeout_s)]:
+                # the session is gone (its state was garbage collected) or was never spillable and went idle
+                self._forget_locked(key)
+            records = list(self._records.values())
+        for rec in records:
+            if not rec.evicted and rec.idle_s(now) > self.idle_timeout_s and self._spillable(rec, now):
+                self.spill_session(rec, evict=True)
+        total = sum(r.total for r in records)
+        if total <= self.total_budget:
+            return
+        cold = sorted((r for r in records if r.idle_s(now) >= self.spill_idle_s and self._spillable(r, now)),
+                      key=lambda r: r.last_active)
+        for rec in cold:
+            total -= self.spill_session(rec)
+            if total <= self.total_budget:
+                break
+
+    def _sweep_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.enforce()
+            except Exception:
+                pass
+
+    # ---------- bookkeeping ----------
+    def _ref(self, key, state):
+        try:
+            return weakref.ref(state)
+        except TypeError:
+            return lambda: state
+
+    def _forget_locked(self, key):
+        self._records.pop(key, None)
+        shutil.rmtree(os.path.join(self.root, "".join(ch for ch in str(key) if ch.isalnum())[:64] or "anon"),
+                      ignore_errors=True)
+
+    def forget(self, key):
+        with self._lock:
+            self._forget_locked(key)
+
+    def session_sizes(self, key):
+        rec = self._records.get(key)
+        return dict(rec.sizes) if rec is not None else {}
+
+    def stats(self):
+        with self._lock:
+            records = list(self._records.values())
+        now = time.monotonic()
+        return {
+            "sessions": len(records),
+            "in_memory_bytes": sum(r.total for r in records),
+            "spilled_bytes": sum(r.spilled_bytes for r in records),
+            "idle_sessions": sum(1 for r in records if r.idle_s(now) >= self.spill_idle_s),
+            "evicted_sessions": sum(1 for r in records if r.evicted),
+            "spills": self.spills,
+            "evictions": self.evictions,
+        }
+
+
+def _keys(state):
+    """Keys of a session-state mapping (Streamlit SessionState or a plain dict)."""
+    filtered = getattr(state, "filtered_state", None)
+    if filtered is not None:
+        return list(filtered)
+    return list(state.keys())
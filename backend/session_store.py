@@ -0,0 +1,331 @@
+# Session persistence: survive server restarts and browser reconnects without new
+# Gemini calls or re-running code.
+#
+# Layout under root (default ./sessions):
+#   <session id>/log.jsonl       append-only events since the last snapshot
+#   <session id>/snapshot.json   compacted state at some event seq
+#   <session id>/blobs/<hash>.*  content-addressed artifacts (plots, previews, deck .pptx)
+#
+# State is rebuilt by applying events to the snapshot, so restoring reads two small
+# files; artifacts stay on disk as paths and are only opened when displayed/used.
+# Compaction also deletes blobs the state no longer references, and sessions untouched
+# for SESSION_TTL_DAYS are removed.
+#
+# A session id travels in the URL, so several browser sessions can present the same one.
+# Each log has a single writer: SessionStore.claim() binds an id to one browser session,
+# and a second one must continue under a new id.
+#
+#   SESSION_TTL_DAYS=30        delete sessions not written to for this long
+#   SESSION_OWNER_TTL_S=1800   a writer silent for this long loses its claim
+
+import os, json, time, shutil, hashlib, threading
+
+SESSIONS_DIR = os.getenv("SESSIONS_DIR", os.path.join(os.getcwd(), "sessions"))
+SESSION_TTL_DAYS = float(os.getenv("SESSION_TTL_DAYS", "30"))
+SESSION_OWNER_TTL_S = float(os.getenv("SESSION_OWNER_TTL_S", "1800"))
+SNAPSHOT_EVERY = 50          # compact the log after this many events
+BLOB_GC_MIN_AGE_S = 300      # younger blobs may belong to a sync that hasn't logged its event yet
+PRUNE_INTERVAL_S = 3600
+
+
+def _empty_state():
+    return {
+        "messages": [],           # [{role, content}]
+        "msg_plot_map": {},       # {msg_idx (str): blob ref}
+        "last_plot": None,        # blob ref
+        "editor": {"title": "Slide Title", "text": "", "selected_plot": None},
+        "deck": None,             # {"ref", "version"}
+        "previews": [],           # [blob ref]
+        "dataset": None,          # {"hash", "name", "columns"}; hash None = not restorable
+        "settings": {},           # layout/chart settings
+    }
+
+def _apply(state, ev):
+    """Fold one event into state (used both when recording and when replaying)."""
+    t = ev["type"]
+    if t == "message":
+        msgs = state["messages"]
+        del msgs[ev["idx"]:]
+        msgs.append({"role": ev["role"], "content": ev["content"]})
+    elif t == "messages_truncate":
+        del state["messages"][ev["n"]:]
+    elif t == "plot":
+        state["msg_plot_map"][str(ev["msg_idx"])] = ev["ref"]
+    elif t == "last_plot":
+        state["last_plot"] = ev["ref"]
+    elif t == "editor":
+        state["editor"] = {"title": ev["title"], "text": ev["text"], "selected_plot": ev["selected_plot"]}
+    elif t == "deck":
+        state["deck"] = {"ref": ev["ref"], "version": ev["version"]}
+    elif t == "previews":
+        state["previews"] = list(ev["refs"])
+    elif t == "dataset":
+        state["dataset"] = {"hash": ev["hash"], "name": ev["name"], "columns": ev.get("columns")}
+    elif t == "settings":
+        state["settings"].update(ev["values"])
+    return state
+
+def _touch(path):
+    # a reused blob counts as new: GC on another thread must not take it before its event is logged
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def referenced_blobs(state):
+    """Blob refs the state points at."""
+    refs = set(state["msg_plot_map"].values()) | set(state["previews"])
+    refs |= {state["last_plot"], state["editor"].get("selected_plot"), (state["deck"] or {}).get("ref")}
+    refs.discard(None)
+    return refs
+
+
+class SessionLog:
+    """Event log + snapshot + blob store for one session."""
+
+    def __init__(self, root, session_id):
+        self.session_id = session_id
+        self.dir = os.path.join(root, session_id)
+        self.blobs_dir = os.path.join(self.dir, "blobs")
+        self.log_path = os.path.join(self.dir, "log.jsonl")
+        self.snapshot_path = os.path.join(self.dir, "snapshot.json")
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.state, self.seq = self._load()
+        self._since_snapshot = 0
+        # source path -> blob ref, so unchanged artifacts aren't re-hashed every sync
+        self._ref_of = {}
+
+    # ---------- load / restore ----------
+    def _load(self):
+        state, seq = _empty_state(), 0
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+            state, seq = snap["state"], snap["seq"]
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        try:
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        ev = json.loads(line)
+                    except ValueError:
+                        break  # torn write at the tail: keep what we have
+                    if ev.get("seq", 0) <= seq:
+                        continue
+                    _apply(state, ev)
+                    seq = ev["seq"]
+        except FileNotFoundError:
+            pass
+        return state, seq
+
+    # ---------- write path ----------
+    def append(self, type_, **payload):
+        with self._lock:
+            self._append_locked(type_, payload)
+
+    def _append_locked(self, type_, payload):
+        self.seq += 1
+        ev = {"seq": self.seq, "t": time.time(), "type": type_, **payload}
+        _apply(self.state, ev)
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(ev) + "\n")
+        self._since_snapshot += 1
+        if self._since_snapshot >= SNAPSHOT_EVERY:
+            self._snapshot_locked()
+
+    def record_deck(self, data, version):
+        """Record deck bytes built elsewhere (e.g. a background export), unless a newer version is logged."""
+        ref = self.put_bytes(data, ".pptx")
+        with self._lock:
+            if (self.state["deck"] or {}).get("version", -1) < version:
+                self._append_locked("deck", {"ref": ref, "version": version})
+
+    def snapshot(self):
+        with self._lock:
+            self._snapshot_locked()
+
+    def _snapshot_locked(self):
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"seq": self.seq, "saved_at": time.time(), "state": self.state}, f)
+        os.replace(tmp, self.snapshot_path)
+        # events up to self.seq are now in the snapshot; replay skips them even if this truncate is lost
+        open(self.log_path, "w", encoding="utf-8").close()
+        self._since_snapshot = 0
+        self._gc_blobs_locked()
+
+    def _gc_blobs_locked(self, min_age_s=BLOB_GC_MIN_AGE_S):
+        """Delete blobs no longer referenced by the state (e.g. superseded previews and decks)."""
+        keep = referenced_blobs(self.state)
+        cutoff = time.time() - min_age_s
+        removed = set()
+        for name in os.listdir(self.blobs_dir):
+            path = os.path.join(self.blobs_dir, name)
+            try:
+                if name not in keep and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed.add(name)
+            except OSError:
+                pass
+        if removed:
+            self._ref_of = {p: r for p, r in self._ref_of.items() if r not in removed}
+        return len(removed)
+
+    # ---------- blobs ----------
+    def blob_path(self, ref):
+        return os.path.join(self.blobs_dir, ref) if ref else None
+
+    def put_file(self, path):
+        """Copy a file into the blob store (content-addressed). Returns its ref."""
+        if not path or not os.path.exists(path):
+            return None
+        if os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.blobs_dir):
+            return os.path.basename(path)
+        cached = self._ref_of.get(path)
+        if cached and os.path.exists(self.blob_path(cached)):
+            return cached
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        ref = h.hexdigest() + os.path.splitext(path)[1].lower()
+        dest = self.blob_path(ref)
+        if not os.path.exists(dest):
+            shutil.copyfile(path, dest + ".tmp")
+            os.replace(dest + ".tmp", dest)
+        else:
+            _touch(dest)
+        self._ref_of[path] = ref
+        return ref
+
+    def put_bytes(self, data, ext):
+        ref = hashlib.blake2b(data, digest_size=16).hexdigest() + ext
+        dest = self.blob_path(ref)
+        if not os.path.exists(dest):
+            with open(dest + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(dest + ".tmp", dest)
+        else:
+            _touch(dest)
+        return ref
+
+    # ---------- diff-based recording ----------
+    def sync(self, *, messages, msg_plot_map, last_plot, editor, deck_version, deck_bytes, previews, dataset, settings):
+        """
+        Append events for whatever changed since the last sync. Cheap when nothing changed:
+        length/equality checks only. deck_bytes is a callable, invoked only for a new deck
+        version; it may return None when the bytes aren't ready (a later sync records them).
+        """
+        st = self.state
+        n_logged = len(st["messages"])
+        if len(messages) < n_logged:
+            self.append("messages_truncate", n=len(messages))
+            n_logged = len(messages)
+        for i in range(n_logged, len(messages)):
+            m = messages[i]
+            self.append("message", idx=i, role=m["role"], content=m["content"])
+
+        for idx, path in msg_plot_map.items():
+            ref = self.put_file(path)
+            if ref and st["msg_plot_map"].get(str(idx)) != ref:
+                self.append("plot", msg_idx=idx, ref=ref)
+
+        ref = self.put_file(last_plot) if last_plot else None
+        if ref != st["last_plot"] and (ref or last_plot is None):
+            self.append("last_plot", ref=ref)
+
+        ed = {"title": editor.get("title", ""), "text": editor.get("text", ""),
+              "selected_plot": self.put_file(editor.get("selected_plot"))}
+        if ed != st["editor"]:
+            self.append("editor", **ed)
+
+        if (st["deck"] or {}).get("version") != deck_version:
+            data = deck_bytes()
+            if data is not None:
+                self.append("deck", ref=self.put_bytes(data, ".pptx"), version=deck_version)
+
+        refs = [r for r in (self.put_file(p) for p in previews) if r]
+        if refs != st["previews"]:
+            self.append("previews", refs=refs)
+
+        if dataset and dataset != st["dataset"]:
+            self.append("dataset", hash=dataset["hash"], name=dataset["name"], columns=dataset.get("columns"))
+
+        changed = {k: v for k, v in settings.items() if st["settings"].get(k) != v}
+        if changed:
+            self.append("settings", values=changed)
+
+
+class SessionStore:
+    def __init__(self, root=SESSIONS_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._open = {}
+        self._owners = {}         # session id -> [owner, last seen]
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+
+    def exists(self, session_id):
+        return bool(session_id) and os.path.isdir(os.path.join(self.root, _safe_id(session_id)))
+
+    def claim(self, session_id, owner, ttl_s=SESSION_OWNER_TTL_S):
+        """
+        Bind session_id to one browser session. Returns True if `owner` may write to it
+        (first claim, its own claim, or the previous owner went silent); each call renews it.
+        """
+        sid = _safe_id(session_id)
+        now = time.time()
+        with self._lock:
+            cur = self._owners.get(sid)
+            if cur is not None and cur[0] != owner and now - cur[1] < ttl_s:
+                return False
+            self._owners[sid] = [owner, now]
+            return True
+
+    def open(self, session_id):
+        """Shared SessionLog for session_id (one per process, so appends don't interleave)."""
+        if time.time() - self._pruned_at > PRUNE_INTERVAL_S:
+            self.prune()
+        sid = _safe_id(session_id)
+        with self._lock:
+            log = self._open.get(sid)
+            if log is None:
+                log = self._open[sid] = SessionLog(self.root, sid)
+            return log
+
+    def close(self, session_id):
+        """Snapshot a session's log and release its in-memory state (reopened on next access)."""
+        sid = _safe_id(session_id)
+        with self._lock:
+            log = self._open.pop(sid, None)
+        if log is not None:
+            log.snapshot()
+
+    def prune(self, ttl_s=SESSION_TTL_DAYS * 86400):
+        """Delete sessions not written to for ttl_s seconds (never one that is open). Returns how many."""
+        self._pruned_at = time.time()
+        cutoff = self._pruned_at - ttl_s
+        removed = 0
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return 0
+        for sid in names:
+            path = os.path.join(self.root, sid)
+            try:
+                last = max(os.path.getmtime(os.path.join(path, f))
+                           for f in ("log.jsonl", "snapshot.json", ".") if os.path.exists(os.path.join(path, f)))
+            except (OSError, ValueError):
+                continue
+            with self._lock:
+                if last >= cutoff or sid in self._open or not os.path.isdir(path):
+                    continue
+                self._owners.pop(sid, None)
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+        return removed
+
+def _safe_id(session_id):
+    return "".join(ch for ch in str(session_id) if ch.isalnum())[:64] or "anon"
@@ -0,0 +1,228 @@
+# Slide building and live-preview rendering for python-pptx Presentations.
+# Takes the Presentation and layout settings explicitly (no Streamlit session state).
+
+import os
+os.environ["PATH"] += os.pathsep + r"C:\Program Files\LibreOffice\program"
+os.environ["PATH"] += os.pathsep + r"C:\Program Files\poppler-24.08.0\Library\bin"
+
+import shutil, subprocess, tempfile
+
+from pptx.util import Inches, Pt
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+from PIL import Image, ImageDraw, ImageFont
+
+from tracing import span
+
+try:
+    from pdf2image import convert_from_path
+    PDF2IMAGE_AVAILABLE = True
+except Exception:
+    PDF2IMAGE_AVAILABLE = False
+
+
+def _which(cmd):
+    return shutil.which(cmd) is not None
+
+SOFFICE_OK = _which("soffice")
+POPPLER_OK = _which("pdftoppm")
+
+LAYOUT_STYLES = ["Text only", "Image only", "Text + Image (side-by-side)", "Text top + Image bottom", "2x2 Image Grid"]
+
+
+def add_slide_with_text_and_optional_image(prs, title, text, image_path=None, layout_style="Text + Image (side-by-side)",
+                                           font_size_pt=14, img_width_in=5.0, img_height_in=3.0):
+    layout = prs.slide_layouts[1] if len(prs.slide_layouts) > 1 else prs.slide_layouts[5]
+    slide = prs.slides.add_slide(layout)
+
+    # Title
+    try:
+        slide.shapes.title.text = title
+    except Exception:
+        slide.shapes.add_textbox(Inches(0.5), Inches(0.2), Inches(9), Inches(0.5)).text_frame.text = title
+
+    # Handle layouts
+    style = layout_style
+    font_size = Pt(font_size_pt)
+
+    if style == "Text only":
+        tx = slide.shapes.add_textbox(Inches(0.5), Inches(1), Inches(9), Inches(5))
+        tf = tx.text_frame
+        tf.clear()
+        p = tf.paragraphs[0]
+        p.text = text
+        p.font.size = font_size
+
+    elif style == "Image only" and image_path and os.path.exists(image_path):
+        slide.shapes.add_picture(image_path, Inches(1), Inches(1), width=Inches(img_width_in), height=Inches(img_height_in))
+
+    elif style == "Text + Image (side-by-side)":
+        # Text left
+        tx = slide.shapes.add_textbox(Inches(0.5), Inches(1), Inches(4.5), Inches(5))
+        tf = tx.text_frame
+        tf.clear()
+        p = tf.paragraphs[0]
+        p.text = text
+        p.font.size = font_size
+        # Image right
+        if image_path and os.path.exists(image_path):
+            slide.shapes.add_picture(image_path, Inches(5.2), Inches(1), width=Inches(img_width_in), height=Inches(img_height_in))
+
+    elif style == "Text top + Image bottom":
+        # Text on top
+        tx = slide.shapes.add_textbox(Inches(0.5), Inches(1), Inches(9), Inches(2))
+        tf = tx.text_frame
+        tf.clear()
+        p = tf.paragraphs[0]
+        p.text = text
+        p.font.size = font_size
+        # Image bottom
+        if image_path and os.path.exists(image_path):
+            slide.shapes.add_picture(image_path, Inches(1), Inches(3.2), width=Inches(img_width_in), height=Inches(img_height_in))
+
+    elif style == "2x2 Image Grid" and image_path and os.path.exists(image_path):
+        # duplicate same image into 4 slots
+        w, h = img_width_in/2, img_height_in/2
+        slide.shapes.add_picture(image_path, Inches(0.5), Inches(1), width=Inches(w), height=Inches(h))
+        slide.shapes.add_picture(image_path, Inches(5), Inches(1), width=Inches(w), height=Inches(h))
+        slide.shapes.add_picture(image_path, Inches(0.5), Inches(3.5), width=Inches(w), height=Inches(h))
+        slide.shapes.add_picture(image_path, Inches(5), Inches(3.5), width=Inches(w), height=Inches(h))
+
+    return slide
+
+def _render_slide_to_image(slide, idx, plot_paths=()):
+    W, H = 1200, 900
+    bg = Image.new("RGB", (W, H), color=(255, 255, 255))
+    draw = ImageDraw.Draw(bg)
+    # draw title if present
+    title_text = ""
+    body_text = ""
+    try:
+        if slide.shapes.title:
+            title_text = slide.shapes.title.text if slide.shapes.title.text else ""
+    except Exception:
+        title_text = ""
+    # aggregate first few textboxes
+    try:
+        texts = []
+        for shp in slide.shapes:
+            if shp.shape_type == MSO_SHAPE_TYPE.TEXT_BOX or shp.has_text_frame:
+                try:
+                    t = shp.text_frame.text.strip()
+                    if t:
+                        texts.append(t)
+                except Exception:
+                    continue
+        body_text = "\n\n".join(texts[:6])
+    except Exception:
+        body_text = ""
+    # fonts (use default if PIL font missing)
+    try:
+        f_title = ImageFont.truetype("arial.ttf", 28)
+        f_body = ImageFont.truetype("arial.ttf", 14)
+    except Exception:
+        f_title = ImageFont.load_default()
+        f_body = ImageFont.load_default()
+    # draw title
+    if title_text:
+        draw.text((36, 24), title_text[:200], font=f_title, fill=(0, 0, 0))
+    # draw body
+    y = 80
+    for line in (body_text or "").splitlines():
+        if y > H - 60:
+            break
+        draw.text((36, y), line[:200], font=f_body, fill=(0, 0, 0))
+        y += 18
+    # if plots were produced by executed code, try to paste one (best-effort)
+    try:
+        for p in plot_paths:
+            if p and os.path.exists(p):
+                thumb = Image.open(p)
+                thumb.thumbnail((int(W*0.6), int(H*0.45)))
+                bg.paste(thumb, (36, max(140, (H - thumb.size[1])//2)))
+                break
+    except Exception:
+        pass
+    out = tempfile.NamedTemporaryFile(delete=False, suffix=f"_fallback_slide{idx+1}.png").name
+    bg.save(out, "PNG")
+    return out
+
+def generate_live_preview_images(prs, plot_paths=()):
+    """
+    Render the slides of prs to image files and return list of image paths.
+    Tries:
+      - Save PPTX -> convert to PDF with soffice -> convert PDF pages to images via pdf2image
+      - Fallback: generate simple PNG preview images using slide text (PIL)
+    plot_paths: optional plot images used to decorate the PIL fallback thumbnails.
+    """
+    imgs = []
+    try:
+        # save pptx to temp file
+        with span("preview.save_pptx", slides=len(prs.slides)) as sp:
+            tmp_ppt = tempfile.NamedTemporaryFile(delete=False, suffix=".pptx")
+            prs.save(tmp_ppt.name)
+            tmp_ppt.close()
+            sp.set(pptx_bytes=os.path.getsize(tmp_ppt.name))
+
+        # Try LibreOffice conversion PPTX -> PDF
+        pdf_path = tmp_ppt.name.replace(".pptx", ".pdf")
+        if SOFFICE_OK:
+            try:
+                # Convert to PDF (headless)
+                cmd = ["soffice", "--headless", "--convert-to", "pdf", "--outdir", os.path.dirname(pdf_path), tmp_ppt.name]
+                with span("preview.soffice"):
+                    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30)
+                # If pdf2image available, convert PDF pages -> images
+                if PDF2IMAGE_AVAILABLE and os.path.exists(pdf_path):
+                    with span("preview.pdf2image", pdf_bytes=os.path.getsize(pdf_path)) as sp:
+                        pages = convert_from_path(pdf_path, dpi=150)
+                        for i, page in enumerate(pages):
+                            out_png = tempfile.NamedTemporaryFile(delete=False, suffix=f"_slide{i+1}.png").name
+                            page.save(out_png, "PNG")
+                            imgs.append(out_png)
+                        sp.set(pages=len(imgs), image_bytes=sum(os.path.getsize(p) for p in imgs))
+                    return imgs
+            except Exception:
+                # fallback path if conversion failed
+                pass
+
+        # If conversion not possible, create thumbnails from slide data (PIL fallback)
+        with span("preview.pil_fallback", slides=len(prs.slides)) as sp:
+            for i, slide in enumerate(prs.slides):
+                try:
+                    imgs.append(_render_slide_to_image(slide, i, plot_paths))
+                except Exception:
+                    continue
+            sp.set(pages=len(imgs))
+
+        # if nothing created, create one blank placeholder
+        if not imgs:
+            W, H = 1200, 900
+            img = Image.new("RGB", (W, H), color=(240, 240, 240))
+            draw = ImageDraw.Draw(img)
+            try:
+                f = ImageFont.truetype("arial.ttf", 20)
+            except Exception:
+                f = ImageFont.load_default()
+            draw.text((40, 40), "No slides available", font=f, fill=(80, 80, 80))
+            out = tempfile.NamedTemporaryFile(delete=False, suffix="_placeholder.png").name
+            img.save(out, "PNG")
+            imgs.append(out)
+
+        return imgs
+
+    except Exception as e:
+        # Last-resort fallback single image explaining error
+        try:
+            W, H = 1200, 900
+            img = Image.new("RGB", (W, H), color=(255, 255, 255))
+            draw = ImageDraw.Draw(img)
+            try:
+                f = ImageFont.truetype("arial.ttf", 18)
+            except Exception:
+                f = ImageFont.load_default()
+            draw.text((36, 40), "Preview generation failed: " + str(e)[:200], font=f, fill=(255, 0, 0))
+            out = tempfile.NamedTemporaryFile(delete=False, suffix="_error.png").name
+            img.save(out, "PNG")
+            return [out]
+        except Exception:
+            return []
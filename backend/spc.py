@@ -0,0 +1,314 @@
+# Statistical process control: control limits, Western Electric rules, capability and
+# drift detection (CUSUM / EWMA) for every numeric column at once.
+#
+# Everything is computed on (rows x columns) arrays; rolling rules count over small int8
+# windows and CUSUM uses the cumulative-minimum form of the tabular recursion, so there
+# are no per-row Python loops. Data stays float32 when the columns fit it (sums and
+# CUSUM accumulate in float64), arrays are column-major so every pass streams one
+# column, and columns are processed in chunks to bound memory.
+# Rows are taken in their current order (the process/time order).
+
+import numpy as np
+import pandas as pd
+
+from tracing import span
+
+try:
+    from scipy.signal import lfilter
+    SCIPY_AVAILABLE = True
+except Exception:
+    SCIPY_AVAILABLE = False
+
+# X-bar/R chart constants by subgroup size: (A2, D3, D4, d2)
+XBAR_R_CONSTANTS = {
+    2: (1.880, 0.000, 3.267, 1.128), 3: (1.023, 0.000, 2.574, 1.693), 4: (0.729, 0.000, 2.282, 2.059),
+    5: (0.577, 0.000, 2.114, 2.326), 6: (0.483, 0.000, 2.004, 2.534), 7: (0.419, 0.076, 1.924, 2.704),
+    8: (0.373, 0.136, 1.864, 2.847), 9: (0.337, 0.184, 1.816, 2.970), 10: (0.308, 0.223, 1.777, 3.078),
+}
+D2_MR = 1.128                  # d2 for moving ranges of 2
+D4_MR = 3.267
+CUSUM_K = 0.5                  # reference value, in sigmas
+CUSUM_H = 5.0                  # decision interval, in sigmas
+EWMA_LAMBDA = 0.2
+EWMA_L = 3.0
+CHUNK_BYTES = 64 * 1024 * 1024 # per column chunk of the working array
+EWMA_WARMUP = 200              # rows after which the EWMA limits equal their asymptote
+CUSUM_BLOCK_ROWS = 16_384
+
+
+def _work_dtype(dtypes):
+    """float32 when every dtype is exact in it (floats up to 32 bits, ints up to 16), else float64."""
+    for t in dtypes:
+        try:
+            t = np.dtype(getattr(t, "numpy_dtype", t))
+        except TypeError:
+            return np.float64
+        if not ((t.kind == "f" and t.itemsize <= 4) or (t.kind in "iub" and t.itemsize <= 2)):
+            return np.float64
+    return np.float32
+
+def _col_mean(x, missing):
+    """NaN-skipping column means, accumulated in float64."""
+    n = len(x) - missing.sum(axis=0)
+    total = (np.where(missing, 0, x) if missing.any() else x).sum(axis=0, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return total / n
+
+def _col_std(x, missing, mean):
+    """NaN-skipping column standard deviations (ddof=1)."""
+    n = len(x) - missing.sum(axis=0)
+    dev = x - mean.astype(x.dtype)
+    dev[missing] = 0
+    np.square(dev, out=dev)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.sqrt(dev.sum(axis=0, dtype=np.float64) / (n - 1))
+
+def _window_count(mask, w):
+    """Number of True values in the trailing window of length w ending at each row."""
+    out = mask.astype(np.int8)
+    for k in range(1, w):
+        out[k:] += mask[:-k]
+    return out
+
+def _first_true(mask):
+    """Row index of the first True per column, -1 if none."""
+    any_ = mask.any(axis=0)
+    return np.where(any_, mask.argmax(axis=0), -1)
+
+def western_electric(x, center, sigma):
+    """
+    Boolean masks (rows x cols) for the four Western Electric rules, flagged at the point
+    that completes the pattern:
+      1: one point beyond 3 sigma          2: 2 of 3 beyond 2 sigma, same side
+      3: 4 of 5 beyond 1 sigma, same side  4: 8 in a row on the same side of the center
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = x - center.astype(x.dtype)
+        z /= sigma.astype(x.dtype)
+    np.nan_to_num(z, copy=False, nan=0.0, posinf=0.0, neginf=0.0)  # missing points never count towards a rule
+    rules = {1: (z > 3) | (z < -3)}
+    for rule, (t, w, m) in {2: (2, 3, 2), 3: (1, 5, 4), 4: (0, 8, 8)}.items():
+        hit = _window_count(z > t, w) >= m
+        hit |= _window_count(z < -t, w) >= m
+        rules[rule] = hit
+    return rules
+
+def cusum(x, center, sigma, k=CUSUM_K, h=CUSUM_H):
+    """
+    Tabular CUSUM (upper, lower) for each column. Uses C+_i = S_i - min(0, min_j<=i S_j)
+    with S the cumulative sum of (x - center - k*sigma), which equals the usual
+    max(0, ...) recursion. Returns (c_plus, c_minus, decision interval h*sigma).
+    """
+    return _cusum_side(x, center, sigma, k, 1), _cusum_side(x, center, sigma, k, -1), h * sigma
+
+def _cusum_side(x, center, sigma, k, sign):
+    # steps in the data's dtype, running sums in float64 (a float32 sum drifts over 1M rows)
+    step = x - (center + k * sigma).astype(x.dtype) if sign > 0 else (center - k * sigma).astype(x.dtype) - x
+    missing = np.isnan(x)
+    if missing.any():
+        step[missing] = 0
+    s = np.cumsum(step, axis=0, dtype=np.float64)
+    del step
+    low = np.minimum.accumulate(s, axis=0)
+    np.minimum(low, 0.0, out=low)
+    s -= low
+    return s
+
+def cusum_first_signal(x, center, sigma, k=CUSUM_K, h=CUSUM_H, block=CUSUM_BLOCK_ROWS):
+    """
+    Row of the first CUSUM signal (either side) per column, -1 if none. Same statistic as
+    cusum(), run over blocks of rows (carrying the running sum and minimum) so the float64
+    temporaries stay cache-sized; stops once every column has signalled.
+    """
+    ncols = x.shape[1]
+    first = np.full(ncols, -1)
+    refs = {1: (center + k * sigma).astype(x.dtype), -1: (center - k * sigma).astype(x.dtype)}
+    carry = {side: (np.zeros(ncols), np.zeros(ncols)) for side in refs}   # (last sum, running min <= 0)
+    limit = h * sigma
+    for r0 in range(0, len(x), block):
+        xb = x[r0:r0 + block]
+        missing = np.isnan(xb)
+        block_first = np.full(ncols, -1)
+        for side, ref in refs.items():
+            step = xb - ref if side > 0 else ref - xb
+            if missing.any():
+                step[missing] = 0
+            s = np.cumsum(step, axis=0, dtype=np.float64)
+            s += carry[side][0]
+            low = np.minimum.accumulate(s, axis=0)
+            np.minimum(low, carry[side][1], out=low)
+            carry[side] = (s[-1].copy(), low[-1].copy())
+            s -= low
+            f = _first_true(s > limit)
+            block_first = np.where((block_first < 0) | ((f >= 0) & (f < block_first)), f, block_first)
+        new = (first < 0) & (block_first >= 0)
+        first[new] = r0 + block_first[new]
+        if (first >= 0).all():
+            break
+    return first
+
+def ewma(frame, center, sigma, lam=EWMA_LAMBDA, L=EWMA_L):
+    """EWMA statistic (started at the center line) and its time-varying control half-width."""
+    start = pd.DataFrame([center], columns=frame.columns)
+    z = pd.concat([start, frame], ignore_index=True).ewm(alpha=lam, adjust=False, ignore_na=True).mean()
+    z = z.to_numpy(dtype=np.float64)[1:]
+    half = L * sigma * _ewma_width(len(frame), lam)[:, None]
+    return z, half
+
+def _ewma_width(n, lam=EWMA_LAMBDA):
+    i = np.arange(1, n + 1)
+    return np.sqrt(lam / (2 - lam) * (1 - (1 - lam) ** (2 * i)))
+
+def ewma_points(x, center, sigma, lam=EWMA_LAMBDA, L=EWMA_L):
+    """Per column, how many EWMA values fall outside the limits (same statistic as ewma())."""
+    missing = np.isnan(x).any(axis=0)
+    z = np.empty_like(x)
+    if SCIPY_AVAILABLE and not missing.all():
+        # z_i = lam * x_i + (1 - lam) * z_{i-1}, z_0 = center: a first-order filter, run
+        # along contiguous rows of x.T with float32 coefficients so float32 data stays float32
+        full = ~missing
+        xs = x if full.all() else x[:, full]
+        b, a = np.array([lam], dtype=x.dtype), np.array([1.0, lam - 1.0], dtype=x.dtype)
+        zi = ((1 - lam) * center[full]).astype(x.dtype)[:, None]
+        zs = lfilter(b, a, xs.T, axis=1, zi=zi)[0].T
+        if full.all():
+            z = zs
+        else:
+            z[:, full] = zs
+        del xs, zs
+    else:
+        missing[:] = True
+    if missing.any():
+        # gaps hold the last value, which the filter can't express
+        cols = np.flatnonzero(missing)
+        z[:, cols] = ewma(pd.DataFrame(x[:, cols]), center[cols], sigma[cols], lam, L)[0]
+    z -= center.astype(x.dtype)
+    np.abs(z, out=z)
+    # the limits reach their asymptote within a few dozen rows; compare the rest against it
+    w = min(len(x), EWMA_WARMUP)
+    width = _ewma_width(w, lam)
+    with np.errstate(invalid="ignore"):
+        out = (z[:w] > L * sigma * width[:, None]).sum(axis=0)
+        out += (z[w:] > (L * sigma * width[-1]).astype(x.dtype)).sum(axis=0)
+    return out
+
+def _subgroups(x, n):
+    """Consecutive subgroups of n rows: (means, ranges), dropping a short last subgroup."""
+    m = (len(x) // n) * n
+    if np.isnan(x[:m]).any():
+        g = x[:m].reshape(-1, n, x.shape[1])
+        with np.errstate(invalid="ignore"):
+            return np.nanmean(g, axis=1), np.nanmax(g, axis=1) - np.nanmin(g, axis=1)
+    # no gaps: fold the n row-strided slices together, a pass each instead of a reduction per subgroup
+    total = x[0:m:n].copy()
+    hi, lo = total.copy(), total.copy()
+    for j in range(1, n):
+        rows = x[j:m:n]
+        total += rows
+        np.maximum(hi, rows, out=hi)
+        np.minimum(lo, rows, out=lo)
+    total /= n
+    hi -= lo
+    return total, hi
+
+def _spc_chunk(frame, subgroup_size, spec_limits):
+    # column-major: every rule, sum and scan below runs down one contiguous column
+    x = np.asfortranarray(frame.to_numpy(dtype=_work_dtype(frame.dtypes), na_value=np.nan))
+    cols = frame.columns
+    missing = np.isnan(x)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        overall_mean = _col_mean(x, missing)
+        overall_sd = _col_std(x, missing, overall_mean)
+        if subgroup_size <= 1:
+            # I-MR: short-term sigma from the average moving range
+            mr = np.diff(x, axis=0)
+            np.abs(mr, out=mr)
+            mr_bar = _col_mean(mr, np.isnan(mr))
+            del mr
+            sigma_within = mr_bar / D2_MR
+            plotted, center, sigma_plot = x, overall_mean, sigma_within
+            out = {"center": center, "ucl": center + 3 * sigma_within, "lcl": center - 3 * sigma_within,
+                   "mr_bar": mr_bar, "mr_ucl": D4_MR * mr_bar}
+        else:
+            a2, d3, d4, d2 = XBAR_R_CONSTANTS[subgroup_size]
+            means, ranges = _subgroups(x, subgroup_size)
+            xbarbar, r_bar = np.nanmean(means, axis=0), np.nanmean(ranges, axis=0)
+            sigma_within = r_bar / d2
+            plotted, center, sigma_plot = means, xbarbar, a2 * r_bar / 3
+            out = {"center": xbarbar, "ucl": xbarbar + a2 * r_bar, "lcl": xbarbar - a2 * r_bar,
+                   "r_bar": r_bar, "r_ucl": d4 * r_bar, "r_lcl": d3 * r_bar}
+        out["sigma_within"] = sigma_within
+        out["sigma_overall"] = overall_sd
+
+        for rule, mask in western_electric(plotted, center, sigma_plot).items():
+            out[f"we{rule}_points"] = mask.sum(axis=0)
+            out[f"we{rule}_first"] = _first_true(mask)
+
+        out["cusum_first_signal"] = cusum_first_signal(plotted, center, sigma_plot)
+        out["ewma_points"] = ewma_points(plotted, center, sigma_plot)
+
+        lsl = np.array([(spec_limits.get(c) or (np.nan, np.nan))[0] for c in cols], dtype=np.float64)
+        usl = np.array([(spec_limits.get(c) or (np.nan, np.nan))[1] for c in cols], dtype=np.float64)
+        # one-sided specs give Cpk/Ppk only
+        out["cp"] = (usl - lsl) / (6 * sigma_within)
+        out["cpk"] = np.fmin((usl - overall_mean) / (3 * sigma_within), (overall_mean - lsl) / (3 * sigma_within))
+        out["pp"] = (usl - lsl) / (6 * overall_sd)
+        out["ppk"] = np.fmin((usl - overall_mean) / (3 * overall_sd), (overall_mean - lsl) / (3 * overall_sd))
+    return pd.DataFrame(out, index=cols)
+
+def run_spc(df, subgroup_size=1, spec_limits=None, columns=None):
+    """
+    Control limits, rule violations, CUSUM/EWMA drift and capability for every numeric
+    column. subgroup_size 1 = I-MR chart, 2..10 = X-bar/R on consecutive rows.
+    spec_limits: {column: (LSL, USL)} (either may be None) for Cp/Cpk/Pp/Ppk.
+    Returns {"summary": DataFrame (one row per column), "subgroup_size": n} or {"error": ...}.
+    """
+    if subgroup_size != 1 and subgroup_size not in XBAR_R_CONSTANTS:
+        return {"error": f"Subgroup size must be 1 or 2-10, got {subgroup_size}."}
+    # select on an empty slice: select_dtypes on the full frame copies every numeric column
+    num = df.iloc[:0].select_dtypes(include="number")
+    if columns is not None:
+        df = df[[c for c in columns if c in num.columns]]
+        num = df.iloc[:0]
+    if num.shape[1] == 0:
+        return {"error": "No numeric columns for SPC."}
+    if len(df) < max(3, 2 * subgroup_size):
+        return {"error": "Not enough rows for control limits."}
+    spec_limits = {c: tuple(np.nan if v is None else v for v in lim) for c, lim in (spec_limits or {}).items()}
+    names = set(num.columns)
+    positions = [i for i, c in enumerate(df.columns) if c in names]
+    with span("analysis.spc", rows=len(df), cols=len(positions), subgroup=subgroup_size):
+        # float32-exact columns are chunked together so one wider column doesn't widen its chunk
+        groups = {}
+        for i in positions:
+            groups.setdefault(_work_dtype([df.dtypes.iloc[i]]), []).append(i)
+        parts, order = [], []
+        for dtype, group in groups.items():
+            chunk = max(1, CHUNK_BYTES // (np.dtype(dtype).itemsize * max(1, len(df))))
+            for i in range(0, len(group), chunk):
+                parts.append(_spc_chunk(df.iloc[:, group[i:i + chunk]], subgroup_size, spec_limits))
+                order += group[i:i + chunk]
+        summary = pd.concat(parts).iloc[np.argsort(order, kind="stable")]
+        rules = [f"we{r}_points" for r in (1, 2, 3, 4)]
+        summary["violations"] = summary[rules].sum(axis=1)
+        return {"summary": summary, "subgroup_size": subgroup_size}
+
+def control_chart_png(df, column, summary_row, path, subgroup_size=1):
+    """Draw the I (or X-bar) chart of one column with its limits to a PNG; returns path."""
+    from matplotlib.figure import Figure
+    x = df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+    if subgroup_size > 1:
+        x = _subgroups(x[:, None], subgroup_size)[0][:, 0]
+    fig = Figure(figsize=(10, 4))
+    ax = fig.add_subplot(1, 1, 1)
+    ax.plot(np.arange(len(x)), x, lw=0.8, color="#1f77b4")
+    center, ucl, lcl = summary_row["center"], summary_row["ucl"], summary_row["lcl"]
+    for y, style in ((center, "-"), (ucl, "--"), (lcl, "--")):
+        ax.axhline(y, color="#d62728" if style == "--" else "#2ca02c", ls=style, lw=1)
+    sigma = (ucl - center) / 3
+    rule1 = np.abs(x - center) > 3 * sigma
+    ax.scatter(np.flatnonzero(rule1), x[rule1], color="#d62728", s=12, zorder=3)
+    ax.set_title(f"{'X̄' if subgroup_size > 1 else 'I'} chart — {column}")
+    fig.tight_layout()
+    fig.savefig(path, dpi=150)
+    return path
@@ -0,0 +1,189 @@
+# Embedded SQL over the current dataset and the dataset history (DuckDB, optional).
+#
+# The current frame is registered as table `df`; every history entry is exposed as a
+# view over its stored file (Arrow IPC through a pyarrow dataset, or CSV), so filters,
+# projections, joins and aggregations run inside DuckDB — multi-threaded, spilling to
+# disk beyond SQL_MEMORY_LIMIT — and only the result is materialized in pandas.
+#
+#   SQL_MEMORY_LIMIT=2GB   per-session DuckDB memory limit
+#   SQL_THREADS=0          worker threads (0 = DuckDB default, all cores)
+
+import os, re, hashlib, tempfile, threading
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except Exception:
+    DUCKDB_AVAILABLE = False
+
+try:
+    import pyarrow.dataset as pa_ds
+    PYARROW_DATASET_AVAILABLE = True
+except Exception:
+    PYARROW_DATASET_AVAILABLE = False
+
+from tracing import span
+
+SQL_MEMORY_LIMIT = os.getenv("SQL_MEMORY_LIMIT", "2GB")
+SQL_THREADS = int(os.getenv("SQL_THREADS", "0"))
+SQL_TEMP_DIR = os.path.join(tempfile.gettempdir(), "duckdb_spill")
+RESULT_MAX_ROWS = 1_000_000    # guard against materializing a runaway join in pandas
+
+_SQL_CALL_RE = re.compile(r"\bsql\s*\(")
+
+
+def uses_sql(code):
+    """Whether a snippet calls sql(...) (its result then depends on every table)."""
+    return bool(_SQL_CALL_RE.search(code))
+
+def snippet_fingerprint(code, df_fingerprint, catalog_fingerprint):
+    """Cache fingerprint for a snippet run with sql() available: df's, plus the catalog's if it calls sql()."""
+    if df_fingerprint and catalog_fingerprint and uses_sql(code):
+        return f"{df_fingerprint}+sql:{catalog_fingerprint}"
+    return df_fingerprint
+
+def table_name(name, taken=()):
+    """SQL identifier for a dataset name: lowercase, [a-z0-9_], unique among `taken`."""
+    base = re.sub(r"[^0-9a-zA-Z_]+", "_", os.path.splitext(str(name))[0]).strip("_").lower() or "dataset"
+    if base[0].isdigit():
+        base = "t_" + base
+    candidate, i = base, 2
+    while candidate in taken:
+        candidate, i = f"{base}_{i}", i + 1
+    return candidate
+
+
+class SQLEngine:
+    """One DuckDB database per session; each thread queries through its own cursor."""
+
+    def __init__(self, memory_limit=SQL_MEMORY_LIMIT, threads=SQL_THREADS):
+        if not DUCKDB_AVAILABLE:
+            raise RuntimeError("duckdb is not installed (pip install duckdb).")
+        os.makedirs(SQL_TEMP_DIR, exist_ok=True)
+        self.con = duckdb.connect(database=":memory:")
+        self.con.execute(f"SET memory_limit='{memory_limit}'")
+        self.con.execute(f"SET temp_directory='{SQL_TEMP_DIR}'")
+        if threads:
+            self.con.execute(f"SET threads={int(threads)}")
+        self._objects = {}          # table -> (python object to register | None, SQL view definition | None)
+        self._sources = {}          # table -> content hash / fingerprint
+        self._version = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._history_ids = None
+        self.df_fingerprint = None
+
+    # ---------- catalog ----------
+    def _define(self, name, obj=None, view_sql=None, source=None):
+        with self._lock:
+            self._objects[name] = (obj, view_sql)
+            self._sources[name] = source
+            self._version += 1
+
+    def register_frame(self, name, df, fingerprint=None):
+        """Expose a DataFrame as a table (scanned in place, not copied)."""
+        self._define(name, obj=df, source=fingerprint or id(df))
+        if name == "df":
+            self.df_fingerprint = fingerprint
+
+    def register_file(self, name, path, fmt, source=None):
+        if fmt == "arrow" and PYARROW_DATASET_AVAILABLE:
+            # pyarrow dataset: DuckDB pushes projections and filters into the scan
+            self._define(name, obj=pa_ds.dataset(path, format="ipc"), source=source or path)
+        elif fmt == "csv":
+            self._define(name, view_sql=f"SELECT * FROM read_csv_auto('{path.replace(chr(39), chr(39) * 2)}')",
+                         source=source or path)
+
+    def sync_history(self, store):
+        """Register every history entry as a table named after it; no-op if the index is unchanged."""
+        entries = store.entries()
+        ids = tuple(e["id"] for e in entries)
+        if ids == self._history_ids:
+            return
+        with self._lock:
+            for name in [n for n, src in self._sources.items() if isinstance(src, tuple) and src[0] == "history"]:
+                self._objects.pop(name, None)
+                self._sources.pop(name, None)
+            self._version += 1
+        taken = set(self._objects) | {"df"}
+        for e in reversed(entries):       # oldest first, so names stay stable as uploads accumulate
+            name = table_name(e["name"], taken)
+            taken.add(name)
+            fmt = e.get("format", "arrow")
+            self.register_file(name, store.object_path(e), fmt, source=("history", e["hash"]))
+        self._history_ids = ids
+
+    def tables(self):
+        with self._lock:
+            return sorted(self._objects)
+
+    def fingerprint(self):
+        """Changes whenever any table's content changes (used in snippet cache keys)."""
+        with self._lock:
+            items = sorted((k, repr(v)) for k, v in self._sources.items())
+        return hashlib.blake2b(repr(items).encode("utf-8"), digest_size=8).hexdigest()
+
+    # ---------- queries ----------
+    def _cursor(self):
+        """Thread-local cursor with the current catalog registered on it."""
+        cur = getattr(self._local, "cur", None)
+        if cur is None:
+            cur = self._local.cur = self.con.cursor()
+            self._local.version = -1
+            self._local.names = set()
+        if self._local.version != self._version:
+            with self._lock:
+                objects, version = dict(self._objects), self._version
+            for name in self._local.names - set(objects):
+                cur.execute(f'DROP VIEW IF EXISTS "{name}"')
+                try:
+                    cur.unregister(name)
+                except Exception:
+                    pass
+            for name, (obj, view_sql) in objects.items():
+                if obj is not None:
+                    cur.register(name, obj)
+                else:
+                    cur.execute(f'CREATE OR REPLACE TEMP VIEW "{name}" AS {view_sql}')
+            self._local.names = set(objects)
+            self._local.version = version
+        return cur
+
+    def query(self, sql, max_rows=RESULT_MAX_ROWS):
+        """
+        Run SQL and return a pandas DataFrame of at most max_rows rows. A result cut at the
+        limit has out.attrs["truncated_at"] = max_rows.
+        """
+        with span("sql.query", sql_chars=len(sql)) as sp:
+            rel = self._cursor().sql(sql)
+            if rel is None:               # DDL/SET statements return no relation
+                return None
+            truncated = False
+            if max_rows is not None:
+                # one extra row tells a result of exactly max_rows from a cut one
+                out = rel.limit(max_rows + 1).df()
+                truncated = len(out) > max_rows
+                if truncated:
+                    out = out.iloc[:max_rows]
+            else:
+                out = rel.df()
+            if truncated:
+                out.attrs["truncated_at"] = max_rows
+            sp.set(rows=len(out), cols=out.shape[1], truncated=truncated)
+            return out
+
+    def summarize(self, table):
+        """Per-column summary (min/max/avg/std/quantiles/null %) computed inside DuckDB."""
+        return self.query(f'SUMMARIZE "{table}"')
+
+    def namespace(self):
+        """
+        Names for the snippet namespace: sql("SELECT ...") -> DataFrame (safe from any thread).
+        A truncated result says so in the snippet's output.
+        """
+        def sql(query, max_rows=RESULT_MAX_ROWS):
+            out = self.query(query, max_rows=max_rows)
+            if out is not None and out.attrs.get("truncated_at"):
+                print(f"[sql] result truncated to the first {max_rows:,} rows")
+            return out
+        return {"sql": sql}
@@ -0,0 +1,53 @@
+import json
+
+import pandas as pd
+
+from autodeck import MAX_BULLETS, MAX_SLIDES, parse_outline, render_charts
+from execution import ExecutionCache
+
+
+def test_parses_fenced_json_with_prose():
+    text = 'Here is the deck:\n```json\n{"slides": [{"title": " Sales ", "bullets": ["up 5%"], "code": "print(1)\\n"}]}\n```'
+    assert parse_outline(text) == {"slides": [{"title": "Sales", "bullets": ["up 5%"], "code": "print(1)"}]}
+
+def test_accepts_bare_list_and_bare_object():
+    assert parse_outline('[{"title": "A"}]')["slides"][0]["title"] == "A"
+    assert parse_outline('Sure! {"slides": [{"title": "B"}]} Enjoy.')["slides"][0]["title"] == "B"
+
+def test_bullets_are_normalized():
+    out = parse_outline(json.dumps({"slides": [
+        {"title": "text", "bullets": "- one\n\n• two\n"},
+        {"title": "many", "bullets": [str(i) for i in range(20)] + [""]},
+        {"title": None, "bullets": None, "code": ["not", "a", "string"]},
+    ]}))["slides"]
+    assert out[0]["bullets"] == ["one", "two"]
+    assert len(out[1]["bullets"]) == MAX_BULLETS
+    assert out[2] == {"title": "Untitled", "bullets": [], "code": ""}
+
+def test_slide_count_is_capped():
+    text = json.dumps({"slides": [{"title": str(i)} for i in range(MAX_SLIDES + 5)]})
+    assert len(parse_outline(text)["slides"]) == MAX_SLIDES
+
+def test_errors():
+    assert "valid JSON" in parse_outline("no json here")["error"]
+    assert parse_outline('{"slides": []}') == {"error": "Outline has no slides."}
+    assert parse_outline('{"slides": ["just text", 3]}') == {"error": "Outline has no usable slides."}
+
+def test_scalar_bullets_become_one_bullet():
+    out = parse_outline(json.dumps([{"title": "n", "bullets": 42}, {"title": "o", "bullets": {"k": 1}}]))
+    assert [s["bullets"] for s in out["slides"]] == [["42"], ["{'k': 1}"]]
+
+def test_sql_snippets_are_keyed_on_the_catalog(tmp_path):
+    calls = []
+    ns = {"sql": lambda q: calls.append(q) or pd.DataFrame({"n": [len(calls)]})}
+    cache = ExecutionCache(cache_dir=str(tmp_path))
+    outline = [{"code": "out = sql('SELECT count(*) FROM sales')"}, {"code": "m = df.a.mean()"}]
+    df = pd.DataFrame({"a": [1, 2, 3]})
+
+    def render(catalog):
+        return [r.cached for r in render_charts(outline, df, "fp", cache, extra_ns=ns, sql_fingerprint=catalog)]
+
+    assert render("tables-1") == [False, False]
+    assert render("tables-1") == [True, True]
+    assert render("tables-2") == [False, True]     # history changed: only the sql() chart re-runs
+    assert len(calls) == 2
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from charts import bin_scatter, bins_for_width, lttb_indices, minmax_indices, points_for_width, reduce_line_frame
+
+
+def _series(n=100_000, seed=0):
+    rng = np.random.default_rng(seed)
+    y = np.sin(np.linspace(0, 20, n)) + rng.normal(0, 0.05, n)
+    y[n // 3] = 25.0                  # one spike and one dip that must survive any reduction
+    y[7 * n // 9] = -30.0
+    return np.arange(n, dtype=np.float64), y
+
+def test_lttb_keeps_endpoints_and_spikes():
+    x, y = _series()
+    idx = lttb_indices(x, y, 1000)
+    assert len(idx) == 1000 and idx[0] == 0 and idx[-1] == len(x) - 1
+    assert np.all(np.diff(idx) > 0)
+    assert {len(x) // 3, 7 * len(x) // 9} <= set(idx.tolist())
+
+def test_minmax_keeps_endpoints_and_extremes():
+    x, y = _series()
+    idx = minmax_indices(y, 1000)
+    assert len(idx) <= 1002 and idx[0] == 0 and idx[-1] == len(y) - 1
+    assert {int(np.argmax(y)), int(np.argmin(y))} <= set(idx.tolist())
+    assert y[idx].max() == y.max() and y[idx].min() == y.min()
+
+def test_small_inputs_are_returned_whole():
+    x, y = np.arange(10.0), np.arange(10.0)
+    assert lttb_indices(x, y, 50).tolist() == list(range(10))
+    assert minmax_indices(y, 50).tolist() == list(range(10))
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_reduce_line_frame_sorts_keeps_nan_free_rows_and_dtypes(method):
+    x, y = _series(20_000)
+    df = pd.DataFrame({"t": pd.date_range("2024-01-01", periods=len(x), freq="s"), "a": y, "b": -y,
+                       "n": np.arange(len(x), dtype=np.int32)}).iloc[::-1]
+    df.loc[df.index[5], "a"] = np.nan
+    out = reduce_line_frame(df, "t", ["a", "b"], max_points=1000, method=method)
+    assert out.columns.tolist() == ["t", "a", "b"] and out["t"].is_monotonic_increasing
+    assert len(out) <= 1100
+    assert out["t"].iloc[0] == df["t"].min() and out["t"].iloc[-1] == df["t"].max()
+    assert out["a"].max() == 25.0 and out["b"].max() == 30.0
+    assert out.dtypes.tolist() == df[["t", "a", "b"]].dtypes.tolist()
+
+def test_reduce_line_frame_leaves_small_frames_alone():
+    df = pd.DataFrame({"x": [3, 1, 2], "y": [1.0, 2.0, 3.0]})
+    pd.testing.assert_frame_equal(reduce_line_frame(df, "x", ["y", "x"], max_points=10), df)
+
+def test_bin_scatter_shape_and_counts():
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({"x": rng.normal(size=50_000), "y": rng.normal(size=50_000)})
+    df.loc[:99, "x"] = np.nan
+    out = bin_scatter(df, "x", "y", bins=40)
+    assert out.columns.tolist() == ["x", "y", "count"]
+    assert 0 < len(out) <= 40 * 40 and (out["count"] > 0).all()
+    assert out["count"].sum() == len(df) - 100
+    assert out["x"].between(df["x"].min(), df["x"].max()).all()
+    assert not out.duplicated(["x", "y"]).any()
+
+def test_budgets_follow_chart_width():
+    assert points_for_width(800) == 1600 and points_for_width(10_000) == 5000 and points_for_width(10) == 100
+    assert bins_for_width(800) == 70 and bins_for_width(40) == 10
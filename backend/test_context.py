@@ -0,0 +1,96 @@
+import pandas as pd
+
+from context import ESTIMATE_MARGIN, ConversationContext, dataset_context, estimate_tokens, extractive_summarize
+
+
+def _messages(n, words=60):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "word " * words}
+            for i in range(n)]
+
+def _dense_counter(calls):
+    """A provider whose tokenizer yields twice the estimate (e.g. code or numbers)."""
+    def count(text):
+        calls.append(text)
+        return 2 * estimate_tokens(text)
+    return count
+
+def test_without_a_counter_estimates_carry_the_margin():
+    ctx = ConversationContext(budget_tokens=1000, verbatim_turns=50)
+    prompt = ctx.build(_messages(40))
+    assert estimate_tokens(prompt) * ESTIMATE_MARGIN <= 1000
+    assert ctx.last_stats["prompt_tokens"] <= 1000 and not ctx.last_stats["prompt_tokens_counted"]
+
+def test_counter_rebuilds_an_over_budget_prompt_and_recalibrates():
+    calls = []
+    ctx = ConversationContext(budget_tokens=1000, verbatim_turns=50)
+    prompt = ctx.build(_messages(40), count_tokens=_dense_counter(calls))
+    assert len(calls) == 2                                  # counted, over budget, rebuilt, counted
+    assert 2 * estimate_tokens(prompt) <= 1000
+    assert ctx.last_stats["prompt_tokens"] == 2 * estimate_tokens(prompt) and ctx.last_stats["prompt_tokens_counted"]
+    calls.clear()
+    ctx.build(_messages(42), count_tokens=_dense_counter(calls))
+    assert len(calls) == 1                                  # calibrated: fits on the first try
+
+def test_sparse_tokenizer_lets_more_context_in():
+    plain = ConversationContext(budget_tokens=1000, verbatim_turns=50)
+    counted = ConversationContext(budget_tokens=1000, verbatim_turns=50)
+    for n in (40, 60):                                      # the first build calibrates
+        plain.build(_messages(n))
+        counted.build(_messages(n), count_tokens=lambda text: estimate_tokens(text) // 2)
+    assert counted.last_stats["verbatim_turns"] > plain.last_stats["verbatim_turns"]
+
+def test_failed_count_falls_back_to_the_estimate():
+    ctx = ConversationContext(budget_tokens=1000, verbatim_turns=50)
+    prompt = ctx.build(_messages(40), count_tokens=lambda text: None)
+    assert ctx.scale == ESTIMATE_MARGIN and estimate_tokens(prompt) * ESTIMATE_MARGIN <= 1000
+
+
+def _section(prompt, title):
+    return prompt.split(title + "\n", 1)[1].split("\n\n", 1)[0] if title in prompt else ""
+
+def test_long_sessions_stay_within_budget():
+    ctx = ConversationContext(budget_tokens=800, verbatim_turns=6)
+    df = pd.DataFrame({"a": range(5000), "b": ["x"] * 5000})
+    for n in range(2, 200, 7):
+        prompt = ctx.build(_messages(n), instructions="Be brief.", dataset=df)
+        assert estimate_tokens(prompt) * ESTIMATE_MARGIN <= 800
+        assert f"turn {n - 1} " in prompt                # the newest turn is always there
+    assert ctx.last_stats["verbatim_turns"] <= 6 and ctx.last_stats["folded_turns"] >= 190
+
+def test_folded_turns_are_never_resent():
+    ctx = ConversationContext(budget_tokens=2000, verbatim_turns=4)
+    folds = []
+    def summarize(previous, new, max_tokens):
+        folds.append([m["content"].split()[1] for m in new])
+        return extractive_summarize(previous, new, max_tokens)
+    ctx.summarize = summarize
+    for n in range(1, 30):
+        prompt = ctx.build(_messages(n, words=10))
+        verbatim = _section(prompt, "Conversation (most recent):")
+        assert all(f"turn {i} " not in verbatim for i in range(ctx.folded))
+    folded = [t for batch in folds for t in batch]
+    assert folded == [str(i) for i in range(len(folded))]   # each turn folded exactly once, in order
+    assert ctx.folded == len(folded) == 25
+    assert "Summary of earlier conversation:" in prompt
+
+def test_truncated_history_restarts_the_summary():
+    ctx = ConversationContext(budget_tokens=2000, verbatim_turns=2)
+    ctx.build(_messages(10))
+    assert ctx.folded == 8
+    ctx.build(_messages(3))
+    assert ctx.folded == 1 and "turn 0" in ctx.summary and "turn 5" not in ctx.summary
+
+def test_pins_replace_by_key_and_newest_win():
+    ctx = ConversationContext(budget_tokens=400)
+    for i in range(20):
+        ctx.pin(f"result {i}", "value " * 10)
+    ctx.pin("result 0", "replaced")
+    pins = _section(ctx.build(_messages(1)), "Pinned results:")
+    assert "result 19" in pins and "result 1:" not in pins
+    assert pins.splitlines()[-1] == "- result 0: replaced"
+
+def test_dataset_context_fits_its_share():
+    df = pd.DataFrame({"a": range(10_000), "s": [f"row {i}" for i in range(10_000)]})
+    text = dataset_context(df, 300)
+    assert estimate_tokens(text) <= 300 and text.startswith("Shape: 10000 rows x 2 columns")
+    assert "First " in text
@@ -0,0 +1,122 @@
+import os
+import threading
+
+import matplotlib
+import pandas as pd
+import pytest
+
+from execution import (ExecResult, ExecutionCache, cache_key, changes_style, execute_snippet, mutates_df,
+                       run_snippet_cached)
+
+
+@pytest.mark.parametrize("code", [
+    "df['x'] = 1",
+    "df.loc[0, 'a'] = 5",
+    "df.a += 1",
+    "del df['a']",
+    "df.dropna(inplace=True)",
+    "df.insert(0, 'y', 0)",
+    "df.pop('a')",
+])
+def test_mutates_df_detects_in_place_changes(code):
+    assert mutates_df(code)
+
+@pytest.mark.parametrize("code", [
+    "print(df.describe())",
+    "out = df.copy()\nout['x'] = 1",
+    "df2 = df[df.a > 0]",
+    "x = df.dropna(inplace=False)",
+    "this is not python",
+])
+def test_mutates_df_ignores_reads(code):
+    assert not mutates_df(code)
+
+def test_cache_key_ignores_formatting_but_not_data():
+    assert cache_key("print(df.a.mean())", "fp") == cache_key("print( df.a.mean() )  # mean", "fp")
+    assert cache_key("print(df.a.mean())", "fp") != cache_key("print(df.a.mean())", "other")
+
+
+def _plot(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(b"png")
+    return str(path)
+
+def test_lru_evicts_oldest_and_removes_its_artifact(tmp_path):
+    cache = ExecutionCache(max_entries=2, cache_dir=str(tmp_path / "cache"))
+    cache.put("a", "fp", ExecResult("A", None, _plot(tmp_path, "a.png")))
+    cache.put("b", "fp", ExecResult("B", None, None))
+    assert cache.get("a").stdout == "A"          # a is now the most recently used
+    cache.put("c", "fp", ExecResult("C", None, None))
+    assert cache.get("b") is None
+    hit = cache.get("a")
+    assert hit.cached and os.path.exists(hit.plot_path)
+    cache.put("d", "fp", ExecResult("D", None, None))
+    cache.put("e", "fp", ExecResult("E", None, None))
+    assert cache.get("a") is None
+    assert not os.listdir(tmp_path / "cache")    # evicted entry took its figure with it
+    assert len(cache) == 2
+
+def test_invalidate_by_fingerprint(tmp_path):
+    cache = ExecutionCache(cache_dir=str(tmp_path))
+    cache.put("a", "fp1", ExecResult("A", None, None))
+    cache.put("b", "fp2", ExecResult("B", None, None))
+    assert cache.invalidate("fp1") == 1
+    assert cache.get("a") is None and cache.get("b") is not None
+
+def test_mutating_snippet_is_never_memoized(tmp_path):
+    cache = ExecutionCache(cache_dir=str(tmp_path))
+    df = pd.DataFrame({"a": [1, 2, 3]})
+    first = run_snippet_cached("df['a'] = df['a'] * 2", df, "fp", cache)
+    second = run_snippet_cached("df['a'] = df['a'] * 2", df, "fp", cache)
+    assert first.mutates_df and not second.cached
+    assert df["a"].tolist() == [4, 8, 12]
+    assert len(cache) == 0
+
+def test_unchanged_snippet_hits_cache(tmp_path):
+    cache = ExecutionCache(cache_dir=str(tmp_path))
+    df = pd.DataFrame({"a": [1, 2, 3]})
+    assert not run_snippet_cached("x = df.a.sum()", df, "fp", cache).cached
+    assert run_snippet_cached("x = df.a.sum()  # again", df, "fp", cache).cached
+    assert not run_snippet_cached("x = df.a.sum()", df, "other", cache).cached
+
+def test_output_is_captured_after_stdout_is_replaced(tmp_path, capsys):
+    df = pd.DataFrame({"a": [1, 2, 3]})
+    assert execute_snippet("print(df.a.sum())", df).stdout.strip() == "6"
+    with capsys.disabled():                      # swaps sys.stdout after the wrapper was installed
+        assert execute_snippet("print(df.a.max())", df).stdout.strip() == "3"
+    assert capsys.readouterr().out == ""
+
+@pytest.mark.parametrize("code, styled", [
+    ("sns.set_theme(style='darkgrid')", True),
+    ("plt.rcParams['lines.linewidth'] = 3", True),
+    ("plt.style.use('ggplot')", True),
+    ("with sns.axes_style('white'):\n    plt.plot([1])", True),
+    ("import matplotlib as mpl\nmpl.rc('font', size=8)", True),
+    ("ax = df.plot()\nax.set_title('x')", False),
+    ("sns.histplot(df.a)", False),
+])
+def test_changes_style(code, styled):
+    assert changes_style(code) is styled
+
+def test_style_changes_do_not_leak_into_later_executions():
+    df = pd.DataFrame({"a": [1, 2, 3]})
+    before = dict(matplotlib.rcParams)
+    r = execute_snippet("sns.set_theme(style='darkgrid')\nplt.rcParams['lines.linewidth'] = 7\n"
+                        "print(plt.rcParams['lines.linewidth'])\nplt.plot(df.a)", df)
+    assert r.error is None and r.stdout.strip() == "7.0" and r.plot_path
+    assert dict(matplotlib.rcParams) == before
+
+def test_concurrent_executions_keep_their_own_figures():
+    df = pd.DataFrame({"a": [1, 2, 3]})
+    barrier = threading.Barrier(2, timeout=10)
+    results = [None, None]
+    def run(i):
+        results[i] = execute_snippet(f"plt.figure()\nplt.plot(df.a * {i + 1})\nbarrier.wait()\n"
+                                     "print(len(plt.get_fignums()))", df, extra_ns={"barrier": barrier})
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [r.stdout.strip() for r in results] == ["1", "1"]
+    assert all(r.error is None and r.plot_path for r in results)
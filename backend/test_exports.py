@@ -0,0 +1,84 @@
+import functools
+import io
+import threading
+
+import pytest
+from pptx import Presentation
+
+from exports import ArtifactCache, StaleBuild, VersionLock, pptx_bytes
+
+
+def _deck(n_slides=1):
+    prs = Presentation()
+    for i in range(n_slides):
+        prs.slides.add_slide(prs.slide_layouts[5]).shapes.title.text = f"Slide {i}"
+    return prs
+
+def _insert(prs, lock):
+    """A slide insert the way the app does it: mutate and bump the version under the lock."""
+    with lock:
+        prs.slides.add_slide(prs.slide_layouts[5])
+        lock.version += 1
+
+def _n_slides(data):
+    return len(Presentation(io.BytesIO(data)).slides)
+
+
+def test_version_lock_is_a_lock_with_a_version():
+    lock = VersionLock(version=3)
+    with lock as held:
+        assert held is lock and lock._lock.locked()
+    assert not lock._lock.locked() and lock.version == 3
+
+def test_pptx_bytes_refuses_a_stale_version():
+    prs, lock = _deck(), VersionLock()
+    assert _n_slides(pptx_bytes(prs, lock, version=0)) == 1
+    _insert(prs, lock)
+    with pytest.raises(StaleBuild):
+        pptx_bytes(prs, lock, version=0)
+    assert _n_slides(pptx_bytes(prs, lock, version=None)) == 2
+
+
+def test_lru_is_bounded_by_bytes_and_versions_replace_each_other():
+    cache = ArtifactCache(max_bytes=10, workers=1)
+    assert cache.get_or_build(("pdf", "a", 1), lambda: b"12345") == b"12345"
+    cache.get_or_build(("pdf", "a", 2), lambda: b"123")
+    assert cache.get(("pdf", "a", 1)) is None             # a newer version drops the old one
+    cache.get_or_build(("pdf", "b", 1), lambda: b"12345678")
+    assert cache.get(("pdf", "a", 2)) is None and cache.nbytes() == 8
+    assert cache.get_or_build(("pdf", "b", 1), lambda: pytest.fail("rebuilt")) == b"12345678"
+    assert cache.hits == 1
+
+def test_submit_builds_once_and_get_or_build_waits_for_it():
+    cache = ArtifactCache(workers=1)
+    started, release, done = threading.Event(), threading.Event(), []
+    def build():
+        started.set()
+        release.wait(5)
+        return b"deck"
+    fut = cache.submit(("pptx", "a", 1), build, on_done=done.append)
+    assert cache.submit(("pptx", "a", 1), build) is fut
+    started.wait(5)
+    release.set()
+    assert cache.get_or_build(("pptx", "a", 1), lambda: pytest.fail("built twice")) == b"deck"
+    assert done == [b"deck"] and cache.builds == 1
+
+def test_stale_background_build_stores_nothing():
+    prs, lock = _deck(), VersionLock()
+    cache = ArtifactCache(workers=1)
+    build = functools.partial(pptx_bytes, prs, lock, version=0)
+    _insert(prs, lock)
+    assert cache.submit(("pptx", "a", 0), build).result(5) is None
+    assert not cache.ready(("pptx", "a", 0)) and len(cache) == 0
+
+def test_stale_synchronous_build_returns_the_current_deck_uncached():
+    prs, lock = _deck(), VersionLock()
+    cache = ArtifactCache(workers=1)
+    build = functools.partial(pptx_bytes, prs, lock, version=0)
+    _insert(prs, lock)                                     # another thread got in after the key was read
+    data = cache.get_or_build(("pptx", "a", 0), build)
+    assert _n_slides(data) == 2
+    assert len(cache) == 0                                 # not stored under the old version's key
+    current = functools.partial(pptx_bytes, prs, lock, version=1)
+    assert cache.get_or_build(("pptx", "a", 1), current) == data
+    assert cache.ready(("pptx", "a", 1))
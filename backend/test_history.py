@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from history import HistoryStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path))
+
+def _frame():
+    return pd.DataFrame({"x": np.arange(5.0), "n": np.arange(5), "s": pd.array(list("abcde"), dtype="string[pyarrow]")})
+
+def test_round_trip_keeps_values_and_dtypes(store):
+    df = _frame()
+    entry = store.add(df, "data.csv")
+    out = store.load(entry)
+    pd.testing.assert_frame_equal(out, df)
+    assert store.load(entry, columns=["n"]).columns.tolist() == ["n"]
+
+def test_same_content_is_stored_once(store):
+    a = store.add(_frame(), "a.csv")
+    b = store.add(_frame(), "b.csv")
+    assert a["hash"] == b["hash"] and len(store.entries()) == 2
+    assert len(os.listdir(store.objects_dir)) == 1
+    store.delete(a["id"])
+    assert os.path.exists(store.object_path(b))
+    store.delete(b["id"])
+    assert not os.listdir(store.objects_dir)
+
+def test_writable_load_accepts_in_place_edits(store):
+    entry = store.add(_frame(), "data.csv")
+    df = store.load(entry, writable=True)
+    df.loc[0, "x"] = 9.0
+    df.iloc[1, 1] = 7
+    df["x"] *= 2
+    df.loc[2, "s"] = "z"
+    assert df["x"].tolist() == [18.0, 2.0, 4.0, 6.0, 8.0]
+    assert df["n"].tolist() == [0, 7, 2, 3, 4]
+    assert store.load(entry)["x"].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]    # stored copy untouched
+
+def test_mixed_type_columns_are_stored_as_text(store):
+    df = pd.DataFrame({"code": [1, "A7", 2.5, None], "when": [pd.Timestamp("2024-01-01"), "n/a", None, None],
+                       "n": [1, 2, 3, 4]})
+    out = store.load(store.add(df, "mixed.csv"))
+    assert out["code"].tolist()[:3] == ["1", "A7", "2.5"] and pd.isna(out["code"].iloc[3])
+    assert out["when"].iloc[1] == "n/a"
+    assert out["n"].tolist() == [1, 2, 3, 4]
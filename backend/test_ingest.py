@@ -0,0 +1,128 @@
+import datetime
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingest
+from ingest import (dataframe_fingerprint, list_excel_sheets, optimize_dtypes, prune_excel_cache, read_excel_sheets,
+                    stack_sheets)
+
+
+def _dtypes(df, **kwargs):
+    opt, report = optimize_dtypes(df, **kwargs)
+    assert [r["dtype_after"] for r in report] == [str(t) for t in opt.dtypes]
+    return {c: str(t) for c, t in opt.dtypes.items()}
+
+def test_ints_downcast_to_int32_at_most():
+    df = pd.DataFrame({"small": [0, 1, 200], "neg": [-5, 0, 5], "wide": [0, 1, 2**40],
+                       "unsigned": np.array([3, 5, 7], dtype=np.uint8), "narrow": np.array([1, 2, 3], dtype=np.int16),
+                       "nullable": pd.array([1, None, 3], dtype="Int64")})
+    assert _dtypes(df) == {"small": "int32", "neg": "int32", "wide": "int64", "unsigned": "int32",
+                           "narrow": "int16", "nullable": "Int32"}
+
+def test_arithmetic_on_optimized_ints_does_not_wrap():
+    df = pd.DataFrame({"a": [20, 50, 100, 120], "u": [3, 5, 7, 9]})
+    opt, _ = optimize_dtypes(df)
+    assert (opt["a"] * 2).tolist() == [40, 100, 200, 240]
+    assert (opt["a"] + 100).tolist() == [120, 150, 200, 220]
+    assert (opt["u"] - 5).tolist() == [-2, 0, 2, 4]
+    assert opt["a"].sum() == 290
+
+def test_floats_downcast_only_when_lossless():
+    df = pd.DataFrame({"halves": [0.5, 1.25, np.nan], "tenths": [0.1, 0.2, 0.3]})
+    assert _dtypes(df) == {"halves": "float32", "tenths": "float64"}
+    assert _dtypes(df, float_precision="float32")["tenths"] == "float32"
+
+def test_strings_become_category_or_arrow():
+    n = 1000
+    df = pd.DataFrame({
+        "site": ["north", "south"] * (n // 2),
+        "id": [f"row-{i}" for i in range(n)],
+        "mixed": [1, "a"] * (n // 2),
+        "flag": [True, False] * (n // 2),
+    })
+    dtypes = _dtypes(df)
+    assert dtypes["site"] == "category"
+    assert dtypes["id"] == "string"
+    assert dtypes["mixed"] == "object"
+    assert dtypes["flag"] == "bool"
+
+def test_optimization_shrinks_and_keeps_values():
+    df = pd.DataFrame({"a": np.arange(10_000), "s": ["x", "y"] * 5_000})
+    opt, report = optimize_dtypes(df)
+    assert sum(r["bytes_after"] for r in report) < sum(r["bytes_before"] for r in report)
+    pd.testing.assert_frame_equal(opt.astype(object), df.astype(object))
+
+def test_fingerprint_tracks_content_and_schema():
+    df = pd.DataFrame({"a": [1, 2, 3]})
+    assert dataframe_fingerprint(df) == dataframe_fingerprint(df.copy())
+    assert dataframe_fingerprint(df) != dataframe_fingerprint(df.assign(a=[1, 2, 4]))
+    assert dataframe_fingerprint(df) != dataframe_fingerprint(df.astype("int32"))
+
+def test_stacked_sheets_keep_a_user_sheet_column():
+    frames = {"Jan": pd.DataFrame({"sheet": ["a"], "v": [1]}), "Feb": pd.DataFrame({"v": [2], "sheet_1": [0]})}
+    out = stack_sheets(frames)
+    assert out.columns.tolist() == ["sheet", "v", "sheet_2", "sheet_1"]
+    assert out["sheet_2"].tolist() == ["Jan", "Feb"] and out["sheet"].iloc[0] == "a"
+    assert stack_sheets({"Only": pd.DataFrame({"v": [1]})})["sheet"].tolist() == ["Only"]
+
+def test_cached_sheet_keeps_non_string_headers(tmp_path, monkeypatch):
+    buf = io.BytesIO()
+    pd.DataFrame([[1, 2, 3, 4]], columns=["name", 2023, 2.5, datetime.datetime(2024, 1, 1)]).to_excel(buf, index=False)
+    fresh = read_excel_sheets(buf.getvalue(), [0], cache_dir=str(tmp_path))[0]
+    assert fresh.columns.tolist() == ["name", 2023, 2.5, pd.Timestamp("2024-01-01")]
+    monkeypatch.setattr(ingest, "_parse_sheet", lambda *a: pytest.fail("cache missed"))
+    cached = read_excel_sheets(buf.getvalue(), [0], cache_dir=str(tmp_path))[0]
+    pd.testing.assert_frame_equal(cached, fresh)
+    assert [type(c) for c in cached.columns] == [type(c) for c in fresh.columns]
+
+
+def _workbook(**sheets):
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf) as xw:
+        for name, df in sheets.items():
+            df.to_excel(xw, sheet_name=name, index=False)
+    return buf.getvalue()
+
+def test_sheet_cache_misses_once_then_hits(tmp_path, monkeypatch):
+    data = _workbook(a=pd.DataFrame({"x": [1, 2]}), b=pd.DataFrame({"y": ["p", "q"]}))
+    parsed = []
+    parse = ingest._parse_sheet
+    monkeypatch.setattr(ingest, "_parse_sheet", lambda d, sheet: parsed.append(sheet) or parse(d, sheet))
+    first = read_excel_sheets(data, cache_dir=str(tmp_path))
+    assert list(first) == list_excel_sheets(data) == ["a", "b"] and sorted(parsed) == ["a", "b"]
+    again = read_excel_sheets(data, cache_dir=str(tmp_path))
+    assert sorted(parsed) == ["a", "b"]                  # both served from the Arrow cache
+    for name in first:
+        pd.testing.assert_frame_equal(again[name], first[name])
+    read_excel_sheets(data, ["a", 1], cache_dir=str(tmp_path))
+    assert sorted(parsed, key=str) == [1, "a", "b"]      # index and name are cached separately
+    changed = _workbook(a=pd.DataFrame({"x": [3]}))
+    assert read_excel_sheets(changed, ["a"], cache_dir=str(tmp_path))["a"]["x"].tolist() == [3]
+
+def _fake_workbook_cache(root, name, n_bytes, mtime):
+    d = root / name
+    d.mkdir()
+    (d / "sheet.arrow").write_bytes(b"x" * n_bytes)
+    os.utime(d, (mtime, mtime))
+
+def test_prune_drops_least_recently_used_workbooks(tmp_path):
+    _fake_workbook_cache(tmp_path, "old", 400, 1_000)
+    _fake_workbook_cache(tmp_path, "mid", 400, 2_000)
+    _fake_workbook_cache(tmp_path, "new", 400, 3_000)
+    assert prune_excel_cache(str(tmp_path), max_bytes=1000) == 400
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["mid", "new"]
+    assert prune_excel_cache(str(tmp_path), max_bytes=100, keep=("mid",)) == 400
+    assert [p.name for p in tmp_path.iterdir()] == ["mid"]
+    assert prune_excel_cache(str(tmp_path / "missing"), max_bytes=0) == 0
+
+def test_reading_a_new_workbook_enforces_the_cap(tmp_path, monkeypatch):
+    _fake_workbook_cache(tmp_path, "stale", 10_000, 1_000)
+    monkeypatch.setattr(ingest, "prune_excel_cache",
+                        lambda cache_dir, keep=(), p=ingest.prune_excel_cache: p(cache_dir, max_bytes=5_000, keep=keep))
+    read_excel_sheets(_workbook(a=pd.DataFrame({"x": [1]})), cache_dir=str(tmp_path))
+    names = [p.name for p in tmp_path.iterdir()]
+    assert "stale" not in names and len(names) == 1      # the workbook just read is kept
@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+
+import llm
+from llm import FakeProvider, LLMClient, LLMError, TokenBucket, UnavailableProvider, is_retryable
+
+
+class HTTPError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+class ServiceUnavailable(Exception):
+    pass
+
+class Flaky:
+    """Fails with the given exceptions in turn, then answers."""
+    name = "flaky"
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def generate(self, prompt, json_mode=False, timeout=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    """Record each backoff cap instead of sleeping."""
+    caps = []
+    monkeypatch.setattr(llm.random, "uniform", lambda lo, hi: caps.append(hi) or 0.0)
+    return caps
+
+def _client(provider, **kwargs):
+    kwargs = {"rate_per_min": 60_000, "burst": 100, "timeout_s": 5, **kwargs}
+    return LLMClient(provider, **kwargs)
+
+def test_bucket_allows_a_burst_then_refills():
+    bucket = TokenBucket(rate=50, capacity=2)
+    assert bucket.acquire(timeout=0) and bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=0)
+    t0 = time.monotonic()
+    assert bucket.acquire(timeout=1)
+    assert 0.01 <= time.monotonic() - t0 < 0.5        # waited about one refill interval (20 ms)
+    time.sleep(0.1)
+    assert bucket.acquire(timeout=0) and bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=0)               # refill never exceeds the capacity
+
+def test_rate_limited_client_gives_up_after_its_timeout():
+    client = _client(FakeProvider(), rate_per_min=0.6, burst=1, timeout_s=0.05)
+    assert client.generate("a").text
+    with pytest.raises(LLMError, match="rate limit"):
+        client.generate("b")
+
+def test_concurrency_is_capped():
+    active, peak, lock = [0], [0], threading.Lock()
+
+    class Slow:
+        name = "slow"
+        def generate(self, prompt, json_mode=False, timeout=None):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return prompt
+
+    client = _client(Slow(), max_concurrency=2)
+    out = []
+    threads = [threading.Thread(target=lambda i=i: out.append(client.generate(str(i)).text)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(out, key=int) == [str(i) for i in range(8)]
+    assert peak[0] == 2
+
+@pytest.mark.parametrize("error", [HTTPError(429), HTTPError(503), HTTPError(500), ServiceUnavailable()])
+def test_quota_and_server_errors_are_retried_with_growing_backoff(error, backoffs):
+    provider = Flaky(error, error)
+    resp = _client(provider).generate("x")
+    assert resp.text == "ok" and resp.attempts == 3 and provider.calls == 3
+    assert backoffs == [1.0, 2.0]
+
+def test_backoff_is_capped_and_retries_run_out(backoffs, monkeypatch):
+    monkeypatch.setattr(llm, "BACKOFF_MAX_S", 3.0)
+    provider = Flaky(*[HTTPError(429)] * 10)
+    with pytest.raises(LLMError, match="HTTP 429"):
+        _client(provider, max_retries=4).generate("x")
+    assert provider.calls == 5 and backoffs == [1.0, 2.0, 3.0, 3.0]
+
+def test_client_errors_are_not_retried(backoffs):
+    provider = Flaky(HTTPError(400))
+    with pytest.raises(LLMError):
+        _client(provider).generate("x")
+    assert provider.calls == 1 and backoffs == []
+    with pytest.raises(llm.LLMUnavailable):
+        _client(UnavailableProvider("no key")).generate("x")
+
+def test_retryable_classification():
+    class GrpcError(Exception):
+        def code(self):
+            return 504
+    assert is_retryable(GrpcError()) and is_retryable(TimeoutError()) and is_retryable(HTTPError(408))
+    assert not is_retryable(HTTPError(404)) and not is_retryable(ValueError())
+
+def test_count_tokens_uses_the_provider_or_gives_none():
+    class Counting(FakeProvider):
+        def count_tokens(self, text, timeout=None):
+            return len(text.split())
+
+    class Broken(FakeProvider):
+        def count_tokens(self, text, timeout=None):
+            raise HTTPError(503)
+
+    assert _client(Counting()).count_tokens("three word prompt") == 3
+    assert _client(FakeProvider()).count_tokens("x") is None
+    assert _client(Broken()).count_tokens("x") is None
@@ -0,0 +1,21 @@
+import json
+
+import loadtest
+
+
+def test_smoke_two_sessions(tmp_path, monkeypatch):
+    # configure_env writes these into this process's environment; monkeypatch puts them back
+    for var, value in (("LLM_PROVIDER", "fake"), ("FAKE_LLM_LATENCY_MS", "0"), ("LLM_RATE_PER_MIN", "100000"),
+                       ("LLM_BURST", "2"), ("LLM_MAX_CONCURRENCY", "1"), ("SESSION_PERSIST", "0")):
+        monkeypatch.setenv(var, value)
+    for var, sub in (("SESSIONS_DIR", "sessions"), ("HISTORY_DIR", "datasets"), ("TRACE_DIR", "traces"),
+                     ("SESSION_SPILL_DIR", "spill")):
+        monkeypatch.setenv(var, str(tmp_path / sub))
+    out = tmp_path / "load.json"
+    rc = loadtest.main(["--sessions", "2", "--concurrency", "1", "--rows", "300", "--cols", "4",
+                        "--llm-latency-ms", "0", "--soffice-ms", "0", "--timeout", "60", "--out", str(out)])
+    res = json.loads(out.read_text())
+    assert rc == 0, res["first_errors"]
+    assert res["sessions"] == 2 and res["overall"]["errors"] == 0
+    assert {name: s["count"] for name, s in res["steps"].items()} == {step: 2 for step in loadtest.STEPS}
+    assert res["overall"]["p95"] > 0 and res["session_state_mb"]["max"] is not None
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis import auto_select_dependent, pearson_corr_with_pvalues, run_hypothesis_tests, run_regression
+from progressive import (ProgressiveJob, estimate_corr, estimate_describe, estimate_hypothesis, estimate_regression,
+                         grouping_column, sample_order, sample_sizes)
+
+
+@pytest.fixture(scope="module")
+def df():
+    rng = np.random.default_rng(0)
+    n = 5000
+    a = rng.normal(10, 2, n)
+    out = pd.DataFrame({"site": rng.choice(["north", "south", "east"], n, p=[0.6, 0.3, 0.1]),
+                        "a": a, "b": 0.5 * a + rng.normal(0, 1, n), "c": rng.normal(0, 5, n)})
+    out.loc[rng.choice(n, 50, replace=False), "c"] = np.nan
+    return out
+
+def _run(fn, df, **kwargs):
+    job = ProgressiveJob(fn, df, first=500, **kwargs)
+    job._thread.join(30)
+    assert job.done and job.error is None
+    return job
+
+def test_stages_are_nested_and_end_exact(df):
+    assert sample_sizes(5000, first=500) == [500, 2000, 5000]
+    order = sample_order(df, seed=1)
+    assert sorted(order.tolist()) == list(range(len(df)))
+    job = _run(estimate_describe, df)
+    assert job.latest["exact"] and job.latest["n"] == job.latest["n_total"] == len(df)
+
+def test_stratified_prefixes_keep_group_shares(df):
+    order = sample_order(df, stratify="site")
+    shares = df["site"].value_counts(normalize=True)
+    prefix = df["site"].iloc[order[:200]].value_counts(normalize=True)
+    assert (prefix - shares).abs().max() < 0.02
+
+def test_exact_describe_has_zero_width_intervals(df):
+    res = _run(estimate_describe, df).latest["result"]
+    num = df.select_dtypes("number")
+    assert np.allclose(res["mean"], num.mean()) and np.allclose(res["std"], num.std())
+    assert np.allclose(res["mean_ci_low"], res["mean_ci_high"])
+    assert res["non_null (est.)"].to_dict() == num.count().to_dict()
+
+def test_exact_corr_matches_the_non_progressive_pvalues(df):
+    res = _run(estimate_corr, df).latest["result"]
+    corr, pvals = pearson_corr_with_pvalues(df)
+    np.testing.assert_allclose(res["corr"].to_numpy(), corr.to_numpy(dtype=float), rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(res["pvalues"].to_numpy(), pvals.to_numpy(dtype=float), rtol=1e-6, atol=1e-300)
+
+def test_exact_regression_matches_the_non_progressive_model(df):
+    dep = auto_select_dependent(df)
+    res = _run(lambda s, n: estimate_regression(s, n, dep=dep), df).latest["result"]
+    ref = run_regression(df, dep=dep)
+    assert res["dependent"] == dep and res["summary"] == ref["summary"]
+    assert res["rsquared"] == pytest.approx(ref["rsquared"], rel=1e-9)
+    for name, coef in ref["params"].items():
+        assert res["params"].loc[name, "coef"] == pytest.approx(coef, rel=1e-7, abs=1e-9)
+    assert "p_value" in res["params"]
+
+def test_exact_hypothesis_matches_the_non_progressive_tests(df):
+    gcol = grouping_column(df)
+    assert gcol == "site"
+    res = _run(lambda s, n: estimate_hypothesis(s, n, group_col=gcol), df, stratify=gcol).latest["result"]
+    ref = run_hypothesis_tests(df)
+    assert {k: v for k, v in res.items() if k != "group_means"} == ref
+    means = df.groupby("site")[ref["anova"]["column"]].mean()
+    for site, m in means.items():
+        assert res["group_means"][site]["mean"] == pytest.approx(m)
+        assert res["group_means"][site]["ci_low"] == pytest.approx(m)
+
+def test_failing_analysis_reports_the_error(df):
+    def boom(sample, n_total):
+        raise ValueError("bad column")
+    job = ProgressiveJob(boom, df, first=500)
+    job._thread.join(30)
+    assert job.done and job.error == "bad column" and job.latest is None
+    assert job.wait_first(timeout=0.1) is None
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pptx import Presentation
+
+from session_memory import MemoryAccountant, Spilled, is_archived, load_message, nbytes
+
+
+def _accountant(tmp_path, **kwargs):
+    kwargs = {"spill": {"df": "frame", "ppt": "deck"}, "drop": ("derived",), "spill_idle_s": 0,
+              "root": str(tmp_path), "sweep_interval_s": 0, **kwargs}
+    return MemoryAccountant(**kwargs)
+
+def _frame(n=1000):
+    return pd.DataFrame({"x": np.arange(n, dtype=np.float64), "n": np.arange(n),
+                         "s": pd.array([f"r{i}" for i in range(n)], dtype="string[pyarrow]")})
+
+def _rerun(acc, key, state):
+    restored = acc.begin(key, state)
+    acc.end(key, state)
+    return restored
+
+def test_nbytes():
+    df = _frame()
+    assert nbytes(df) == df.memory_usage(deep=True).sum()
+    assert nbytes([b"abc", "de"]) > 5
+    assert nbytes(Spilled("frame", "x.arrow", 10**9)) == 0
+
+def test_spill_and_reload_gives_a_writable_frame(tmp_path):
+    acc = _accountant(tmp_path, total_budget_mb=0)
+    df = _frame()
+    state = {"df": df, "derived": object(), "messages": []}
+    _rerun(acc, "s1", state)                     # over the budget and not running: spilled at once
+    assert isinstance(state["df"], Spilled) and state["df"].path.endswith(".arrow")
+    assert "derived" not in state
+    assert acc.stats()["spilled_bytes"] > 0
+
+    acc.total_budget = float("inf")
+    assert acc.begin("s1", state) == ["df"]
+    pd.testing.assert_frame_equal(state["df"], df)
+    state["df"].loc[0, "x"] = 9.0
+    state["df"].iloc[1, 1] = 7
+    state["df"]["x"] *= 2
+    assert state["df"]["x"].iloc[:2].tolist() == [18.0, 2.0]
+
+def test_frames_arrow_cannot_round_trip_spill_as_pickle(tmp_path):
+    acc = _accountant(tmp_path, total_budget_mb=0)
+    df = pd.DataFrame({1: [1, 2], "b": ["x", "y"]}, index=[10, 20])
+    state = {"df": df}
+    _rerun(acc, "s1", state)
+    assert state["df"].path.endswith(".pkl")
+    acc.begin("s1", state)
+    pd.testing.assert_frame_equal(state["df"], df)
+
+def test_deck_spill_round_trip(tmp_path):
+    acc = _accountant(tmp_path, total_budget_mb=0)
+    prs = Presentation()
+    prs.slides.add_slide(prs.slide_layouts[5]).shapes.title.text = "Kept"
+    state = {"ppt": prs}
+    _rerun(acc, "s1", state)
+    assert isinstance(state["ppt"], Spilled)
+    acc.begin("s1", state)
+    assert state["ppt"].slides[0].shapes.title.text == "Kept"
+
+def test_running_session_is_never_spilled(tmp_path):
+    acc = _accountant(tmp_path)
+    state = {"df": _frame()}
+    _rerun(acc, "s1", state)
+    acc.begin("s1", state)                       # the next rerun is in progress
+    acc.total_budget = 0
+    acc.enforce()
+    assert not isinstance(state["df"], Spilled)
+
+def test_old_messages_archived_over_session_budget(tmp_path):
+    acc = _accountant(tmp_path, session_budget_mb=0, keep_messages=2)
+    msgs = [{"role": "user", "content": f"message {i} " * 50} for i in range(5)]
+    state = {"messages": list(msgs)}
+    _rerun(acc, "s1", state)
+    assert [is_archived(m) for m in state["messages"]] == [True, True, True, False, False]
+    assert [load_message(m) for m in state["messages"]] == [m["content"] for m in msgs]
+
+def test_idle_sessions_are_evicted(tmp_path):
+    evicted = []
+    acc = _accountant(tmp_path, idle_timeout_s=0, on_evict=lambda key, state: evicted.append(key))
+    state = {"df": _frame(), "messages": [{"role": "user", "content": "hi"}]}
+    _rerun(acc, "s1", state)
+    assert evicted == ["s1"]
+    assert isinstance(state["df"], Spilled) and is_archived(state["messages"][0])
+    assert acc.stats()["evicted_sessions"] == 1
+
+def test_forget_removes_spill_files(tmp_path):
+    acc = _accountant(tmp_path, total_budget_mb=0)
+    state = {"df": _frame()}
+    _rerun(acc, "s1", state)
+    acc.forget("s1")
+    assert not list(tmp_path.iterdir())
+    with pytest.raises(FileNotFoundError):
+        state["df"].load()
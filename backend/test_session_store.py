@@ -0,0 +1,120 @@
+import json
+import os
+import time
+
+import session_store
+from session_store import SessionLog, SessionStore, referenced_blobs
+
+EDITOR = {"title": "Slide Title", "text": "", "selected_plot": None}
+
+
+def _sync(log, **overrides):
+    kwargs = dict(messages=[], msg_plot_map={}, last_plot=None, editor=EDITOR, deck_version=0,
+                  deck_bytes=lambda: None, previews=[], dataset=None, settings={})
+    kwargs.update(overrides)
+    log.sync(**kwargs)
+
+def _file(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+def _age(path, seconds):
+    old = time.time() - seconds
+    os.utime(path, (old, old))
+
+
+def test_replay_rebuilds_state(tmp_path):
+    log = SessionLog(str(tmp_path), "s1")
+    msgs = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+    _sync(log, messages=msgs, settings={"font_size_pt": 14},
+          dataset={"hash": "abc", "name": "data.csv", "columns": None})
+    _sync(log, messages=msgs[:1])                       # conversation cut back to one turn
+    _sync(log, messages=msgs[:1] + [{"role": "assistant", "content": "again"}], deck_version=1,
+          deck_bytes=lambda: b"pptx")
+
+    reopened = SessionLog(str(tmp_path), "s1")
+    assert reopened.state == log.state
+    assert [m["content"] for m in reopened.state["messages"]] == ["hi", "again"]
+    assert reopened.state["settings"] == {"font_size_pt": 14}
+    assert reopened.state["dataset"]["hash"] == "abc"
+    with open(reopened.blob_path(reopened.state["deck"]["ref"]), "rb") as f:
+        assert f.read() == b"pptx"
+
+def test_sync_without_changes_appends_nothing(tmp_path):
+    log = SessionLog(str(tmp_path), "s1")
+    _sync(log, messages=[{"role": "user", "content": "hi"}])
+    seq = log.seq
+    _sync(log, messages=[{"role": "user", "content": "hi"}])
+    assert log.seq == seq
+
+def test_compaction_truncates_log_and_replays_identically(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_store, "SNAPSHOT_EVERY", 5)
+    log = SessionLog(str(tmp_path), "s1")
+    msgs = [{"role": "user", "content": str(i)} for i in range(12)]
+    for i in range(1, len(msgs) + 1):
+        _sync(log, messages=msgs[:i])
+    assert os.path.exists(log.snapshot_path)
+    with open(log.log_path, encoding="utf-8") as f:
+        assert len(f.readlines()) < 5
+    assert SessionLog(str(tmp_path), "s1").state == log.state
+
+def test_torn_tail_is_ignored(tmp_path):
+    log = SessionLog(str(tmp_path), "s1")
+    _sync(log, messages=[{"role": "user", "content": "hi"}])
+    with open(log.log_path, "a", encoding="utf-8") as f:
+        f.write('{"seq": 99, "type": "mess')
+    assert SessionLog(str(tmp_path), "s1").state["messages"] == [{"role": "user", "content": "hi"}]
+
+def test_compaction_collects_unreferenced_blobs(tmp_path):
+    log = SessionLog(str(tmp_path / "sessions"), "s1")
+    old, new = _file(tmp_path, "old.png", b"1"), _file(tmp_path, "new.png", b"2")
+    _sync(log, last_plot=old)
+    _sync(log, last_plot=new)
+    assert len(os.listdir(log.blobs_dir)) == 2
+    for name in os.listdir(log.blobs_dir):
+        _age(os.path.join(log.blobs_dir, name), 3600)
+    log.snapshot()
+    assert os.listdir(log.blobs_dir) == [log.state["last_plot"]]
+    assert referenced_blobs(log.state) == {log.state["last_plot"]}
+
+def test_compaction_keeps_recent_blobs(tmp_path):
+    log = SessionLog(str(tmp_path / "sessions"), "s1")
+    ref = log.put_bytes(b"not logged yet", ".png")
+    log.snapshot()
+    assert os.path.exists(log.blob_path(ref))
+
+def test_reused_blob_counts_as_new(tmp_path):
+    log = SessionLog(str(tmp_path / "sessions"), "s1")
+    ref = log.put_bytes(b"same bytes", ".png")
+    _age(log.blob_path(ref), 3600)
+    assert log.put_bytes(b"same bytes", ".png") == ref     # stored again before its event is logged
+    log.snapshot()
+    assert os.path.exists(log.blob_path(ref))
+
+
+def test_claim_binds_session_to_one_owner(tmp_path):
+    store = SessionStore(str(tmp_path))
+    assert store.claim("sid", "tab-a")
+    assert not store.claim("sid", "tab-b")
+    assert store.claim("sid", "tab-a")
+    assert store.claim("sid", "tab-b", ttl_s=0)     # a silent owner loses the claim
+
+def test_prune_removes_only_expired_closed_sessions(tmp_path):
+    store = SessionStore(str(tmp_path))
+    for sid in ("old", "fresh", "open"):
+        _sync(store.open(sid), messages=[{"role": "user", "content": sid}])
+    store.close("old")
+    store.close("fresh")
+    for sid in ("old", "open"):
+        for root, dirs, files in os.walk(tmp_path / sid):
+            for name in dirs + files + ["."]:
+                _age(os.path.join(root, name), 40 * 86400)
+    assert store.prune(ttl_s=30 * 86400) == 1
+    assert sorted(os.listdir(tmp_path)) == ["fresh", "open"]
+
+def test_session_ids_are_sanitized(tmp_path):
+    store = SessionStore(str(tmp_path))
+    store.open("../../escape")
+    assert all(os.path.dirname(os.path.join(tmp_path, d)) == str(tmp_path) for d in os.listdir(tmp_path))
+    assert json.dumps(store.open("../../escape").state)
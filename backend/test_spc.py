@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from spc import D2_MR, XBAR_R_CONSTANTS, cusum, cusum_first_signal, run_spc, western_electric
+
+
+def _row(result, column):
+    assert "error" not in result
+    return result["summary"].loc[column]
+
+def test_imr_limits_from_moving_range():
+    x = [10.0, 12.0, 11.0, 13.0, 12.0, 14.0]
+    row = _row(run_spc(pd.DataFrame({"x": x})), "x")
+    mr_bar = np.mean(np.abs(np.diff(x)))
+    assert row["center"] == pytest.approx(np.mean(x))
+    assert row["mr_bar"] == pytest.approx(mr_bar)
+    assert row["ucl"] == pytest.approx(np.mean(x) + 3 * mr_bar / D2_MR)
+    assert row["lcl"] == pytest.approx(np.mean(x) - 3 * mr_bar / D2_MR)
+    assert row["sigma_overall"] == pytest.approx(np.std(x, ddof=1))
+
+def test_xbar_r_limits():
+    rng = np.random.default_rng(0)
+    x = rng.normal(50, 2, 103)                       # a short last subgroup is dropped
+    row = _row(run_spc(pd.DataFrame({"x": x}), subgroup_size=5), "x")
+    groups = x[:100].reshape(-1, 5)
+    xbarbar, r_bar = groups.mean(axis=1).mean(), np.ptp(groups, axis=1).mean()
+    a2, d3, d4, d2 = XBAR_R_CONSTANTS[5]
+    assert row["center"] == pytest.approx(xbarbar)
+    assert row["ucl"] == pytest.approx(xbarbar + a2 * r_bar)
+    assert row["r_ucl"] == pytest.approx(d4 * r_bar)
+    assert row["sigma_within"] == pytest.approx(r_bar / d2)
+
+def test_capability_with_one_sided_spec():
+    x = np.tile([9.0, 10.0, 11.0, 10.0], 25)
+    row = _row(run_spc(pd.DataFrame({"x": x}), spec_limits={"x": (None, 13.0)}), "x")
+    assert np.isnan(row["cp"])
+    assert row["cpk"] == pytest.approx((13.0 - 10.0) / (3 * row["sigma_within"]))
+
+def test_western_electric_rules():
+    x = np.zeros((20, 1))
+    x[3] = 4                                         # rule 1 at row 3
+    x[10:18] = 0.5                                   # rule 4 completes at row 17
+    rules = western_electric(x, np.zeros(1), np.ones(1))
+    assert np.flatnonzero(rules[1][:, 0]).tolist() == [3]
+    assert np.flatnonzero(rules[4][:, 0]).tolist() == [17]
+    assert not rules[2].any() and not rules[3].any()
+
+def test_missing_points_never_count():
+    x = np.full((10, 1), np.nan)
+    rules = western_electric(x, np.zeros(1), np.ones(1))
+    assert not any(mask.any() for mask in rules.values())
+
+def test_cusum_matches_tabular_recursion():
+    rng = np.random.default_rng(1)
+    x = rng.normal(0, 1, (300, 2))
+    x[150:, 0] += 1.5
+    x[::11, 1] = np.nan
+    c_plus, c_minus, h = cusum(x, np.zeros(2), np.ones(2))
+    up, dn = np.zeros(2), np.zeros(2)
+    for i, row in enumerate(np.nan_to_num(x)):
+        up = np.maximum(0, up + row - 0.5 * ~np.isnan(x[i]))
+        dn = np.maximum(0, dn - row - 0.5 * ~np.isnan(x[i]))
+        np.testing.assert_allclose(c_plus[i], up, atol=1e-9)
+        np.testing.assert_allclose(c_minus[i], dn, atol=1e-9)
+    assert (c_plus[150:, 0] > h[0]).any()
+
+def test_cusum_first_signal_matches_full_cusum():
+    rng = np.random.default_rng(1)
+    x = rng.normal(0, 0.2, (5000, 4))                # quiet relative to sigma=1: no false alarms
+    x[3000:, 1] += 1.0                               # drift up
+    x[1000:, 2] -= 2.0                               # drift down
+    x[::7, 3] = np.nan
+    center, sigma = np.zeros(4), np.ones(4)
+    c_plus, c_minus, h = cusum(x, center, sigma)
+    hit = (c_plus > h) | (c_minus > h)
+    expected = np.where(hit.any(axis=0), hit.argmax(axis=0), -1)
+    np.testing.assert_array_equal(cusum_first_signal(x, center, sigma, block=256), expected)
+    assert expected[0] == -1 and 3000 <= expected[1] < 3020 and 1000 <= expected[2] < 1010
+
+def test_float32_columns_match_float64():
+    rng = np.random.default_rng(2)
+    x = rng.normal(100, 5, (2000, 3)).astype(np.float32)
+    df32 = pd.DataFrame(x, columns=list("abc"))
+    s32 = run_spc(df32)["summary"]
+    s64 = run_spc(df32.astype(np.float64))["summary"]
+    pd.testing.assert_frame_equal(s32, s64, rtol=1e-5)
+
+def test_column_order_is_kept_across_dtype_groups():
+    df = pd.DataFrame({"a": np.arange(10.0), "b": np.arange(10, dtype=np.float32),
+                       "name": list("abcdefghij"), "c": np.arange(10, dtype=np.int64)})
+    assert run_spc(df)["summary"].index.tolist() == ["a", "b", "c"]
+
+def test_errors():
+    df = pd.DataFrame({"x": np.arange(20.0), "s": ["a"] * 20})
+    assert "error" in run_spc(df, subgroup_size=11)
+    assert run_spc(df[["s"]]) == {"error": "No numeric columns for SPC."}
+    assert run_spc(df.head(2)) == {"error": "Not enough rows for control limits."}
@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+
+from history import HistoryStore
+from sql_engine import SQLEngine, snippet_fingerprint, table_name, uses_sql
+
+
+@pytest.fixture
+def engine():
+    eng = SQLEngine(memory_limit="256MB", threads=1)
+    yield eng
+    eng.con.close()
+
+def test_table_name():
+    assert table_name("Sales 2024.csv") == "sales_2024"
+    assert table_name("2024.xlsx") == "t_2024"
+    assert table_name("!!!") == "dataset"
+    assert table_name("data.csv", taken={"data", "data_2"}) == "data_3"
+
+def test_uses_sql():
+    assert uses_sql('out = sql ("SELECT 1")')
+    assert not uses_sql("print(df.mysql_col)")
+
+def test_sync_history_registers_entries(engine, tmp_path):
+    store = HistoryStore(str(tmp_path))
+    store.add(pd.DataFrame({"a": [1, 2, 3]}), "sales.csv")
+    store.add(pd.DataFrame({"b": [10, 20]}), "Sales.csv")
+    engine.register_frame("df", pd.DataFrame({"a": [1]}))
+    engine.sync_history(store)
+    assert engine.tables() == ["df", "sales", "sales_2"]
+    assert engine.query("SELECT sum(a) AS s FROM sales")["s"].iloc[0] == 6
+    assert engine.query("SELECT count(*) AS n FROM sales_2")["n"].iloc[0] == 2
+
+def test_sync_history_is_noop_until_index_changes(engine, tmp_path):
+    store = HistoryStore(str(tmp_path))
+    store.add(pd.DataFrame({"a": [1]}), "one.csv")
+    engine.sync_history(store)
+    fp = engine.fingerprint()
+    engine.sync_history(store)
+    assert engine.fingerprint() == fp
+    entry = store.add(pd.DataFrame({"a": [2]}), "two.csv")
+    engine.sync_history(store)
+    assert engine.tables() == ["one", "two"] and engine.fingerprint() != fp
+    store.delete(entry["id"])
+    engine.sync_history(store)
+    assert engine.tables() == ["one"]
+
+def test_truncated_results_are_marked(engine, capsys):
+    engine.register_frame("t", pd.DataFrame({"a": range(10)}))
+    exact = engine.query("SELECT * FROM t", max_rows=10)
+    assert len(exact) == 10 and "truncated_at" not in exact.attrs
+    cut = engine.query("SELECT * FROM t", max_rows=4)
+    assert len(cut) == 4 and cut.attrs["truncated_at"] == 4
+    engine.namespace()["sql"]("SELECT * FROM t", max_rows=4)
+    assert "truncated to the first 4 rows" in capsys.readouterr().out
+
+def test_snippet_fingerprint_covers_catalog_only_for_sql_snippets():
+    assert snippet_fingerprint("print(df.a.sum())", "fp", "cat") == "fp"
+    assert snippet_fingerprint("sql('SELECT 1')", "fp", "cat") == "fp+sql:cat"
+    assert snippet_fingerprint("sql('SELECT 1')", "fp", None) == "fp"
+    assert snippet_fingerprint("sql('SELECT 1')", None, "cat") is None
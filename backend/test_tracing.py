@@ -0,0 +1,86 @@
+import json
+import threading
+
+import pytest
+
+import tracing
+from tracing import JSONLExporter, finish_run, in_current_context, span, start_run
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(tracing, "ENABLED", True)
+
+def _read(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+def test_spans_nest_and_record_attributes(tmp_path):
+    run = start_run(session_id="s1", label="rerun")
+    with span("outer", rows=10) as outer:
+        with span("inner") as inner:
+            inner.set(cache_hit=True)
+        with span("sibling"):
+            pass
+        outer.set(bytes=5)
+    with span("second"):
+        pass
+    finish_run(run, exporter=JSONLExporter(str(tmp_path / "spans.jsonl")))
+    assert [(s.name, s.depth) for s in run.spans] == [("outer", 0), ("inner", 1), ("sibling", 1), ("second", 0)]
+    assert run.spans[0].attrs == {"rows": 10, "bytes": 5} and run.spans[1].attrs == {"cache_hit": True}
+    assert run.spans[0].duration_ms >= run.spans[1].duration_ms
+    assert [r["stage"] for r in run.breakdown()] == ["outer", "  inner", "  sibling", "second"]
+
+def test_failed_span_records_the_error_and_resets_depth(tmp_path):
+    run = start_run()
+    with pytest.raises(ValueError):
+        with span("boom"):
+            raise ValueError("x")
+    with span("after"):
+        pass
+    finish_run(run, exporter=JSONLExporter(str(tmp_path / "spans.jsonl")))
+    assert run.spans[0].attrs == {"error": "ValueError"}
+    assert run.spans[1].depth == 0 and run.spans[1].duration_ms is not None
+
+def test_spans_outside_a_run_are_no_ops():
+    with span("orphan", rows=1) as sp:
+        sp.set(bytes=2)
+    assert tracing.current_run() is None
+
+def test_worker_spans_land_in_the_callers_run(tmp_path):
+    run = start_run()
+    with span("parent"):
+        def work():
+            with span("worker"):
+                pass
+        t = threading.Thread(target=in_current_context(work))
+        t.start()
+        t.join()
+    finish_run(run, exporter=JSONLExporter(str(tmp_path / "spans.jsonl")))
+    assert [(s.name, s.depth) for s in run.spans] == [("parent", 0), ("worker", 1)]
+
+def test_jsonl_export_writes_one_line_per_span_once(tmp_path):
+    path = tmp_path / "traces" / "spans.jsonl"
+    exporter = JSONLExporter(str(path))
+    run = start_run(session_id="s1", label="upload")
+    with span("ingest.read_table", file="a.csv"):
+        with span("ingest.optimize_dtypes"):
+            pass
+    finish_run(run, interrupted=True, exporter=exporter)
+    finish_run(run, exporter=exporter)                     # second call is a no-op
+    recs = _read(path)
+    assert [r["name"] for r in recs] == ["ingest.read_table", "ingest.optimize_dtypes"]
+    assert {r["run_id"] for r in recs} == {run.run_id}
+    assert recs[0]["session_id"] == "s1" and recs[0]["run_label"] == "upload" and recs[0]["interrupted"]
+    assert recs[0]["attrs"] == {"file": "a.csv"} and recs[1]["depth"] == 1
+    assert recs[0]["run_ms"] == run.duration_ms
+
+def test_export_rotates_large_files(tmp_path, monkeypatch):
+    path = tmp_path / "spans.jsonl"
+    path.write_text("x" * 100)
+    monkeypatch.setattr(tracing, "MAX_FILE_BYTES", 50)
+    run = start_run()
+    with span("stage"):
+        pass
+    finish_run(run, exporter=JSONLExporter(str(path)))
+    assert (tmp_path / "spans.jsonl.1").read_text() == "x" * 100
+    assert [r["name"] for r in _read(path)] == ["stage"]
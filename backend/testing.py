@@ -2,87 +2,131 @@
 # Keep original features: Gemini integration, safe python execution, slide editor, live preview, PPTX export.
 
 import os
-os.environ["PATH"] += os.pathsep + r"C:\Program Files\LibreOffice\program"
-os.environ["PATH"] += os.pathsep + r"C:\Program Files\poppler-24.08.0\Library\bin"
-
-import io, contextlib, subprocess, tempfile, time, shutil, traceback, re, json, base64
+import time, re, json, base64, uuid, functools
 from dotenv import load_dotenv
 
 import streamlit as st
 import streamlit.components.v1 as components
 import pandas as pd
 import plotly.express as px
-import google.generativeai as genai
-import matplotlib.pyplot as plt
-import seaborn as sns
 from pptx import Presentation
-from pptx.util import Inches, Pt
-from PIL import Image, ImageDraw, ImageFont
-from pptx.enum.shapes import MSO_SHAPE_TYPE
-from pptx.enum.text import PP_ALIGN
-
-# Optional libs
-try:
-    from pdf2image import convert_from_path
-    PDF2IMAGE_AVAILABLE = True
-except Exception:
-    PDF2IMAGE_AVAILABLE = False
-
-try:
-    from streamlit_autorefresh import st_autorefresh
-    AUTOREFRESH_AVAILABLE = True
-except Exception:
-    AUTOREFRESH_AVAILABLE = False
-
-# Stats & ML optional libs
-try:
-    import scipy.stats as stats
-except Exception:
-    stats = None
-
-try:
-    import statsmodels.api as sm
-    from statsmodels.formula.api import ols
-    STATSMODELS_AVAILABLE = True
-except Exception:
-    STATSMODELS_AVAILABLE = False
 
-try:
-    from sklearn.linear_model import LinearRegression
-    from sklearn.preprocessing import StandardScaler
-    SKLEARN_AVAILABLE = True
-except Exception:
-    SKLEARN_AVAILABLE = False
-
-try:
-    from reportlab.lib.pagesizes import letter
-    from reportlab.pdfgen import canvas
-    REPORTLAB_AVAILABLE = True
-except Exception:
-    REPORTLAB_AVAILABLE = False
-
-# ---------------------- utils ----------------------
-def _which(cmd):
-    return shutil.which(cmd) is not None
-
-SOFFICE_OK = _which("soffice")
-POPPLER_OK = _which("pdftoppm")
+# Pure helpers (importable without launching the app)
+import slides
+import charts
+import tracing
+from tracing import span
+from ingest import (read_table_auto, read_excel_sheets, list_excel_sheets, stack_sheets, optimize_dtypes,
+                    dataframe_fingerprint)
+from analysis import (stats, perform_descriptive_stats, pearson_corr_with_pvalues, auto_select_dependent,
+                      run_regression, run_hypothesis_tests, suggest_next_experiments)
+from report import generate_pdf_bytes
+from exports import ArtifactCache, VersionLock, pptx_bytes
+from history import HistoryStore
+from session_store import SessionStore
+from execution import ExecutionCache, run_snippet_cached, PLOT_DIR
+import spc
+import sql_engine
+from context import ConversationContext, dataset_context
+import autodeck
+import progressive
+import llm
+import session_memory
+from slides import SOFFICE_OK, POPPLER_OK, PDF2IMAGE_AVAILABLE
+
+# st.fragment (Streamlit >= 1.37; experimental_fragment before): reruns just one function
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
 
 # -------------------- session state --------------------
 st.set_page_config(page_title="AI CSV Interpreter v3 — Slide Editor", layout="wide")
 ss = st.session_state
 
+# -------------------- memory accounting (reload what was spilled while idle) --------------------
+def _session_state_handle():
+    """This session's SessionState: outlives the rerun, so idle sessions can be spilled from other threads."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+    except Exception:
+        return None
+    state = getattr(ctx, "session_state", None)
+    return getattr(state, "_state", state)
+
+def _evict_session(key, state):
+    # the persistence log keeps its own copy of every message; an evicted session reopens it on return
+    if SESSION_PERSIST and "session_id" in state:
+        session_store().close(state["session_id"])
+
+@st.cache_resource
+def memory_accountant():
+    return session_memory.MemoryAccountant(
+        spill={"df": "frame", "ppt": "deck"},
+        # both hold references to df; rebuilt on demand
+        drop=("sql_engine", "progressive_jobs"),
+        locks={"ppt": "deck_lock"},
+        # only turns already folded into the chat summary are archived
+        archivable=lambda state: state["chat_context"].folded if "chat_context" in state else 0,
+        on_evict=_evict_session)
+
+if "memory_key" not in ss: ss.memory_key = uuid.uuid4().hex  # one per browser session (session_id may be shared)
+_mem_state = _session_state_handle()
+try:
+    memory_accountant().begin(ss.memory_key, _mem_state if _mem_state is not None else ss, shared=_mem_state is not None)
+except Exception as e:
+    st.warning("Could not reload spilled session data: " + str(e)[:200])
+
 # core session keys
 if "ppt" not in ss: ss.ppt = Presentation()
 if "messages" not in ss: ss.messages = []          # list of dicts: {role, content}
+if "chat_context" not in ss: ss.chat_context = ConversationContext()  # bounded prompt builder over ss.messages
 if "df" not in ss: ss.df = None
+if "df_upload_key" not in ss: ss.df_upload_key = None  # identifies the upload ss.df was ingested from
+if "df_memory_report" not in ss: ss.df_memory_report = []
+if "excel_sheets" not in ss: ss.excel_sheets = (None, [])  # (upload id, sheet names) of the last workbook
+if "df_fingerprint" not in ss: ss.df_fingerprint = None  # content hash of ss.df, keys per-dataset caches
+if "df_name" not in ss: ss.df_name = None                # file (or history entry) name of ss.df
+if "df_source" not in ss: ss.df_source = None  # {"hash", "columns"} of the history entry ss.df was loaded as, if any
 if "msg_plot_map" not in ss: ss.msg_plot_map = {}   # {msg_idx: img_path}
 if "last_plot_path" not in ss: ss.last_plot_path = None
 if "preview_images" not in ss: ss.preview_images = []
-if "preview_dirty" not in ss: ss.preview_dirty = True
-if "autorefresh_on" not in ss: ss.autorefresh_on = False
-if "refresh_interval_ms" not in ss: ss.refresh_interval_ms = 5000
+if "preview_dirty" not in ss: ss.preview_dirty = True    # forced re-render (manual refresh, restore without previews)
+if "preview_version" not in ss: ss.preview_version = None  # deck_version ss.preview_images were rendered from
 if "slide_idx" not in ss: ss.slide_idx = 1
+if "deck_version" not in ss: ss.deck_version = 0     # bumped on every change to ss.ppt
+if "deck_lock" not in ss: ss.deck_lock = VersionLock()  # held while ss.ppt is mutated or serialized
+if "session_id" not in ss:
+    # a stable id in the URL lets a reconnecting browser (or a restarted server) restore this session
+    try:
+        ss.session_id = st.query_params.get("sid") or uuid.uuid4().hex
+        st.query_params["sid"] = ss.session_id
+    except Exception:
+        ss.session_id = uuid.uuid4().hex
+if "session_restored" not in ss: ss.session_restored = False
+if "trace_history" not in ss: ss.trace_history = []   # last few finished TraceRuns (newest last)
+if "show_latency_panel" not in ss: ss.show_latency_panel = False
+if "progressive_jobs" not in ss: ss.progressive_jobs = {}   # {(kind, fingerprint): ProgressiveJob}
+if "spc_specs" not in ss: ss.spc_specs = {}          # {column: (LSL, USL)} for capability indices
+if "spc_result" not in ss: ss.spc_result = None      # (fingerprint, subgroup size, specs, run_spc result)
+if "progressive_show" not in ss: ss.progressive_show = set()  # {(kind, fingerprint)} panels to keep showing
+if "show_memory_panel" not in ss: ss.show_memory_panel = False
+
+# -------------------- tracing (one run per rerun) --------------------
+TRACE_HISTORY_LEN = 5
+
+def _finish_trace(run, interrupted=False):
+    if run is None or run.finished:
+        return
+    tracing.finish_run(run, interrupted=interrupted)
+    ss.trace_history = (ss.trace_history + [run])[-TRACE_HISTORY_LEN:]
+
+# a run that ended via st.rerun()/st.stop() never reached the end of the script
+_finish_trace(ss.get("trace_run"), interrupted=True)
+ss.trace_run = tracing.start_run(session_id=ss.session_id)
+
+# Interactive chart reduction
+if "chart_max_points" not in ss: ss.chart_max_points = charts.DEFAULT_MAX_POINTS
+if "chart_width_px" not in ss: ss.chart_width_px = 1200
+if "chart_line_method" not in ss: ss.chart_line_method = "lttb"
 
 # Slide Editor state
 if "slide_editor_title" not in ss: ss.slide_editor_title = "Slide Title"
@@ -96,313 +140,83 @@ if "img_width_in" not in ss: ss.img_width_in = 5.0
 if "img_height_in" not in ss: ss.img_height_in = 3.0
 if "reuse_layout" not in ss: ss.reuse_layout = False
 
-# -------------------- Gemini config --------------------
+# -------------------- LLM config --------------------
 load_dotenv()
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+
+@st.cache_resource
+def llm_client():
+    """One client per process: rate limit and concurrency cap are shared by all sessions."""
+    return llm.LLMClient(llm.make_provider())
+
+model = llm_client()
 st.title("📊 AI CSV Interpreter v3 — Slide Editor + PPT Export")
-st.caption(f"LibreOffice: {'✅' if SOFFICE_OK else '❌'} | Poppler: {'✅' if POPPLER_OK else '❌'} | pdf2image: {'✅' if PDF2IMAGE_AVAILABLE else '❌'}")
-if not GOOGLE_API_KEY:
-    st.error("Missing GOOGLE_API_KEY in .env. Add GOOGLE_API_KEY=... and restart.")
-    st.stop()
-genai.configure(api_key=GOOGLE_API_KEY)
-model = genai.GenerativeModel("gemini-1.5-flash-latest")
+st.caption(f"LibreOffice: {'✅' if SOFFICE_OK else '❌'} | Poppler: {'✅' if POPPLER_OK else '❌'} | pdf2image: {'✅' if PDF2IMAGE_AVAILABLE else '❌'} | LLM: {model.provider.name}")
+if not model.available:
+    # the rest of the app (analysis, charts, slides) works without a model
+    st.warning(model.provider.reason + " AI features are disabled.")
 
 # -------------------- helpers (existing + new) --------------------
-def read_csv_with_fallback(file):
-    encodings = ['utf-8', 'latin1', 'ISO-8859-1', 'cp1252']
-    for e in encodings:
-        try:
-            file.seek(0)
-            return pd.read_csv(file, encoding=e)
-        except Exception:
-            continue
-    raise Exception("Could not decode CSV with common encodings.")
-
-def read_table_auto(file, name):
-    """Support csv and xlsx"""
-    if name.lower().endswith(".csv"):
-        return read_csv_with_fallback(file)
-    elif name.lower().endswith((".xls", ".xlsx")):
-        try:
-            file.seek(0)
-            return pd.read_excel(file)
-        except Exception as e:
-            raise
-    else:
-        return read_csv_with_fallback(file)
+@st.cache_resource
+def execution_cache():
+    return ExecutionCache()
 
-def _save_matplotlib(msg_idx=None):
-    if not plt.get_fignums():
+def _sql():
+    """This session's SQL engine (current df + history tables), or None without duckdb."""
+    if not sql_engine.DUCKDB_AVAILABLE:
         return None
-    save_dir = os.path.join(tempfile.gettempdir(), "ai_saved_plots")
-    os.makedirs(save_dir, exist_ok=True)
-    path = os.path.join(save_dir, f"mpl_plot_msg{msg_idx or 'X'}_{int(time.time()*1000)}.png")
-    plt.savefig(path, dpi=150, bbox_inches='tight')
-    plt.close('all')
-    return path
-
-def _try_save_plotly(user_ns, msg_idx=None):
+    eng = ss.get("sql_engine")
+    if eng is None:
+        eng = ss.sql_engine = sql_engine.SQLEngine()
+    if ss.df is not None and eng.df_fingerprint != ss.df_fingerprint:
+        eng.register_frame("df", ss.df, ss.df_fingerprint)
+    eng.sync_history(history_store())
+    return eng
+
+def _snippet_sql():
+    """(extra namespace, catalog fingerprint) for snippets: sql() available, and snippets that
+    call it are keyed on every table's content, not just df (sql_engine.snippet_fingerprint)."""
     try:
-        fig = user_ns.get("fig", None)
-        if fig is None:
-            return None
-        save_dir = os.path.join(tempfile.gettempdir(), "ai_saved_plots")
-        os.makedirs(save_dir, exist_ok=True)
-        path = os.path.join(save_dir, f"plotly_msg{msg_idx or 'X'}_{int(time.time()*1000)}.png")
-        if hasattr(fig, "write_image"):
-            try:
-                fig.write_image(path, scale=2)
-                return path
-            except Exception:
-                pass
-        import plotly.io as pio
-        try:
-            pio.write_image(fig, path, scale=2)
-            return path
-        except Exception:
-            return None
+        eng = _sql()
     except Exception:
-        return None
+        eng = None
+    if eng is None:
+        return None, None
+    return eng.namespace(), eng.fingerprint()
 
-def run_generated_code(code, df, msg_idx=None):
+def run_generated_code(code, df, msg_idx=None, force=False):
     """
-    Execute code in isolated namespace. Capture stdout and matplotlib/plotly figures.
-    Returns (stdout_text, error_text).
+    Execute code (memoized by code, dataset fingerprint and library versions).
+    Returns (stdout_text, error_text, cached).
     """
-    out_buf = io.StringIO()
-    user_ns = {"df": df, "pd": pd, "plt": plt, "sns": sns, "px": px, "np": __import__("numpy")}
-    err = None
-    with contextlib.redirect_stdout(out_buf):
-        try:
-            exec(code, user_ns)
-        except Exception:
-            err = traceback.format_exc()
-    printed = out_buf.getvalue()
-    try:
-        plot_path = None
-        if plt.get_fignums():
-            plot_path = _save_matplotlib(msg_idx)
-        else:
-            plot_path = _try_save_plotly(user_ns, msg_idx)
-        if plot_path:
-            ss.last_plot_path = plot_path
-            if msg_idx is not None:
-                ss.msg_plot_map[msg_idx] = plot_path
-    except Exception as e:
-        err = (err + f"\nAdditionally failed saving plot: {e}") if err else f"Failed saving plot: {e}"
-    return printed, err
-
-# ---------- new analysis & export helpers ----------
-
-def perform_descriptive_stats(df):
-    out = {}
-    try:
-        out['describe'] = df.describe(include='all').to_dict()
-        numeric = df.select_dtypes(include='number')
-        out['ncols'] = numeric.shape[1]
-    except Exception as e:
-        out['error'] = str(e)
-    return out
-
-def pearson_corr_with_pvalues(df):
-    """Return DataFrame of correlations and p-values for numeric columns"""
-    num = df.select_dtypes(include='number')
-    cols = num.columns.tolist()
-    n = len(cols)
-    corr = pd.DataFrame(index=cols, columns=cols, dtype=float)
-    pvals = pd.DataFrame(index=cols, columns=cols, dtype=float)
-    for i in range(n):
-        for j in range(n):
-            x = num.iloc[:, i].dropna()
-            y = num.iloc[:, j].dropna()
-            # align indices by index intersection
-            xy = pd.concat([num.iloc[:, i], num.iloc[:, j]], axis=1).dropna()
-            if xy.shape[0] < 3 or (xy.iloc[:,0].std()==0 and xy.iloc[:,1].std()==0):
-                corr.iloc[i,j] = float('nan')
-                pvals.iloc[i,j] = float('nan')
-                continue
-            try:
-                r, p = stats.pearsonr(xy.iloc[:,0], xy.iloc[:,1]) if stats else (None,None)
-                corr.iloc[i,j] = r
-                pvals.iloc[i,j] = p
-            except Exception:
-                corr.iloc[i,j] = float('nan')
-                pvals.iloc[i,j] = float('nan')
-    return corr, pvals
-
-def auto_select_dependent(df):
-    """Pick dependent var heuristically: highest variance or last numeric column"""
-    num = df.select_dtypes(include='number')
-    if num.shape[1] == 0:
-        return None
-    try:
-        variances = num.var().sort_values(ascending=False)
-        return variances.index[0]
-    except Exception:
-        return num.columns[-1]
-
-def run_regression(df, dep=None):
-    """Run linear regression and return summary dict"""
-    num = df.select_dtypes(include='number').dropna()
-    if dep is None:
-        dep = auto_select_dependent(df)
-    if dep not in num.columns:
-        return {"error":"No numeric dependent variable found."}
-    X = num.drop(columns=[dep])
-    y = num[dep]
-    if X.shape[1] == 0:
-        return {"error":"No independent numeric columns found for regression."}
-    try:
-        if STATSMODELS_AVAILABLE:
-            # statsmodels requires adding constant
-            X2 = sm.add_constant(X)
-            model_sm = sm.OLS(y, X2).fit()
-            return {"summary": model_sm.summary().as_text(), "params": model_sm.params.to_dict(), "rsquared": float(model_sm.rsquared)}
-        elif SKLEARN_AVAILABLE:
-            lr = LinearRegression()
-            lr.fit(X.fillna(0), y.fillna(0))
-            params = dict(zip(X.columns, lr.coef_.tolist()))
-            return {"params": params, "intercept": float(lr.intercept_), "rsquared": None}
-        else:
-            return {"error":"No regression libs available (install statsmodels or scikit-learn)."}
-    except Exception as e:
-        return {"error": str(e)}
-
-def run_hypothesis_tests(df):
-    """Run candidate tests: t-test between groups if a 'group' column exists; Levene for variance differences; ANOVA if >2 groups"""
-    out = {}
-    num = df.select_dtypes(include='number')
-    # Try to detect categorical grouping column
-    cats = [c for c in df.columns if df[c].nunique() < 10 and df[c].dtype == object]
-    if not cats:
-        # try integer-coded groups
-        cats = [c for c in df.columns if df[c].nunique() < 10 and pd.api.types.is_integer_dtype(df[c].dtype)]
-    if cats:
-        gcol = cats[0]
-        groups = df.groupby(gcol)
-        if len(groups) >= 2:
-            # choose first numeric column for example
-            if num.shape[1] > 0:
-                col = num.columns[0]
-                samples = [grp[col].dropna().values for _, grp in groups]
-                try:
-                    if len(samples) == 2:
-                        tstat, p = stats.ttest_ind(samples[0], samples[1], equal_var=False)
-                        out['t_test'] = {"column":col, "tstat": float(tstat), "pvalue": float(p), "groups": list(groups.groups.keys())}
-                    elif len(samples) > 2:
-                        f, p = stats.f_oneway(*samples)
-                        out['anova'] = {"column":col, "fstat": float(f), "pvalue": float(p)}
-                    # Levene
-                    w, p_levene = stats.levene(*samples)
-                    out['levene'] = {"w": float(w), "pvalue": float(p_levene)}
-                except Exception as e:
-                    out['error'] = str(e)
-    else:
-        out['note'] = "No categorical grouping column detected to run t-test/ANOVA."
-    return out
-
-def suggest_next_experiments(df, target_col=None, top_k=3):
-    """Heuristic suggestions: select top correlated inputs and suggest +/- perturbations."""
-    suggestions = []
-    num = df.select_dtypes(include='number')
-    if num.shape[1] < 2:
-        return {"error": "Not enough numeric columns to make suggestions."}
-    if target_col is None:
-        target_col = auto_select_dependent(df)
-    if target_col not in num.columns:
-        return {"error": "Target column not found."}
-    # correlation
-    try:
-        corrs = num.corr()[target_col].abs().sort_values(ascending=False)
-        corrs = corrs.drop(index=[target_col])
-        tops = corrs.head(top_k).index.tolist()
-        for col in tops:
-            mean = num[col].mean()
-            std = num[col].std()
-            # suggest testing mean +/- 0.5*std
-            suggestions.append({
-                "variable": col,
-                "current_mean": float(mean),
-                "suggest_test_values": [float(max(mean - 0.5*std, mean*0.5)), float(mean + 0.5*std)]
-            })
-        return {"target": target_col, "suggestions": suggestions}
-    except Exception as e:
-        return {"error": str(e)}
+    extra_ns, catalog = _snippet_sql()
+    fingerprint = sql_engine.snippet_fingerprint(code, ss.df_fingerprint, catalog)
+    res = run_snippet_cached(code, df, fingerprint, execution_cache(), msg_idx=msg_idx, force=force, extra_ns=extra_ns)
+    # later chat turns see what the code produced without replaying whole conversations
+    result_text = res.stdout if not res.error else "error: " + res.error.strip().splitlines()[-1]
+    ss.chat_context.pin(f"code result (AI #{(msg_idx or 0) + 1})", result_text)
+    if res.mutates_df and df is ss.df:
+        # snippet changed the dataset in place: later cache lookups must see a new key
+        ss.df_fingerprint = dataframe_fingerprint(ss.df)
+        ss.df_source = None
+    if res.plot_path:
+        ss.last_plot_path = res.plot_path
+        if msg_idx is not None:
+            ss.msg_plot_map[msg_idx] = res.plot_path
+    return res.stdout, res.error, res.cached
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _data_uri(path, mtime):
+    with open(path, "rb") as f:
+        b = f.read()
+    return f"data:image/png;base64,{base64.b64encode(b).decode('ascii')}"
 
 def _img_to_data_uri(path: str) -> str:
+    # encoded once per (path, mtime), not on every render of the viewer
     try:
-        with open(path, "rb") as f:
-            b = f.read()
-        return f"data:image/png;base64,{base64.b64encode(b).decode('ascii')}"
+        return _data_uri(path, os.path.getmtime(path))
     except Exception:
         return ""
 
-# PDF export (reportlab or pillow fallback)
-def generate_pdf_report(text_blocks, image_paths, out_path=None, title="AI Report"):
-    if out_path is None:
-        out_path = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf").name
-    try:
-        if REPORTLAB_AVAILABLE:
-            c = canvas.Canvas(out_path, pagesize=letter)
-            width, height = letter
-            # Title
-            c.setFont("Helvetica-Bold", 16)
-            c.drawString(36, height - 50, title)
-            y = height - 80
-            c.setFont("Helvetica", 10)
-            for block in text_blocks:
-                for line in block.splitlines():
-                    if y < 80:
-                        c.showPage()
-                        y = height - 50
-                    c.drawString(36, y, line[:120])
-                    y -= 12
-                y -= 8
-            # images appended on new pages
-            for imgp in image_paths:
-                try:
-                    c.showPage()
-                    c.drawImage(imgp, 36, 72, width=width-72, preserveAspectRatio=True, anchor='c')
-                except Exception:
-                    pass
-            c.save()
-            return out_path
-        else:
-            # Pillow fallback: make multipage PDF by converting images and text to images
-            pages = []
-            W, H = 1100, 1400
-            fnt = ImageFont.load_default()
-            # first page: text
-            img = Image.new("RGB", (W, H), color=(255,255,255))
-            d = ImageDraw.Draw(img)
-            y = 40
-            d.text((36, y), title, font=fnt, fill=(0,0,0))
-            y += 30
-            for block in text_blocks:
-                for line in block.splitlines():
-                    d.text((36, y), line[:120], font=fnt, fill=(0,0,0))
-                    y += 14
-                    if y > H - 100:
-                        pages.append(img)
-                        img = Image.new("RGB", (W, H), color=(255,255,255))
-                        d = ImageDraw.Draw(img)
-                        y = 40
-            pages.append(img)
-            # image pages
-            for pth in image_paths:
-                try:
-                    im = Image.open(pth).convert("RGB")
-                    im.thumbnail((W-72, H-200))
-                    bg = Image.new("RGB", (W, H), color=(255,255,255))
-                    bg.paste(im, (36,100))
-                    pages.append(bg)
-                except Exception:
-                    pass
-            pages[0].save(out_path, save_all=True, append_images=pages[1:])
-            return out_path
-    except Exception as e:
-        raise
-
 def _html_viewer_template(img_data_uri: str, slide_idx: int, total: int) -> str:
     """Small, safe HTML template that displays an image and slide counter."""
     return f"""
@@ -484,204 +298,384 @@ def _render_floating_viewer(preview_images, slide_idx=1, height=420):
         components.html(f"<div style='color:red;padding:8px;'>Preview render error: {str(e)[:300]}</div>", height=120)
         return
 
-# -------------------- Updated add_slide_with_text_and_optional_image (kept identical logic) --------------------
+# -------------------- slide builder (session wrapper around slides.add_slide_with_text_and_optional_image) --------------------
 def add_slide_with_text_and_optional_image(title, text, image_path=None):
-    layout = ss.ppt.slide_layouts[1] if len(ss.ppt.slide_layouts) > 1 else ss.ppt.slide_layouts[5]
-    slide = ss.ppt.slides.add_slide(layout)
+    # a background export may be serializing the deck
+    with ss.deck_lock:
+        slides.add_slide_with_text_and_optional_image(
+            ss.ppt, title, text, image_path=image_path, layout_style=ss.layout_style,
+            font_size_pt=ss.font_size_pt, img_width_in=ss.img_width_in, img_height_in=ss.img_height_in)
+        # bumped under the lock, so a background export can tell which version it is saving
+        ss.deck_version += 1   # the preview re-renders from this alone
+        ss.deck_lock.version = ss.deck_version
 
-    # Title
+def generate_live_preview_images():
+    with ss.deck_lock:
+        return slides.generate_live_preview_images(ss.ppt, plot_paths=list(ss.msg_plot_map.values()))
+
+# -------------------- export artifacts (built once per deck/dataset version) --------------------
+@st.cache_resource
+def export_cache():
+    return ArtifactCache()
+
+# keyed by browser session: tabs sharing a ?sid= have separate decks
+def _pptx_key():
+    return ("pptx", ss.memory_key, ss.deck_version)
+
+def _build_pptx():
+    # a build that starts after a later slide insert is discarded, not stored as this version
+    return functools.partial(pptx_bytes, ss.ppt, ss.deck_lock, version=ss.deck_version)
+
+def _schedule_exports():
+    """Start building the current deck in the background, so the download is ready when clicked."""
+    if not len(ss.ppt.slides):
+        return
+    version = ss.deck_version
+    log = session_store().open(ss.session_id) if SESSION_PERSIST else None
+    export_cache().submit(_pptx_key(), _build_pptx(),
+                          on_done=(lambda data: log.record_deck(data, version)) if log is not None else None)
+
+def _pdf_key():
+    plot = ss.last_plot_path if ss.last_plot_path and os.path.exists(ss.last_plot_path) else None
+    return ("pdf", ss.memory_key, (ss.df_fingerprint, ss.df_name, plot, os.path.getmtime(plot) if plot else None))
+
+def _build_pdf(df, name, plot):
+    def build():
+        text_blocks = ["AI CSV Interpreter — Report", f"File: {name}"]
+        # include built-in stats textual summary
+        try:
+            desc = perform_descriptive_stats(df)
+            text_blocks.append("Descriptive statistics (summary):")
+            text_blocks.append(str(desc.get('describe', {})))
+        except Exception:
+            pass
+        return generate_pdf_bytes(text_blocks, [plot] if plot else [])
+    return build
+
+ALL_SHEETS = "All sheets (stacked)"
+
+# -------------------- dataset history --------------------
+@st.cache_resource
+def history_store():
+    return HistoryStore()
+
+def _render_history_browser():
+    """Reopen a past dataset from the history store, optionally loading only some columns."""
     try:
-        slide.shapes.title.text = title
-    except Exception:
-        slide.shapes.add_textbox(Inches(0.5), Inches(0.2), Inches(9), Inches(0.5)).text_frame.text = title
-
-    # Handle layouts
-    style = ss.layout_style
-    font_size = Pt(ss.font_size_pt)
-
-    if style == "Text only":
-        tx = slide.shapes.add_textbox(Inches(0.5), Inches(1), Inches(9), Inches(5))
-        tf = tx.text_frame
-        tf.clear()
-        p = tf.paragraphs[0]
-        p.text = text
-        p.font.size = font_size
-
-    elif style == "Image only" and image_path and os.path.exists(image_path):
-        slide.shapes.add_picture(image_path, Inches(1), Inches(1), width=Inches(ss.img_width_in), height=Inches(ss.img_height_in))
-
-    elif style == "Text + Image (side-by-side)":
-        # Text left
-        tx = slide.shapes.add_textbox(Inches(0.5), Inches(1), Inches(4.5), Inches(5))
-        tf = tx.text_frame
-        tf.clear()
-        p = tf.paragraphs[0]
-        p.text = text
-        p.font.size = font_size
-        # Image right
-        if image_path and os.path.exists(image_path):
-            slide.shapes.add_picture(image_path, Inches(5.2), Inches(1), width=Inches(ss.img_width_in), height=Inches(ss.img_height_in))
-
-    elif style == "Text top + Image bottom":
-        # Text on top
-        tx = slide.shapes.add_textbox(Inches(0.5), Inches(1), Inches(9), Inches(2))
-        tf = tx.text_frame
-        tf.clear()
-        p = tf.paragraphs[0]
-        p.text = text
-        p.font.size = font_size
-        # Image bottom
-        if image_path and os.path.exists(image_path):
-            slide.shapes.add_picture(image_path, Inches(1), Inches(3.2), width=Inches(ss.img_width_in), height=Inches(ss.img_height_in))
-
-    elif style == "2x2 Image Grid" and image_path and os.path.exists(image_path):
-        # duplicate same image into 4 slots
-        w, h = ss.img_width_in/2, ss.img_height_in/2
-        slide.shapes.add_picture(image_path, Inches(0.5), Inches(1), width=Inches(w), height=Inches(h))
-        slide.shapes.add_picture(image_path, Inches(5), Inches(1), width=Inches(w), height=Inches(h))
-        slide.shapes.add_picture(image_path, Inches(0.5), Inches(3.5), width=Inches(w), height=Inches(h))
-        slide.shapes.add_picture(image_path, Inches(5), Inches(3.5), width=Inches(w), height=Inches(h))
-
-    ss.preview_dirty = True
+        entries = history_store().entries()
+    except Exception as e:
+        st.caption("Dataset history unavailable: " + str(e))
+        return
+    if not entries:
+        return
+    with st.expander(f"📚 Dataset history ({len(entries)})", expanded=False):
+        labels = {e["id"]: f"{e['name']} — {e['rows']:,}×{e['cols']} — {time.strftime('%Y-%m-%d %H:%M', time.localtime(e['uploaded_at']))}"
+                  for e in entries}
+        entry_id = st.selectbox("Past dataset", list(labels), format_func=labels.get, key="history_pick")
+        entry = next(e for e in entries if e["id"] == entry_id)
+        cols = st.multiselect("Columns to load (empty = all)", list(entry["schema"]), key=f"history_cols_{entry_id}")
+        h1, h2 = st.columns([1, 1])
+        with h1:
+            if st.button("📂 Open dataset", key="history_open"):
+                try:
+                    df = history_store().load(entry, columns=cols or None, writable=True)
+                    st.session_state.df = df
+                    ss.df_fingerprint = entry["hash"] if not cols else dataframe_fingerprint(df)
+                    ss.df_source = {"hash": entry["hash"], "columns": list(cols) or None}
+                    ss.df_name = entry["name"] + (f" ({len(cols)} cols)" if cols else "")
+                    ss.df_memory_report = []
+                    ss.chat_context.pins.clear()   # pinned results describe the previous dataset
+                    st.success(f"Opened {ss.df_name} from history.")
+                    st.rerun()
+                except Exception as e:
+                    st.error("Failed to open dataset: " + str(e))
+        with h2:
+            if st.button("🗑 Remove from history", key="history_delete"):
+                history_store().delete(entry_id)
+                st.rerun()
 
-def generate_live_preview_images():
+# -------------------- chart data reduction (cached per dataset, x, y, width) --------------------
+@st.cache_data(max_entries=64, show_spinner=False)
+def _reduce_chart_data(fingerprint, kind, x, ys, width_px, max_points, method, _df):
+    """Bounded-size frame for the quick chart and when it was built. _df is not hashed (fingerprint keys it)."""
+    if len(_df) <= max_points:
+        return _df[list(dict.fromkeys([x, *ys]))], time.monotonic()
+    if kind == "Scatter":
+        bins = charts.bins_for_width(width_px, max_points)
+        parts = [charts.bin_scatter(_df, x, y, bins=bins).rename(columns={y: "value"}).assign(series=y)
+                 for y in ys if y != x]
+        return (pd.concat(parts, ignore_index=True) if parts else _df[[x]].iloc[:0]), time.monotonic()
+    budget = charts.points_for_width(width_px, max_points)
+    return charts.reduce_line_frame(_df, x, ys, max_points=budget, method=method), time.monotonic()
+
+def _quick_chart_data(fingerprint, kind, x, ys, width_px, max_points, method, df):
+    """(reduced frame, cache hit): a result built before this call came from the cache."""
+    t0 = time.monotonic()
+    data, built_at = _reduce_chart_data(fingerprint, kind, x, ys, width_px, max_points, method, df)
+    return data, built_at < t0
+
+# -------------------- progressive analytics (large frames) --------------------
+PROGRESSIVE_POLL_S = 0.5
+PROGRESSIVE_FIRST_WAIT_S = 0.2   # how long a rerun may wait for the first sample before showing a placeholder
+
+def _progressive_job(kind, setup):
     """
-    Render the current ss.ppt slides to image files and return list of image paths.
-    Tries:
-      - Save PPTX -> convert to PDF with soffice -> convert PDF pages to images via pdf2image
-      - Fallback: generate simple PNG preview images using slide text (PIL)
+    Job for (kind, current dataset); setup() -> (fn, stratify) runs only when a job is started.
+    A failed job is kept, not restarted: it would fail the same way until the dataset changes.
     """
-    imgs = []
-    try:
-        # save pptx to temp file
-        tmp_ppt = tempfile.NamedTemporaryFile(delete=False, suffix=".pptx")
-        ss.ppt.save(tmp_ppt.name)
-        tmp_ppt.close()
-
-        # Try LibreOffice conversion PPTX -> PDF
-        pdf_path = tmp_ppt.name.replace(".pptx", ".pdf")
-        if SOFFICE_OK:
-            try:
-                # Convert to PDF (headless)
-                cmd = ["soffice", "--headless", "--convert-to", "pdf", "--outdir", os.path.dirname(pdf_path), tmp_ppt.name]
-                subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30)
-                # If pdf2image available, convert PDF pages -> images
-                if PDF2IMAGE_AVAILABLE and os.path.exists(pdf_path):
-                    pages = convert_from_path(pdf_path, dpi=150)
-                    for i, page in enumerate(pages):
-                        out_png = tempfile.NamedTemporaryFile(delete=False, suffix=f"_slide{i+1}.png").name
-                        page.save(out_png, "PNG")
-                        imgs.append(out_png)
-                    # cleanup temp files if desired
-                    return imgs
-            except Exception:
-                # fallback path if conversion failed
-                pass
-
-        # If conversion not possible, attempt to create thumbnails from slide data (PIL fallback)
-        from PIL import Image, ImageDraw, ImageFont
-
-        def _render_slide_to_image(slide, idx):
-            W, H = 1200, 900
-            bg = Image.new("RGB", (W, H), color=(255, 255, 255))
-            draw = ImageDraw.Draw(bg)
-            # draw title if present
-            title_text = ""
-            body_text = ""
-            try:
-                if slide.shapes.title:
-                    title_text = slide.shapes.title.text if slide.shapes.title.text else ""
-            except Exception:
-                title_text = ""
-            # aggregate first few textboxes
-            try:
-                texts = []
-                for shp in slide.shapes:
-                    if shp.shape_type == MSO_SHAPE_TYPE.TEXT_BOX or shp.has_text_frame:
-                        try:
-                            t = shp.text_frame.text.strip()
-                            if t:
-                                texts.append(t)
-                        except Exception:
-                            continue
-                body_text = "\n\n".join(texts[:6])
-            except Exception:
-                body_text = ""
-            # fonts (use default if PIL font missing)
-            try:
-                f_title = ImageFont.truetype("arial.ttf", 28)
-                f_body = ImageFont.truetype("arial.ttf", 14)
-            except Exception:
-                f_title = ImageFont.load_default()
-                f_body = ImageFont.load_default()
-            # draw title
-            if title_text:
-                draw.text((36, 24), title_text[:200], font=f_title, fill=(0, 0, 0))
-            # draw body
-            y = 80
-            for line in (body_text or "").splitlines():
-                if y > H - 60:
-                    break
-                draw.text((36, y), line[:200], font=f_body, fill=(0, 0, 0))
-                y += 18
-            # if slide has images/plots referenced in ss.msg_plot_map, try to paste one
-            try:
-                # search for an image path that references this slide index (best-effort)
-                for p in ss.msg_plot_map.values():
-                    if p and os.path.exists(p):
-                        thumb = Image.open(p)
-                        thumb.thumbnail((int(W*0.6), int(H*0.45)))
-                        bg.paste(thumb, (36, max(140, (H - thumb.size[1])//2)))
-                        break
-            except Exception:
-                pass
-            out = tempfile.NamedTemporaryFile(delete=False, suffix=f"_fallback_slide{idx+1}.png").name
-            bg.save(out, "PNG")
-            return out
+    key = (kind, ss.df_fingerprint)
+    for k in [k for k in ss.progressive_jobs if k[1] != ss.df_fingerprint]:
+        ss.progressive_jobs.pop(k).cancel()
+    job = ss.progressive_jobs.get(key)
+    if job is None:
+        fn, stratify = setup()
+        job = ss.progressive_jobs[key] = progressive.ProgressiveJob(fn, ss.df, stratify=stratify)
+    return job
+
+def _show_progressive(job, render):
+    snap = job.wait_first(timeout=PROGRESSIVE_FIRST_WAIT_S)
+    if job.error:
+        st.error("Analysis failed: " + job.error)
+        return
+    if snap is None:
+        st.info("Computing first estimate...")
+        return
+    if snap["exact"]:
+        st.caption(f"Exact result on all {snap['n_total']:,} rows.")
+    else:
+        st.caption(f"≈ Estimate from a {snap['n']:,}-row random sample ({100 * snap['n'] / snap['n_total']:.1f}% "
+                   f"of {snap['n_total']:,} rows) with 95% intervals; refining...")
+    render(snap["result"])
+
+def _progressive_panel(kind, setup, render):
+    """Show the newest stage of a progressive analysis; the panel refreshes itself until exact."""
+    job = _progressive_job(kind, setup)
+    if job.done:
+        _show_progressive(job, render)
+        if job.error:
+            ss.progressive_show.discard((kind, ss.df_fingerprint))   # shown once; the button asks again
+    elif _fragment is not None:
+        @_fragment(run_every=PROGRESSIVE_POLL_S)
+        def _panel():
+            _show_progressive(job, render)
+            if job.done:
+                st.rerun()  # one full rerun renders the final result without polling
+        _panel()
+    else:
+        # no fragments (old Streamlit): refine in place, blocking the rest of this run
+        box = st.empty()
+        while True:
+            with box.container():
+                _show_progressive(job, render)
+            if job.done:
+                break
+            time.sleep(PROGRESSIVE_POLL_S)
+        if job.error:
+            ss.progressive_show.discard((kind, ss.df_fingerprint))
+
+def _progressive_stats(sample, n_total):
+    return {"describe": progressive.estimate_describe(sample, n_total),
+            "corr": progressive.estimate_corr(sample, n_total)}
+
+def _render_progressive_stats(res):
+    st.write("Descriptive statistics:")
+    st.dataframe(res["describe"])
+    st.write("Pearson correlation matrix:")
+    st.dataframe(res["corr"]["corr"])
+    if "pvalues" in res["corr"]:
+        st.write("P-values matrix:")
+        st.dataframe(res["corr"]["pvalues"])
+    else:
+        st.write("95% interval half-width:")
+        st.dataframe((res["corr"]["ci_high"] - res["corr"]["ci_low"]) / 2)
 
-        # Create images for each slide
-        for i, slide in enumerate(ss.ppt.slides):
+def _render_progressive_regression(res):
+    if "error" in res:
+        st.error(res["error"])
+        return
+    st.write(f"Regression results (dependent: {res['dependent']}, R² = {res['rsquared']:.4f}):"
+             if res["rsquared"] is not None else f"Regression results (dependent: {res['dependent']}):")
+    st.dataframe(res["params"])
+    if "summary" in res:
+        st.text(res["summary"])
+
+def _render_progressive_hypothesis(res):
+    st.write("Hypothesis test results:")
+    st.json(res)
+
+# -------------------- SQL over datasets --------------------
+def _render_sql_panel():
+    if not sql_engine.DUCKDB_AVAILABLE:
+        return
+    with st.expander("🦆 SQL over datasets", expanded=False):
+        try:
+            eng = _sql()
+        except Exception as e:
+            st.caption("SQL engine unavailable: " + str(e)[:200])
+            return
+        tables = eng.tables()
+        if not tables:
+            st.caption("Upload a dataset to query it with SQL.")
+            return
+        st.caption("Tables: " + ", ".join(f"`{t}`" for t in tables) + " — `df` is the current dataset.")
+        query = st.text_area("SQL", value=ss.get("sql_query", "SELECT * FROM df LIMIT 100"), height=110, key="sql_query_input")
+        q1, q2, q3 = st.columns([1, 1, 2])
+        with q1:
+            run = st.button("Run query", key="sql_run")
+        with q2:
+            summarize_table = st.selectbox("Summarize", tables, key="sql_summarize_table", label_visibility="collapsed")
+        with q3:
+            summarize = st.button("Summarize table", key="sql_summarize")
+        if run or summarize:
+            ss.sql_query = query
             try:
-                imgpath = _render_slide_to_image(slide, i)
-                imgs.append(imgpath)
-            except Exception:
-                continue
+                ss.sql_result = eng.summarize(summarize_table) if summarize else eng.query(query)
+            except Exception as e:
+                ss.sql_result = None
+                st.error("Query failed: " + str(e))
+        res = ss.get("sql_result")
+        if res is not None:
+            truncated = res.attrs.get("truncated_at")
+            st.caption(f"{len(res):,}{'+' if truncated else ''} rows × {res.shape[1]} columns")
+            if truncated:
+                st.warning(f"The query returns more than {truncated:,} rows; only the first {truncated:,} were fetched. "
+                           "Filter or aggregate in SQL to analyse the complete result.")
+            st.dataframe(res.head(1000), use_container_width=True)
+            # analyses on a silently cut result would look complete: refuse it
+            if st.button("📊 Analyse this result", key="sql_use_result", disabled=bool(truncated),
+                         help="Unavailable for a truncated result." if truncated else None):
+                # the analyses, chart and chat now run on the (already filtered/aggregated) result
+                ss.df, ss.df_memory_report = optimize_dtypes(res)
+                ss.df_fingerprint = dataframe_fingerprint(ss.df)
+                ss.df_name = "SQL result"
+                ss.df_source = None
+                ss.chat_context.pins.clear()
+                try:
+                    history_store().add(ss.df, ss.df_name, content_hash=ss.df_fingerprint)
+                    ss.df_source = {"hash": ss.df_fingerprint, "columns": None}
+                except Exception:
+                    pass
+                ss.sql_result = None
+                st.rerun()
 
-        # if nothing created, create one blank placeholder
-        if not imgs:
-            W, H = 1200, 900
-            img = Image.new("RGB", (W, H), color=(240, 240, 240))
-            draw = ImageDraw.Draw(img)
-            try:
-                f = ImageFont.truetype("arial.ttf", 20)
-            except Exception:
-                f = ImageFont.load_default()
-            draw.text((40, 40), "No slides available", font=f, fill=(80, 80, 80))
-            out = tempfile.NamedTemporaryFile(delete=False, suffix="_placeholder.png").name
-            img.save(out, "PNG")
-            imgs.append(out)
+# -------------------- SPC --------------------
+def _fmt(v):
+    return "n/a" if v is None or (isinstance(v, float) and v != v) else f"{v:.4g}"
+
+def _spc_slide_text(col, row):
+    lines = [f"Center {_fmt(row['center'])} · UCL {_fmt(row['ucl'])} · LCL {_fmt(row['lcl'])}",
+             f"Western Electric violations: rule 1: {int(row['we1_points'])}, rule 2: {int(row['we2_points'])}, "
+             f"rule 3: {int(row['we3_points'])}, rule 4: {int(row['we4_points'])}",
+             f"EWMA out-of-control points: {int(row['ewma_points'])}"]
+    if row["cusum_first_signal"] >= 0:
+        lines.append(f"CUSUM signals a shift at point {int(row['cusum_first_signal']) + 1}")
+    if row["cpk"] == row["cpk"]:
+        lines.append(f"Cp {_fmt(row['cp'])} · Cpk {_fmt(row['cpk'])} · Ppk {_fmt(row['ppk'])}")
+    return "\n".join(lines)
+
+def _spc_chart(col, row, subgroup_size):
+    """Control chart PNG, drawn once per (dataset, column, subgroup size, limits)."""
+    os.makedirs(PLOT_DIR, exist_ok=True)
+    tag = uuid.uuid5(uuid.NAMESPACE_OID, repr((ss.df_fingerprint, str(col), subgroup_size, float(row["ucl"])))).hex[:16]
+    path = os.path.join(PLOT_DIR, f"spc_{tag}.png")
+    if not os.path.exists(path):
+        spc.control_chart_png(ss.df, col, row, path, subgroup_size=subgroup_size)
+    return path
 
-        return imgs
+# (rest of helper functions for PPT preview remain unchanged; omitted for brevity in this message but retained in file)
 
-    except Exception as e:
-        # Last-resort fallback single image explaining error
-        try:
-            W, H = 1200, 900
-            img = Image.new("RGB", (W, H), color=(255, 255, 255))
-            draw = ImageDraw.Draw(img)
+# -------------------- session persistence (restore on reconnect/restart) --------------------
+SESSION_PERSIST = os.getenv("SESSION_PERSIST", "1") not in ("0", "false", "False")
+PERSISTED_SETTINGS = ["layout_style", "font_size_pt", "img_width_in", "img_height_in", "reuse_layout",
+                      "chart_max_points", "chart_width_px", "chart_line_method"]
+
+@st.cache_resource
+def session_store():
+    return SessionStore()
+
+def _deck_bytes():
+    # built by the background export (see _schedule_exports); None until it's done
+    return export_cache().get(_pptx_key())
+
+def _restore_session(log):
+    """Rebuild session state from the log's materialized state; artifacts stay on disk as paths."""
+    s = log.state
+    with span("session.restore", messages=len(s["messages"]), previews=len(s["previews"])):
+        ss.messages = [dict(m) for m in s["messages"]]
+        ss.msg_plot_map = {int(k): log.blob_path(v) for k, v in s["msg_plot_map"].items()}
+        ss.last_plot_path = log.blob_path(s["last_plot"])
+        ss.slide_editor_title = s["editor"]["title"]
+        ss.slide_editor_text = s["editor"]["text"]
+        ss.slide_editor_selected_plot = log.blob_path(s["editor"]["selected_plot"])
+        if s["deck"]:
+            with ss.deck_lock:
+                ss.ppt = Presentation(log.blob_path(s["deck"]["ref"]))
+                ss.deck_version = ss.deck_lock.version = s["deck"]["version"]
+        ss.preview_images = [log.blob_path(r) for r in s["previews"]]
+        # stored previews match the stored deck; only regenerate if we have none
+        ss.preview_dirty = not ss.preview_images
+        ss.preview_version = ss.deck_version
+        for k, v in s["settings"].items():
+            if k in PERSISTED_SETTINGS:
+                ss[k] = v
+        ds = s["dataset"]
+        if ds and ds["hash"]:
             try:
-                f = ImageFont.truetype("arial.ttf", 18)
-            except Exception:
-                f = ImageFont.load_default()
-            draw.text((36, 40), "Preview generation failed: " + str(e)[:200], font=f, fill=(255, 0, 0))
-            out = tempfile.NamedTemporaryFile(delete=False, suffix="_error.png").name
-            img.save(out, "PNG")
-            return [out]
-        except Exception:
-            return []
+                ss.df = history_store().load(ds["hash"], columns=ds.get("columns"), writable=True)
+                ss.df_fingerprint = ds["hash"] if not ds.get("columns") else dataframe_fingerprint(ss.df)
+                ss.df_name = ds["name"]
+                ss.df_source = {"hash": ds["hash"], "columns": ds.get("columns")}
+            except Exception as e:
+                st.warning(f"Could not reopen dataset {ds['name']!r} from history: " + str(e)[:200])
+        elif ds:
+            st.info(f"Dataset {ds['name']!r} from the previous session is not in the history (changed by code, "
+                    "or it could not be stored); reopen or re-upload it and re-run the code.")
+
+def _dataset_record():
+    """What the log can reopen: the history entry ss.df came from, or a hash-less marker for anything else."""
+    if ss.df is None:
+        return None
+    src = ss.df_source or {"hash": None, "columns": None}
+    return {"hash": src["hash"], "name": ss.df_name, "columns": src["columns"]}
 
+def _fork_session():
+    """Another browser session writes this id: keep what was restored and continue under a new id."""
+    ss.session_id = uuid.uuid4().hex
+    try:
+        st.query_params["sid"] = ss.session_id
+    except Exception:
+        pass
+    session_store().claim(ss.session_id, ss.memory_key)
+    st.info("This session is open in another tab; continuing here as a copy.")
+
+def _sync_session():
+    log = session_store().open(ss.session_id)
+    with span("session.sync"):
+        log.sync(
+            messages=ss.messages,
+            msg_plot_map=ss.msg_plot_map,
+            last_plot=ss.last_plot_path,
+            editor={"title": ss.slide_editor_title, "text": ss.slide_editor_text, "selected_plot": ss.slide_editor_selected_plot},
+            deck_version=ss.deck_version,
+            deck_bytes=_deck_bytes,
+            previews=ss.preview_images,
+            dataset=_dataset_record(),
+            settings={k: ss[k] for k in PERSISTED_SETTINGS},
+        )
 
-# (rest of helper functions for PPT preview remain unchanged; omitted for brevity in this message but retained in file)
+if SESSION_PERSIST:
+    try:
+        if not ss.session_restored:
+            ss.session_restored = True
+            if session_store().exists(ss.session_id):
+                _restore_session(session_store().open(ss.session_id))
+        # one writer per log: a second tab on the same ?sid= forks instead of interleaving history
+        if not session_store().claim(ss.session_id, ss.memory_key):
+            _fork_session()
+        # catch up on anything a previous rerun changed before st.rerun()/st.stop() cut it short
+        _sync_session()
+    except Exception as e:
+        st.caption("Session persistence unavailable: " + str(e)[:200])
 
 # -------------------- UI and integration (left/right layout) --------------------
 EMU_PER_INCH = 914400
@@ -715,18 +709,82 @@ with left:
     uploaded_file = st.file_uploader("Upload CSV or Excel file", type=["csv","xls","xlsx"], key="uploader_csv")
     if uploaded_file:
         try:
-            st.session_state.df = read_table_auto(uploaded_file, uploaded_file.name)
+            # ingest (parse + dtype optimization) once per upload, not on every rerun
+            file_key = (uploaded_file.name, uploaded_file.size, getattr(uploaded_file, "file_id", None))
+            sheet_choice = None
+            if uploaded_file.name.lower().endswith((".xls", ".xlsx")):
+                if ss.excel_sheets[0] != file_key:
+                    with span("ingest.list_sheets"):
+                        ss.excel_sheets = (file_key, list_excel_sheets(uploaded_file))
+                sheet_names = ss.excel_sheets[1]
+                if len(sheet_names) > 1:
+                    sheet_choice = st.selectbox("Sheet", sheet_names + [ALL_SHEETS], key="excel_sheet_select")
+            upload_key = file_key + (sheet_choice,)
+            if ss.df_upload_key != upload_key or ss.df is None:
+                if sheet_choice == ALL_SHEETS:
+                    # parse every sheet in parallel (each cached as Arrow) and stack them
+                    raw = stack_sheets(read_excel_sheets(uploaded_file))
+                else:
+                    raw = read_table_auto(uploaded_file, uploaded_file.name, sheet_name=sheet_choice)
+                st.session_state.df, ss.df_memory_report = optimize_dtypes(raw)
+                del raw
+                with span("ingest.fingerprint"):
+                    ss.df_fingerprint = dataframe_fingerprint(st.session_state.df)
+                ss.df_upload_key = upload_key
+                ss.chat_context.pins.clear()   # pinned results describe the previous dataset
+                ss.df_name = uploaded_file.name if sheet_choice is None else f"{uploaded_file.name} [{sheet_choice}]"
+                ss.df_source = None
+                # Save dataset to history (deduplicated by content hash)
+                try:
+                    entry = history_store().add(st.session_state.df, ss.df_name, content_hash=ss.df_fingerprint)
+                    ss.df_source = {"hash": entry["hash"], "columns": None}
+                    st.info(f"Saved uploaded dataset to history: {entry['name']} ({entry['rows']:,} rows)")
+                except Exception as e:
+                    st.warning("Could not save the dataset to history: " + str(e)[:200])
+        except Exception as e:
+            st.error("Error reading file: " + str(e))
+
+    _render_history_browser()
+    _render_sql_panel()
+
+    if st.session_state.df is not None:
+        try:
+            st.caption(f"Dataset: {ss.df_name or 'unnamed'}")
             st.subheader("Preview (first 5 rows)")
             st.dataframe(st.session_state.df.head(5))
-
-            # quick line chart if numeric columns
+            if ss.df_memory_report:
+                mem = pd.DataFrame(ss.df_memory_report)
+                before_mb, after_mb = mem["bytes_before"].sum() / 1e6, mem["bytes_after"].sum() / 1e6
+                with st.expander(f"🧠 Memory: {before_mb:.2f} MB → {after_mb:.2f} MB after dtype optimization", expanded=False):
+                    mem["saved_%"] = (100 * (1 - mem["bytes_after"] / mem["bytes_before"].clip(lower=1))).round(1)
+                    st.dataframe(mem, use_container_width=True, hide_index=True)
+
+            # quick line chart if numeric columns (downsampled above ss.chart_max_points)
             numeric_cols = st.session_state.df.select_dtypes(include="number").columns.tolist()
             if len(numeric_cols) >= 2:
                 x_axis = st.selectbox("X-axis", numeric_cols, key="xaxis_select")
                 y_axis = st.multiselect("Y-Axis", numeric_cols, default=numeric_cols[1:2], key="yaxis_select")
+                chart_kind = st.radio("Chart type", ["Line", "Scatter"], horizontal=True, key="quick_chart_kind")
+                with st.expander("Chart reduction settings", expanded=False):
+                    ss.chart_max_points = st.number_input("Max points per chart", min_value=500, max_value=200_000, value=ss.chart_max_points, step=500, key="chart_max_points_input")
+                    ss.chart_width_px = st.number_input("Chart width (px)", min_value=300, max_value=4000, value=ss.chart_width_px, step=100, key="chart_width_input")
+                    ss.chart_line_method = st.radio("Line downsampling", ["lttb", "minmax"], index=["lttb", "minmax"].index(ss.chart_line_method), horizontal=True, key="chart_method_input")
                 if x_axis and y_axis:
-                    fig = px.line(st.session_state.df, x=x_axis, y=y_axis, title="Line Chart")
-                    st.plotly_chart(fig, use_container_width=True)
+                    with span("chart.quick_chart", kind=chart_kind, rows=len(st.session_state.df)) as sp:
+                        plot_df, hit = _quick_chart_data(ss.df_fingerprint, chart_kind, x_axis, tuple(y_axis), int(ss.chart_width_px),
+                                                         int(ss.chart_max_points), ss.chart_line_method, st.session_state.df)
+                        sp.set(points=len(plot_df), cache_hit=hit)
+                        reduced = len(plot_df) < len(st.session_state.df)
+                        if chart_kind == "Scatter" and "count" in plot_df.columns:
+                            fig = px.scatter(plot_df, x=x_axis, y="value", color="series", size="count", title="Scatter (binned)")
+                        elif chart_kind == "Scatter":
+                            fig = px.scatter(plot_df, x=x_axis, y=y_axis, title="Scatter")
+                        else:
+                            fig = px.line(plot_df, x=x_axis, y=y_axis, title="Line Chart")
+                        st.plotly_chart(fig, use_container_width=True)
+                    if reduced:
+                        st.caption(f"Showing {len(plot_df):,} of {len(st.session_state.df):,} rows "
+                                   f"({'binned' if chart_kind == 'Scatter' else ss.chart_line_method} reduction).")
 
             # Initial AI analysis (existing Gemini call)
             if st.button("🔍 Run Initial AI Analysis (Gemini)", key="run_initial_ai"):
@@ -744,11 +802,13 @@ with left:
                        - Select the most likely dependent variable automatically (or infer).
                        - Show coefficients, R², p-values, and model summary.
                     4. 🧪 Perform appropriate hypothesis testing (e.g., ANOVA or t-test) where applicable.
-                Data:
-                {st.session_state.df.to_csv(index=False)}
+                Data (schema, summary and leading rows; the full table may not fit the prompt):
+                {dataset_context(st.session_state.df, ss.chat_context.budget_tokens // 2)}
                 """
                 try:
-                    response = model.generate_content(prompt)
+                    with span("llm.generate", handler="initial_analysis", prompt_chars=len(prompt)) as sp:
+                        response = model.generate(prompt)
+                        sp.set(response_chars=len(response.text))
                     ss.messages.append({"role": "assistant", "content": response.text})
                     st.success("Gemini analysis complete; results appended to conversation.")
                 except Exception as e:
@@ -756,42 +816,125 @@ with left:
 
             # NEW: Built-in deterministic analysis (safe, reproducible)
             st.markdown("### ⚙️ Built-in deterministic analysis")
+            use_progressive = False
+            if len(ss.df) >= progressive.PROGRESSIVE_MIN_ROWS:
+                use_progressive = st.toggle("Progressive results (sample first, refine to exact)", value=True,
+                                            key="progressive_on")
             colA, colB, colC = st.columns(3)
             with colA:
                 if st.button("Run built-in stats & correlation"):
                     df = st.session_state.df
-                    try:
-                        desc = perform_descriptive_stats(df)
-                        st.write("Descriptive statistics:")
-                        st.json(desc.get('describe', {}))
-                        if stats:
-                            corr, pvals = pearson_corr_with_pvalues(df)
-                            st.write("Pearson correlation matrix:")
-                            st.dataframe(corr)
-                            st.write("P-values matrix:")
-                            st.dataframe(pvals)
-                        else:
-                            st.warning("scipy not available; install scipy to compute p-values.")
-                    except Exception as e:
-                        st.error("Error running built-in stats: " + str(e))
+                    if use_progressive:
+                        ss.progressive_show.add(("stats", ss.df_fingerprint))
+                    else:
+                        try:
+                            with span("analysis.describe", rows=len(df)):
+                                desc = perform_descriptive_stats(df)
+                            st.write("Descriptive statistics:")
+                            st.json(desc.get('describe', {}))
+                            if stats:
+                                with span("analysis.corr", rows=len(df)):
+                                    corr, pvals = pearson_corr_with_pvalues(df)
+                                st.write("Pearson correlation matrix:")
+                                st.dataframe(corr)
+                                st.write("P-values matrix:")
+                                st.dataframe(pvals)
+                            else:
+                                st.warning("scipy not available; install scipy to compute p-values.")
+                        except Exception as e:
+                            st.error("Error running built-in stats: " + str(e))
+                if use_progressive and ("stats", ss.df_fingerprint) in ss.progressive_show:
+                    _progressive_panel("stats", lambda: (_progressive_stats, None), _render_progressive_stats)
             with colB:
                 if st.button("Run regression (linear)"):
                     df = st.session_state.df
-                    res = run_regression(df)
-                    if 'error' in res:
-                        st.error(res['error'])
+                    if use_progressive:
+                        ss.progressive_show.add(("regression", ss.df_fingerprint))
                     else:
-                        st.write("Regression results:")
-                        if 'summary' in res:
-                            st.text(res['summary'])
+                        with span("analysis.regression", rows=len(df)):
+                            res = run_regression(df)
+                        if 'error' in res:
+                            st.error(res['error'])
                         else:
-                            st.json({k:v for k,v in res.items() if k!='summary'})
+                            st.write("Regression results:")
+                            if 'summary' in res:
+                                st.text(res['summary'])
+                            else:
+                                st.json({k:v for k,v in res.items() if k!='summary'})
+                            ss.chat_context.pin("regression", json.dumps(
+                                {"rsquared": res.get("rsquared"), "params": res.get("params")}, default=str))
+                if use_progressive and ("regression", ss.df_fingerprint) in ss.progressive_show:
+                    # dependent chosen once on the full frame, so every stage estimates the same model
+                    _progressive_panel("regression", lambda: (functools.partial(
+                        progressive.estimate_regression, dep=auto_select_dependent(ss.df)), None),
+                                       _render_progressive_regression)
             with colC:
                 if st.button("Run hypothesis tests (t/ANOVA/Levene)"):
                     df = st.session_state.df
-                    res = run_hypothesis_tests(df)
-                    st.write("Hypothesis test results:")
-                    st.json(res)
+                    if use_progressive:
+                        ss.progressive_show.add(("hypothesis", ss.df_fingerprint))
+                    else:
+                        with span("analysis.hypothesis", rows=len(df)):
+                            res = run_hypothesis_tests(df)
+                        st.write("Hypothesis test results:")
+                        st.json(res)
+                        ss.chat_context.pin("hypothesis tests", json.dumps(res, default=str))
+                if use_progressive and ("hypothesis", ss.df_fingerprint) in ss.progressive_show:
+                    # stratified by the grouping column so small groups are in every sample
+                    def _hypothesis_setup():
+                        gcol = progressive.grouping_column(ss.df)
+                        return functools.partial(progressive.estimate_hypothesis, group_col=gcol), gcol
+                    _progressive_panel("hypothesis", _hypothesis_setup, _render_progressive_hypothesis)
+
+            st.markdown("---")
+            # SPC: control limits, rule violations, drift and capability for all numeric columns
+            st.subheader("📉 Statistical process control")
+            num_cols = ss.df.select_dtypes(include="number").columns.tolist()
+            sp1, sp2, sp3, sp4 = st.columns([1, 2, 1, 1])
+            with sp1:
+                subgroup = int(st.number_input("Subgroup size (1 = I-MR)", min_value=1, max_value=10, value=1, key="spc_subgroup"))
+            with sp2:
+                spec_col = st.selectbox("Spec limits for column", ["(none)"] + num_cols, key="spc_spec_col")
+            with sp3:
+                lsl_txt = st.text_input("LSL", key="spc_lsl")
+            with sp4:
+                usl_txt = st.text_input("USL", key="spc_usl")
+            if spec_col != "(none)" and st.button("Set spec limits", key="spc_set_spec"):
+                try:
+                    ss.spc_specs[spec_col] = (float(lsl_txt) if lsl_txt.strip() else None,
+                                              float(usl_txt) if usl_txt.strip() else None)
+                except ValueError:
+                    st.error("Spec limits must be numbers.")
+            if ss.spc_specs:
+                st.caption("Spec limits: " + "; ".join(f"{c}: {l} .. {u}" for c, (l, u) in ss.spc_specs.items()))
+            if st.button("Run SPC on all numeric columns", key="spc_run"):
+                res = spc.run_spc(ss.df, subgroup_size=subgroup, spec_limits=ss.spc_specs)
+                ss.spc_result = (ss.df_fingerprint, subgroup, dict(ss.spc_specs), res)
+                if "error" not in res:
+                    worst = res["summary"].sort_values("violations", ascending=False).head(10)
+                    ss.chat_context.pin("SPC (most rule violations)", worst[["center", "ucl", "lcl", "violations", "cpk"]].to_csv())
+            if ss.spc_result and ss.spc_result[0] == ss.df_fingerprint:
+                _, sg_used, _, res = ss.spc_result
+                if "error" in res:
+                    st.error(res["error"])
+                else:
+                    summary = res["summary"].sort_values("violations", ascending=False)
+                    st.dataframe(summary, use_container_width=True)
+                    spc_col = st.selectbox("Control chart for", summary.index.tolist(), key="spc_chart_col")
+                    row = summary.loc[spc_col]
+                    chart_path = _spc_chart(spc_col, row, sg_used)
+                    st.image(chart_path, use_container_width=True)
+                    sc1, sc2 = st.columns([1, 1])
+                    with sc1:
+                        if st.button("➕ Add this chart to slides", key="spc_add_one"):
+                            add_slide_with_text_and_optional_image(f"SPC — {spc_col}", _spc_slide_text(spc_col, row), chart_path)
+                            st.success("Slide added to PPT.")
+                    with sc2:
+                        if st.button("➕ Add top 5 out-of-control columns", key="spc_add_top"):
+                            top = summary[summary["violations"] > 0].head(5)
+                            for col, r in top.iterrows():
+                                add_slide_with_text_and_optional_image(f"SPC — {col}", _spc_slide_text(col, r), _spc_chart(col, r, sg_used))
+                            st.success(f"Added {len(top)} slides.")
 
             st.markdown("---")
             # DOE suggestion
@@ -800,50 +943,28 @@ with left:
                 try:
                     df = st.session_state.df
                     target = auto_select_dependent(df)
-                    sug = suggest_next_experiments(df, target_col=target)
+                    with span("analysis.doe", rows=len(df)):
+                        sug = suggest_next_experiments(df, target_col=target)
                     st.write("Suggestions (heuristic):")
                     st.json(sug)
+                    ss.chat_context.pin("DOE suggestions", json.dumps(sug, default=str))
                 except Exception as e:
                     st.error("DOE suggestion failed: " + str(e))
 
-            st.markdown("---")
-            # Save dataset to history
-            hist_dir = os.path.join(os.getcwd(), "datasets")
-            os.makedirs(hist_dir, exist_ok=True)
-            fname = f"{time.strftime('%Y%m%d_%H%M%S')}_{uploaded_file.name}"
-            path = os.path.join(hist_dir, fname)
-            try:
-                st.session_state.df.to_csv(path, index=False)
-                st.info(f"Saved uploaded dataset to history: {path}")
-            except Exception:
-                pass
-
             st.markdown("---")
             # PDF export using built-in analysis + optional plots
             if st.button("📄 Export PDF report (built-in analysis + last plot)"):
                 try:
-                    text_blocks = []
-                    text_blocks.append("AI CSV Interpreter — Report")
-                    text_blocks.append(f"File: {uploaded_file.name}")
-                    # include built-in stats textual summary
-                    try:
-                        desc = perform_descriptive_stats(st.session_state.df)
-                        text_blocks.append("Descriptive statistics (summary):")
-                        text_blocks.append(str(desc.get('describe', {})))
-                    except Exception:
-                        pass
-                    # include last plot path
-                    images = []
-                    if ss.last_plot_path and os.path.exists(ss.last_plot_path):
-                        images.append(ss.last_plot_path)
-                    pdf_path = generate_pdf_report(text_blocks, images)
-                    with open(pdf_path, "rb") as f:
-                        st.download_button("Download PDF report", f, file_name="ai_report.pdf", mime="application/pdf")
+                    # cached per (dataset, last plot): repeat exports are served from memory
+                    key = _pdf_key()
+                    with span("export.pdf", cache_hit=export_cache().ready(key)):
+                        pdf = export_cache().get_or_build(key, _build_pdf(ss.df, ss.df_name, key[2][2]))
+                    st.download_button("Download PDF report", pdf, file_name="ai_report.pdf", mime="application/pdf")
                 except Exception as e:
                     st.error("PDF export failed: " + str(e))
 
         except Exception as e:
-            st.error("Error reading file: " + str(e))
+            st.error("Error analysing dataset: " + str(e))
 
     st.markdown("---")
     # Chat / follow-ups (existing code preserved)
@@ -856,21 +977,16 @@ with left:
 
     if follow:
         ss.messages.append({"role": "user", "content": follow})
-        # Build compact history; include small sample of dataset optionally
-        history = "\n".join([f"{m['role'].capitalize()}: {m['content']}" for m in ss.messages])
-        if ss.df is not None:
-            try:
-                history += "\n\nDataset (first 200 rows):\n" + ss.df.head(200).to_csv(index=False)
-            except Exception:
-                pass
-        # Instruction for code-only answers when user asks for scripts
-        history += """
-IMPORTANT: If the user requests a Python script, respond ONLY with the Python code inside triple backticks tagged with Python. No extra explanation.
-"""
+        # Bounded history: summary of older turns + recent turns + pinned results + compact dataset view
+        history = ss.chat_context.build(
+            ss.messages, dataset=ss.df, count_tokens=model.count_tokens,
+            # Instruction for code-only answers when user asks for scripts
+            footer="IMPORTANT: If the user requests a Python script, respond ONLY with the Python code inside triple backticks tagged with Python. No extra explanation.")
         try:
-            resp = model.generate_content(history)
+            with span("llm.generate", handler="follow_up", prompt_chars=len(history), **ss.chat_context.last_stats) as sp:
+                resp = model.generate(history)
+                sp.set(response_chars=len(resp.text))
             ss.messages.append({"role": "assistant", "content": resp.text})
-            ss.preview_dirty = True
             st.rerun()
         except Exception as e:
             st.error("AI call failed: " + str(e))
@@ -879,7 +995,15 @@ IMPORTANT: If the user requests a Python script, respond ONLY with the Python co
     st.subheader("AI conversation & actions")
 
     # (display messages and run code blocks — existing code preserved from your script)
+    n_archived = sum(1 for m in ss.messages if session_memory.is_archived(m))
+    show_archived = bool(n_archived) and st.toggle(f"Show {n_archived} archived messages", key="show_archived_messages")
     for idx, msg in enumerate(ss.messages):
+        if session_memory.is_archived(msg):
+            # older turns live on disk; read for display only, never kept in session state
+            if show_archived:
+                who = "You" if msg["role"] == "user" else f"AI #{idx+1}"
+                st.markdown(f"**{who}:** {session_memory.load_message(msg)}")
+            continue
         if msg["role"] == "user":
             st.markdown(f"**You:** {msg['content']}")
         else:
@@ -908,8 +1032,15 @@ IMPORTANT: If the user requests a Python script, respond ONLY with the Python co
                     continue
                 with st.expander(f"AI Python snippet #{idx+1}-{i+1}", expanded=False):
                     st.code(code_snippet, language="python")
-                    if st.button(f"Run snippet #{idx+1}-{i+1}", key=f"run_{idx}_{i}"):
-                        out, err = run_generated_code(code_snippet, st.session_state.df, msg_idx=idx)
+                    rc1, rc2 = st.columns([1, 1])
+                    with rc1:
+                        run_clicked = st.button(f"Run snippet #{idx+1}-{i+1}", key=f"run_{idx}_{i}")
+                    with rc2:
+                        force_clicked = st.button("Re-run (ignore cache)", key=f"rerun_{idx}_{i}")
+                    if run_clicked or force_clicked:
+                        out, err, cached = run_generated_code(code_snippet, st.session_state.df, msg_idx=idx, force=force_clicked)
+                        if cached:
+                            st.caption("⚡ Cached result (same code, same dataset).")
                         if out:
                             st.subheader("Execution output")
                             st.text(out)
@@ -993,7 +1124,6 @@ IMPORTANT: If the user requests a Python script, respond ONLY with the Python co
                 ss.slide_editor_text = ""
                 ss.slide_editor_selected_plot = None
                 ss.slide_editor_title = "Slide Title"
-                ss.preview_dirty = True
                 st.rerun()
             except Exception as e:
                 st.error("Failed to add slide: " + str(e))
@@ -1003,15 +1133,57 @@ IMPORTANT: If the user requests a Python script, respond ONLY with the Python co
             ss.slide_editor_selected_plot = None
             st.success("Slide Editor cleared.")
 
+    st.markdown("---")
+    # Auto-deck: one model call for the outline, charts rendered in parallel, all slides added in one pass
+    st.subheader("🪄 Auto-deck")
+    if ss.df is None:
+        st.info("Upload a dataset to generate a deck automatically.")
+    else:
+        ad1, ad2 = st.columns([1, 3])
+        with ad1:
+            n_slides = st.number_input("Slides", min_value=2, max_value=autodeck.MAX_SLIDES, value=8, step=1, key="autodeck_n")
+        with ad2:
+            focus = st.text_input("Focus (optional)", key="autodeck_focus")
+        if st.button("Generate deck", key="autodeck_go"):
+            try:
+                prompt = autodeck.outline_prompt(dataset_context(ss.df, ss.chat_context.budget_tokens // 2),
+                                                 n_slides=int(n_slides), focus=focus)
+                with st.spinner("Outlining deck..."):
+                    with span("llm.generate", handler="auto_deck", prompt_chars=len(prompt)) as sp:
+                        response = model.generate(prompt, json_mode=True)
+                        sp.set(response_chars=len(response.text))
+                outline = autodeck.parse_outline(response.text)
+                if "error" in outline:
+                    st.error(outline["error"])
+                else:
+                    outline = outline["slides"]
+                    with st.spinner(f"Rendering {sum(1 for s_ in outline if s_['code'])} charts..."):
+                        extra_ns, catalog = _snippet_sql()
+                        results = autodeck.render_charts(outline, ss.df, ss.df_fingerprint, execution_cache(),
+                                                         extra_ns=extra_ns, sql_fingerprint=catalog)
+                    with span("autodeck.build", slides=len(outline)):
+                        for title, text, image in autodeck.slide_specs(outline, results):
+                            add_slide_with_text_and_optional_image(title, text, image_path=image)
+                    plots = [r.plot_path for r in results if r is not None and r.plot_path]
+                    if plots:
+                        ss.last_plot_path = plots[-1]
+                    failed = [o["title"] for o, r in zip(outline, results) if r is not None and r.error]
+                    st.success(f"Added {len(outline)} slides ({len(plots)} with charts).")
+                    if failed:
+                        st.warning("Chart code failed for: " + ", ".join(failed))
+            except Exception as e:
+                st.error("Auto-deck failed: " + str(e))
+
     st.markdown("---")
     # Save & Download PPT (preserved)
     if st.button("💾 Save & Download PPTX", key="save_download"):
         try:
-            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pptx")
-            ss.ppt.save(tmp.name)
-            tmp.close()
-            with open(tmp.name, "rb") as f:
-                st.download_button("📥 Download PowerPoint", f, file_name="AI_Report_v3.pptx", mime="application/vnd.openxmlformats-officedocument.presentationml.presentation")
+            key = _pptx_key()
+            with span("export.pptx", slides=len(ss.ppt.slides), cache_hit=export_cache().ready(key)) as sp:
+                # usually already built in the background after the last deck change
+                data = export_cache().get_or_build(key, _build_pptx())
+                sp.set(pptx_bytes=len(data))
+            st.download_button("📥 Download PowerPoint", data, file_name="AI_Report_v3.pptx", mime="application/vnd.openxmlformats-officedocument.presentationml.presentation")
         except Exception as e:
             st.error("Failed saving PPTX: " + str(e))
 
@@ -1022,56 +1194,51 @@ IMPORTANT: If the user requests a Python script, respond ONLY with the Python co
             ss.messages.append({"role": "user", "content": user_input})
             system_instructions = """
             You are an expert process engineer.
-            - Always use the user's uploaded dataset (df) provided below.
+            - Always use the user's uploaded dataset (df) described below; code you write runs against the full df.
             - Never create or rely on synthetic/sample datasets.
             - If asked for Python code, reply ONLY with code inside ```python blocks.
             - If asked for conclusions for PPT, provide 1–2 crisp, data-backed sentences and/or a chart.
             """
-            if ss.df is not None:
-                dataset_context = ss.df.to_csv(index=False)
-            else:
-                dataset_context = "No dataset available."
-            history_text = "\n".join([f"{m['role'].capitalize()}: {m['content']}" for m in ss.messages])
-            full_prompt = f"""
-            {system_instructions}
-
-            Conversation so far:
-            {history_text}
-
-            Dataset (CSV):
-            {dataset_context}
-            """
             try:
-                response = model.generate_content(full_prompt)
+                eng = _sql()
+            except Exception:
+                eng = None
+            if eng is not None:
+                others = [t for t in eng.tables() if t != "df"]
+                system_instructions += ("- For filters, joins or aggregations, prefer sql(\"SELECT ... FROM df\") (DuckDB, returns a DataFrame)."
+                                        + (" Earlier uploads are tables too: " + ", ".join(others) + "." if others else "") + "\n")
+            full_prompt = ss.chat_context.build(ss.messages, instructions=system_instructions, dataset=ss.df,
+                                                count_tokens=model.count_tokens)
+            try:
+                with span("llm.generate", handler="dataset_chat", prompt_chars=len(full_prompt), **ss.chat_context.last_stats) as sp:
+                    response = model.generate(full_prompt)
+                    sp.set(response_chars=len(response.text))
                 ss.messages.append({"role": "assistant", "content": response.text})
                 st.rerun()
             except Exception as e:
                 st.error("AI call failed: " + str(e))
 
-# RIGHT column: Live Preview (preserved)
-with right:
-    st.subheader("🖼 Live Slide Preview")
-    c1, c2 = st.columns([1,1])
-    with c1:
-        if AUTOREFRESH_AVAILABLE:
-            ss.autorefresh_on = st.toggle("Auto-refresh", value=ss.autorefresh_on, key="autorefresh_toggle")
-        else:
-            st.caption("Install streamlit-autorefresh for auto-refresh.")
-    with c2:
-        ss.refresh_interval_ms = st.number_input("Refresh interval (ms)", min_value=1000, max_value=20000, value=ss.refresh_interval_ms, step=500, key="refresh_interval")
-
-    if AUTOREFRESH_AVAILABLE and ss.autorefresh_on:
-        st_autorefresh(interval=ss.refresh_interval_ms, key="live_preview_tick")
-
+# RIGHT column: Live Preview
+def _live_preview():
+    """
+    Preview + navigation + floating viewer. As a fragment, navigation reruns only this
+    function; deck changes arrive with the full rerun that made them (deck_version bump),
+    so nothing polls and an idle session does no work.
+    """
+    # a fragment rerun skips the top of the script, where spilled objects are reloaded
+    memory_accountant().begin(ss.memory_key, _mem_state if _mem_state is not None else ss, running=False)
     if st.button("🔄 Refresh Preview", key="manual_refresh"):
         ss.preview_dirty = True
 
-    if ss.preview_dirty:
-        try:
-            ss.preview_images = generate_live_preview_images()
-        except Exception as e:
-            ss.preview_images = generate_live_preview_images()
+    # regenerate only when the deck changed (or on request); fragment reruns are otherwise free
+    if ss.preview_dirty or ss.preview_version != ss.deck_version:
+        with span("preview.generate", deck_version=ss.deck_version):
+            try:
+                ss.preview_images = generate_live_preview_images()
+            except Exception as e:
+                ss.preview_images = generate_live_preview_images()
         ss.preview_dirty = False
+        ss.preview_version = ss.deck_version
 
     num_slides = len(ss.preview_images)
     if num_slides == 0:
@@ -1104,5 +1271,73 @@ with right:
                         ss.slide_idx = i+1
                     st.image(p, use_column_width=True, caption=f"{i+1}")
 
-# Floating viewer pinned
-_render_floating_viewer(ss.preview_images, ss.slide_idx)
+    # Floating viewer pinned
+    with span("preview.floating_viewer"):
+        _render_floating_viewer(ss.preview_images, ss.slide_idx)
+
+if _fragment is not None:
+    _live_preview = _fragment(_live_preview)
+
+with right:
+    st.subheader("🖼 Live Slide Preview")
+    _live_preview()
+
+# -------------------- Snippet cache controls (sidebar) --------------------
+with st.sidebar:
+    cache = execution_cache()
+    st.caption(f"Snippet cache: {len(cache)} results · {cache.hits} hits / {cache.misses} misses")
+    if st.button("♻️ Clear snippet cache", key="clear_snippet_cache"):
+        cache.invalidate()
+        st.success("Snippet cache cleared.")
+
+# -------------------- End of rerun (exports, session sync, memory, trace) --------------------
+try:
+    _schedule_exports()
+except Exception:
+    pass
+if SESSION_PERSIST:
+    try:
+        _sync_session()
+    except Exception:
+        pass
+try:
+    memory_accountant().end(ss.memory_key, _mem_state if _mem_state is not None else ss,
+                            tokens={"df": ss.df_fingerprint, "ppt": ss.deck_version, "messages": len(ss.messages)})
+except Exception:
+    pass
+_finish_trace(ss.trace_run)
+
+# -------------------- Latency breakdown panel (sidebar) --------------------
+with st.sidebar:
+    ss.show_latency_panel = st.checkbox("⏱ Show latency breakdown", value=ss.show_latency_panel, key="latency_panel_toggle")
+    if ss.show_latency_panel:
+        if not tracing.ENABLED:
+            st.caption("Tracing disabled (TRACE_ENABLED=0).")
+        elif ss.trace_history:
+            runs = list(reversed(ss.trace_history))
+            labels = [f"{time.strftime('%H:%M:%S', time.localtime(r.started_at))} — {r.duration_ms:.0f} ms"
+                      + (" (rerun/stop)" if r.interrupted else "") for r in runs]
+            pick = st.selectbox("Rerun", range(len(runs)), format_func=lambda i: labels[i], key="latency_run_pick")
+            rows = runs[pick].breakdown()
+            if rows:
+                st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+            else:
+                st.caption("No traced stages in this rerun.")
+            st.caption(f"Spans are written to {tracing.default_exporter().path}")
+
+# -------------------- Session memory panel (sidebar) --------------------
+with st.sidebar:
+    ss.show_memory_panel = st.checkbox("🧠 Show session memory", value=ss.show_memory_panel, key="memory_panel_toggle")
+    if ss.show_memory_panel:
+        acct = memory_accountant()
+        sizes = acct.session_sizes(ss.memory_key)
+        if sizes:
+            top = sorted(sizes.items(), key=lambda kv: kv[1], reverse=True)[:10]
+            st.dataframe(pd.DataFrame([{"key": k, "MB": round(v / 1e6, 2)} for k, v in top]),
+                         use_container_width=True, hide_index=True)
+            total = sum(sizes.values())
+            st.caption(f"This session: {total / 1e6:.1f} MB of {acct.session_budget / 1e6:.0f} MB budget")
+        s = acct.stats()
+        st.caption(f"All sessions: {s['sessions']} ({s['idle_sessions']} idle, {s['evicted_sessions']} evicted) · "
+                   f"{s['in_memory_bytes'] / 1e6:.1f} MB in memory of {acct.total_budget / 1e6:.0f} MB · "
+                   f"{s['spilled_bytes'] / 1e6:.1f} MB spilled to disk")
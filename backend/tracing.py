@@ -0,0 +1,165 @@
+# Lightweight span-based tracing for per-stage latency breakdowns.
+#
+# A "run" is one Streamlit rerun of the script. Stages are wrapped in `span(...)`, which
+# records wall time plus payload attributes (prompt chars, rows, image bytes, cache hits).
+# Spans are kept in memory on the run and written as JSON lines when the run finishes,
+# so the per-span cost is a perf_counter pair and a list append. Outside an active run
+# (benchmarks, scripts) `span` is a no-op.
+#
+#   TRACE_ENABLED=0  disables tracing entirely
+#   TRACE_DIR=...    where spans.jsonl is written (default ./traces)
+
+import os, json, time, uuid, threading, contextlib, contextvars
+
+ENABLED = os.getenv("TRACE_ENABLED", "1") not in ("0", "false", "False")
+TRACE_DIR = os.getenv("TRACE_DIR", os.path.join(os.getcwd(), "traces"))
+MAX_FILE_BYTES = 50 * 1024 * 1024
+
+_current_run = contextvars.ContextVar("trace_run", default=None)
+_current_depth = contextvars.ContextVar("trace_depth", default=0)
+
+
+class Span:
+    __slots__ = ("name", "depth", "start", "duration_ms", "attrs")
+
+    def __init__(self, name, depth, attrs):
+        self.name = name
+        self.depth = depth
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """Attach payload attributes once known (e.g. response size after the call)."""
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        return {"name": self.name, "depth": self.depth, "duration_ms": self.duration_ms, "attrs": self.attrs}
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+
+class TraceRun:
+    def __init__(self, session_id=None, label=None):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.session_id = session_id
+        self.label = label
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.duration_ms = None
+        self.spans = []
+        self.finished = False
+        self.interrupted = False
+
+    def breakdown(self):
+        """Rows for display: one per span, with share of total run time."""
+        total = self.duration_ms or ((time.perf_counter() - self._t0) * 1000.0)
+        rows = []
+        for s in self.spans:
+            if s.duration_ms is None:
+                continue
+            rows.append({
+                "stage": "  " * s.depth + s.name,
+                "ms": round(s.duration_ms, 1),
+                "% of run": round(100.0 * s.duration_ms / total, 1) if total else 0.0,
+                **{k: v for k, v in s.attrs.items()},
+            })
+        return rows
+
+
+def start_run(session_id=None, label=None):
+    """Begin a run and make it current for this thread/context."""
+    run = TraceRun(session_id=session_id, label=label)
+    if ENABLED:
+        _current_run.set(run)
+        _current_depth.set(0)
+    return run
+
+def finish_run(run, interrupted=False, exporter=None):
+    """Close a run and export its spans. Safe to call twice."""
+    if run is None or run.finished:
+        return run
+    run.duration_ms = (time.perf_counter() - run._t0) * 1000.0
+    run.finished = True
+    run.interrupted = interrupted
+    if _current_run.get() is run:
+        _current_run.set(None)
+    if ENABLED:
+        (exporter or default_exporter()).export(run)
+    return run
+
+def current_run():
+    return _current_run.get()
+
+def in_current_context(fn):
+    """Bind fn to a copy of the caller's context so spans recorded in a worker thread land
+    in the current run. Bind once per task: a context can't be entered by two threads at once."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """Time a stage of the current run. Yields a Span so callers can .set(...) payload sizes."""
+    run = _current_run.get()
+    if run is None:
+        yield _NULL_SPAN
+        return
+    depth = _current_depth.get()
+    s = Span(name, depth, attrs)
+    run.spans.append(s)
+    token = _current_depth.set(depth + 1)
+    try:
+        yield s
+    except BaseException as e:
+        s.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        s.duration_ms = (time.perf_counter() - s.start) * 1000.0
+        _current_depth.reset(token)
+
+
+class JSONLExporter:
+    """Append spans of finished runs to a JSON-lines file, one line per span."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, run):
+        lines = []
+        for s in run.spans:
+            rec = s.to_dict()
+            rec.update({"run_id": run.run_id, "session_id": run.session_id, "run_label": run.label,
+                        "run_started_at": run.started_at, "run_ms": run.duration_ms, "interrupted": run.interrupted})
+            lines.append(json.dumps(rec, default=str))
+        if not lines:
+            return
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                if os.path.exists(self.path) and os.path.getsize(self.path) > MAX_FILE_BYTES:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+        except Exception:
+            # tracing must never break the app
+            pass
+
+
+_default_exporter = None
+_exporter_lock = threading.Lock()
+
+def default_exporter():
+    global _default_exporter
+    if _default_exporter is None:
+        with _exporter_lock:
+            if _default_exporter is None:
+                _default_exporter = JSONLExporter(os.path.join(TRACE_DIR, "spans.jsonl"))
+    return _default_exporter